@@ -2,7 +2,12 @@ import os
 from flask import Flask
 from flask_cors import CORS
 
+from app.compression import CompressionMiddleware
+from app.json_provider import FastJSONProvider
+
 app = Flask(__name__)
+app.json = FastJSONProvider(app)
+app.wsgi_app = CompressionMiddleware(app.wsgi_app)
 
 app.secret_key = os.environ.get("SECRET_KEY", "dev-secret-key")
 
@@ -19,23 +24,29 @@ CORS(
     ]}}
 )
 
+from app import db, metrics
 from app.routes.reports import reports_bp
 from app.routes.appointments import appointments_bp
 from app.routes.doctors import doctors_bp
 from app.routes.doctor import doctor_bp
 from app.routes.auth import auth_bp
 from app.routes.db_health import db_health_bp
+from app.routes.metrics import metrics_bp
 from app.routes.quote_requests import quote_requests_bp
 from app.routes.contact import contact_bp
 from app.routes.lab_packages import lab_packages_bp
 from app.routes.uploads import uploads_bp
 from availability import availability_bp
 
+metrics.init_app(app)
+db.init_app(app)
+
 app.register_blueprint(appointments_bp)
 app.register_blueprint(doctors_bp)
 app.register_blueprint(doctor_bp)
 app.register_blueprint(auth_bp)
 app.register_blueprint(db_health_bp)
+app.register_blueprint(metrics_bp)
 app.register_blueprint(reports_bp)
 app.register_blueprint(availability_bp)
 app.register_blueprint(quote_requests_bp)
@@ -0,0 +1,448 @@
+import datetime
+import threading
+
+from psycopg.types.json import Jsonb
+
+from app import db_events
+from app.db import get_db
+from app.http_cache import make_etag
+
+# Availability is compiled into per-day bitmaps held in plain Python ints:
+# bit ``m`` stands for the minute starting ``m`` minutes after midnight. A
+# day's open time is the weekly windows for that weekday, plus "extra"
+# sessions, minus leave and holidays; bookings are then subtracted from it.
+# Union, subtraction and run searches are a handful of big-int operations
+# per day instead of loops over slot lists.
+
+DAY_MINUTES = 24 * 60
+SLOT_MINUTES = 60
+
+DAY_ORDER = ["mon", "tue", "wed", "thu", "fri", "sat", "sun"]
+
+EXCEPTION_KINDS = {"leave", "holiday", "extra"}
+OPENING_KINDS = {"extra"}
+
+# Weekly schedules live in doctor_weekly_schedules / doctor_weekly_windows
+# (falling back to the availability_* columns on doctors). Both the weekly
+# endpoint and the admin doctor form write the two together through
+# save_weekly, so the profile and the bookable slots agree. Each worker keeps
+# them compiled in memory, keyed by doctor id; a trigger NOTIFYs
+# AVAILABILITY_CHANNEL on every change so all workers drop the stale entry.
+# The cache is only trusted while this worker is actually LISTENing.
+AVAILABILITY_CHANNEL = "doctor_availability"
+
+_weekly_cache = {}
+_weekly_cache_lock = threading.Lock()
+_weekly_cache_generation = 0
+
+
+def parse_window(window: str):
+    """Return (start_min, end_min) for an "HH:MM-HH:MM" window, or None."""
+    if not isinstance(window, str) or "-" not in window:
+        return None
+    start, end = window.split("-", 1)
+    if len(start) != 5 or len(end) != 5 or start[2] != ":" or end[2] != ":":
+        return None
+    try:
+        start_h, start_m = int(start[:2]), int(start[3:])
+        end_h, end_m = int(end[:2]), int(end[3:])
+    except ValueError:
+        return None
+    if not (0 <= start_h < 24 and 0 <= end_h < 24 and 0 <= start_m < 60 and 0 <= end_m < 60):
+        return None
+    start_min = start_h * 60 + start_m
+    end_min = end_h * 60 + end_m
+    if start_min >= end_min:
+        return None
+    return start_min, end_min
+
+
+def minute_of(value) -> int:
+    return value.hour * 60 + value.minute
+
+
+def window_bits(start_min: int, end_min: int) -> int:
+    """Bits for the minutes in [start_min, end_min)."""
+    if end_min <= start_min:
+        return 0
+    return ((1 << (end_min - start_min)) - 1) << start_min
+
+
+def windows_bits(windows) -> int:
+    bits = 0
+    for window in windows or []:
+        bounds = parse_window(window)
+        if bounds:
+            bits |= window_bits(*bounds)
+    return bits
+
+
+def run_starts(bits: int, k: int) -> int:
+    """Bits ``m`` such that minutes m .. m+k-1 are all set in ``bits``."""
+    span = 1
+    while span < k:
+        step = min(span, k - span)
+        bits &= bits >> step
+        span += step
+    return bits
+
+
+def next_free_run(bits: int, k: int, after: int = 0):
+    """First minute >= ``after`` that starts a run of ``k`` set minutes, or None."""
+    starts = run_starts(bits, k) >> after << after
+    if not starts:
+        return None
+    return (starts & -starts).bit_length() - 1
+
+
+def slot_grid(open_bits: int, slot_minutes: int = SLOT_MINUTES) -> int:
+    """Slot start bits: every ``slot_minutes`` from the start of each open run."""
+    grid = 0
+    while open_bits:
+        start = (open_bits & -open_bits).bit_length() - 1
+        run = open_bits >> start
+        length = ((run + 1) & ~run).bit_length() - 1
+        for m in range(start, start + length - slot_minutes + 1, slot_minutes):
+            grid |= 1 << m
+        open_bits &= ~window_bits(start, start + length)
+    return grid
+
+
+def bits_to_times(bits: int):
+    times = []
+    while bits:
+        low = bits & -bits
+        m = low.bit_length() - 1
+        times.append(f"{m // 60:02d}:{m % 60:02d}")
+        bits ^= low
+    return times
+
+
+def elapsed_bits(now: datetime.datetime) -> int:
+    """Bits for minutes that have already started today."""
+    return (1 << (minute_of(now) + 1)) - 1
+
+
+def schedule_from_row(row):
+    # A JSONB array of lower-case day keys, cleaned up on write.
+    days = row.get("availability_days") or []
+
+    start = row.get("availability_start")
+    end = row.get("availability_end")
+    start_str = start.strftime("%H:%M") if hasattr(start, "strftime") else str(start or "")[:5]
+    end_str = end.strftime("%H:%M") if hasattr(end, "strftime") else str(end or "")[:5]
+
+    window = f"{start_str}-{end_str}" if start_str and end_str else None
+    schedule = {}
+    for day in DAY_ORDER:
+        schedule[day] = [window] if window and day in days else []
+    return schedule
+
+
+def legacy_columns(schedule):
+    """Summarise a schedule as availability_days / _start / _end.
+
+    The days with any window, from the earliest start to the latest end;
+    start and end are None when there are no windows at all.
+    """
+    days = [day for day in DAY_ORDER if schedule.get(day)]
+    bounds = [parse_window(w) for day in days for w in schedule[day]]
+    bounds = [b for b in bounds if b]
+    if not bounds:
+        return days, None, None
+    start = min(b[0] for b in bounds)
+    end = max(b[1] for b in bounds)
+    return days, f"{start // 60:02d}:{start % 60:02d}", f"{end // 60:02d}:{end % 60:02d}"
+
+
+def save_weekly(cur, doctor_id, schedule, sync_columns=True):
+    """Store ``schedule`` as the doctor's weekly schedule; the caller commits.
+
+    With ``sync_columns`` the availability_* columns are rewritten from it
+    too (see legacy_columns).
+    """
+    rows = []
+    for day in DAY_ORDER:
+        for window in schedule.get(day) or []:
+            start, end = window.split("-", 1)
+            rows.append((doctor_id, day, start, end))
+
+    cur.execute(
+        """
+        INSERT INTO doctor_weekly_schedules (doctor_id)
+        VALUES (%s)
+        ON CONFLICT (doctor_id) DO UPDATE SET updated_at = NOW()
+        """,
+        (doctor_id,),
+    )
+    cur.execute("DELETE FROM doctor_weekly_windows WHERE doctor_id = %s", (doctor_id,))
+    if rows:
+        cur.executemany(
+            """
+            INSERT INTO doctor_weekly_windows (doctor_id, day, start_time, end_time)
+            VALUES (%s, %s, %s, %s)
+            """,
+            rows,
+        )
+    if sync_columns:
+        days, start, end = legacy_columns(schedule)
+        cur.execute(
+            """
+            UPDATE doctors
+            SET availability_days = %s,
+                availability_start = COALESCE(%s::time, availability_start),
+                availability_end = COALESCE(%s::time, availability_end),
+                updated_at = NOW()
+            WHERE id = %s
+            """,
+            (Jsonb(days), start, end, doctor_id),
+        )
+
+
+def invalidate_weekly(payload):
+    """db_events callback: drop one doctor's entry, or everything for ``None``."""
+    global _weekly_cache_generation
+    with _weekly_cache_lock:
+        _weekly_cache_generation += 1
+        try:
+            _weekly_cache.pop(int(payload), None)
+        except (TypeError, ValueError):
+            _weekly_cache.clear()
+
+
+db_events.subscribe(AVAILABILITY_CHANNEL, invalidate_weekly)
+
+
+def _fetch_weekly(doctor_ids):
+    with get_db().cursor() as cur:
+        cur.execute(
+            """
+            SELECT d.id, d.is_active,
+                   d.availability_days, d.availability_start, d.availability_end,
+                   s.doctor_id IS NOT NULL AS has_weekly,
+                   COALESCE(
+                       json_agg(
+                           json_build_array(w.day, TO_CHAR(w.start_time, 'HH24:MI'), TO_CHAR(w.end_time, 'HH24:MI'))
+                           ORDER BY w.start_time
+                       ) FILTER (WHERE w.doctor_id IS NOT NULL),
+                       '[]'
+                   ) AS windows
+            FROM doctors d
+            LEFT JOIN doctor_weekly_schedules s ON s.doctor_id = d.id
+            LEFT JOIN doctor_weekly_windows w ON w.doctor_id = s.doctor_id
+            WHERE d.id = ANY(%s)
+            GROUP BY d.id, s.doctor_id
+            """,
+            (list(doctor_ids),),
+        )
+        rows = cur.fetchall() or []
+
+    entries = {}
+    for row in rows:
+        if row.get("has_weekly"):
+            schedule = {day: [] for day in DAY_ORDER}
+            for day, start, end in row.get("windows") or []:
+                schedule[day].append(f"{start}-{end}")
+        else:
+            schedule = schedule_from_row(row)
+        entries[row.get("id")] = {
+            "active": bool(row.get("is_active")),
+            "schedule": schedule,
+            "bits": [windows_bits(schedule.get(day)) for day in DAY_ORDER],
+            "etag": make_etag("weekly", schedule),
+        }
+    return entries
+
+
+def get_weekly(doctor_ids):
+    """Return {doctor_id: entry} for the doctors that exist, cache first.
+
+    An entry has ``active``, the ``schedule`` dict as shown by the API,
+    ``bits``, the compiled open minutes indexed by ``date.weekday()``, and
+    ``etag``, a digest of the schedule.
+    """
+    listening = db_events.is_listening(AVAILABILITY_CHANNEL)
+    found = {}
+    missing = list(doctor_ids)
+    generation = None
+    if listening:
+        with _weekly_cache_lock:
+            generation = _weekly_cache_generation
+            missing = []
+            for doctor_id in doctor_ids:
+                entry = _weekly_cache.get(doctor_id)
+                if entry is None:
+                    missing.append(doctor_id)
+                else:
+                    found[doctor_id] = entry
+
+    if missing:
+        loaded = _fetch_weekly(missing)
+        found.update(loaded)
+        if listening:
+            with _weekly_cache_lock:
+                # An invalidation that raced with the fetch may have made
+                # these rows stale; let the next request reload them.
+                if generation == _weekly_cache_generation:
+                    _weekly_cache.update(loaded)
+    return found
+
+
+def load_exceptions(doctor_ids, start, end):
+    """Return {(doctor_id, date): (open_bits, closed_bits)} for the range.
+
+    Exceptions without a doctor are clinic-wide and apply to every doctor.
+    Exceptions without times cover the whole day.
+    """
+    doctor_ids = list(doctor_ids)
+    with get_db().cursor() as cur:
+        cur.execute(
+            """
+            SELECT doctor_id, date, kind, start_time, end_time
+            FROM doctor_availability_exceptions
+            WHERE (doctor_id = ANY(%s) OR doctor_id IS NULL)
+              AND date >= %s AND date <= %s
+            """,
+            (doctor_ids, start, end),
+        )
+        rows = cur.fetchall() or []
+
+    result = {}
+    for row in rows:
+        if row.get("start_time") is None:
+            bits = window_bits(0, DAY_MINUTES)
+        else:
+            bits = window_bits(minute_of(row.get("start_time")), minute_of(row.get("end_time")))
+        targets = doctor_ids if row.get("doctor_id") is None else [row.get("doctor_id")]
+        for doctor_id in targets:
+            key = (doctor_id, row.get("date"))
+            opened, closed = result.get(key, (0, 0))
+            if row.get("kind") in OPENING_KINDS:
+                opened |= bits
+            else:
+                closed |= bits
+            result[key] = (opened, closed)
+    return result
+
+
+def doctors_with_openings(doctor_ids, start, end):
+    """Ids among ``doctor_ids`` that have an "extra" session in the range.
+
+    A clinic-wide extra session opens the day for every doctor.
+    """
+    doctor_ids = list(doctor_ids)
+    with get_db().cursor() as cur:
+        cur.execute(
+            """
+            SELECT DISTINCT doctor_id
+            FROM doctor_availability_exceptions
+            WHERE (doctor_id = ANY(%s) OR doctor_id IS NULL)
+              AND date >= %s AND date <= %s
+              AND kind = ANY(%s)
+            """,
+            (doctor_ids, start, end, sorted(OPENING_KINDS)),
+        )
+        rows = cur.fetchall() or []
+    found = {row.get("doctor_id") for row in rows}
+    if None in found:
+        return set(doctor_ids)
+    return found
+
+
+def load_booked(doctor_ids, start, end, slot_minutes: int = SLOT_MINUTES):
+    """Return {(doctor_id, date): occupied_bits} for non-cancelled bookings."""
+    with get_db().cursor() as cur:
+        cur.execute(
+            """
+            SELECT doctor_id, date, time
+            FROM appointments
+            WHERE doctor_id = ANY(%s) AND date >= %s AND date <= %s
+              AND LOWER(status) <> 'cancelled'
+            """,
+            (list(doctor_ids), start, end),
+        )
+        rows = cur.fetchall() or []
+
+    result = {}
+    for row in rows:
+        key = (row.get("doctor_id"), row.get("date"))
+        m = minute_of(row.get("time"))
+        result[key] = result.get(key, 0) | window_bits(m, min(m + slot_minutes, DAY_MINUTES))
+    return result
+
+
+class Calendar:
+    """Compiled open and free slots for a set of doctors over a date range.
+
+    Exceptions and bookings are loaded for all doctors one chunk of days at
+    a time, so a scan that stops early (first-available search) does not read
+    the whole range.
+    """
+
+    def __init__(self, weekly, start, end, now=None, chunk_days=None, slot_minutes=SLOT_MINUTES):
+        self.weekly = weekly
+        self.doctor_ids = list(weekly)
+        self.start = start
+        self.end = end
+        self.now = now or datetime.datetime.now()
+        self.chunk_days = chunk_days or ((end - start).days + 1)
+        self.slot_minutes = slot_minutes
+        self.loaded_until = start - datetime.timedelta(days=1)
+        self.exceptions = {}
+        self.booked = {}
+
+    def _ensure_loaded(self, day):
+        while day > self.loaded_until and self.loaded_until < self.end:
+            chunk_start = self.loaded_until + datetime.timedelta(days=1)
+            chunk_end = min(self.end, self.loaded_until + datetime.timedelta(days=self.chunk_days))
+            self.exceptions.update(load_exceptions(self.doctor_ids, chunk_start, chunk_end))
+            self.booked.update(load_booked(self.doctor_ids, chunk_start, chunk_end, self.slot_minutes))
+            self.loaded_until = chunk_end
+
+    def open_bits(self, doctor_id, day) -> int:
+        self._ensure_loaded(day)
+        bits = self.weekly[doctor_id]["bits"][day.weekday()]
+        opened, closed = self.exceptions.get((doctor_id, day), (0, 0))
+        return (bits | opened) & ~closed
+
+    def open_slots(self, doctor_id, day) -> int:
+        """Slot start bits for the day, ignoring bookings and the clock."""
+        return slot_grid(self.open_bits(doctor_id, day), self.slot_minutes)
+
+    def booked_slots(self, doctor_id, day) -> int:
+        """Open slot start bits that overlap a booking."""
+        open_bits = self.open_bits(doctor_id, day)
+        free = open_bits & ~self.booked.get((doctor_id, day), 0)
+        return slot_grid(open_bits, self.slot_minutes) & ~run_starts(free, self.slot_minutes)
+
+    def free_slots(self, doctor_id, day) -> int:
+        """Slot start bits that can still be booked."""
+        if day < self.now.date():
+            return 0
+        open_bits = self.open_bits(doctor_id, day)
+        free = open_bits & ~self.booked.get((doctor_id, day), 0)
+        slots = slot_grid(open_bits, self.slot_minutes) & run_starts(free, self.slot_minutes)
+        if day == self.now.date():
+            slots &= ~elapsed_bits(self.now)
+        return slots
+
+    def chunks(self):
+        """Yield (first, last) day of each loading chunk, in order."""
+        day = self.start
+        while day <= self.end:
+            last = min(self.end, day + datetime.timedelta(days=self.chunk_days - 1))
+            yield day, last
+            day = last + datetime.timedelta(days=1)
+
+    def iter_free(self, doctor_id, start=None, end=None):
+        """Yield (datetime, doctor_id) for each free slot in date order."""
+        day = max(start or self.start, self.start)
+        end = min(end or self.end, self.end)
+        while day <= end:
+            slots = self.free_slots(doctor_id, day)
+            while slots:
+                low = slots & -slots
+                m = low.bit_length() - 1
+                yield datetime.datetime.combine(day, datetime.time(m // 60, m % 60)), doctor_id
+                slots ^= low
+            day += datetime.timedelta(days=1)
@@ -0,0 +1,130 @@
+"""Compare JSON response encoding: Flask's stdlib provider vs FastJSONProvider.
+
+``python -m app.bench_json [--rows 10000] [--repeat 20]``
+
+Payloads mirror the largest responses the API builds in Python (the public
+doctor directory, appointment pages, admin rows carrying datetime and
+Decimal values); no database is needed.
+"""
+import argparse
+import datetime
+import decimal
+import time
+
+from flask import Flask
+from flask.json.provider import DefaultJSONProvider
+
+from app.json_provider import FastJSONProvider, orjson
+from app.routes.utils import cached_success_response
+
+
+def _directory(rows):
+    items = [
+        {
+            "id": i,
+            "full_name": f"Dr Example {i}",
+            "specialty": ("Cardiology", "Dermatology", "Paediatrics")[i % 3],
+            "avatar_url": f"/uploads/avatars/doctor_{i}.jpg" if i % 2 else None,
+            "availability_days": ["mon", "tue", "wed", "thu", "fri"],
+            "availability_start": "09:00",
+            "availability_end": "17:00",
+            "bio": "Consultant with a special interest in preventive care and chronic disease. " * 2,
+            "experience": ["Registrar, Victoria Hospital", "Consultant, SSRN Hospital"],
+            "certifications": ["MBBS", "MRCP"],
+            "specialisations": ["heart failure", "hypertension"],
+        }
+        for i in range(rows)
+    ]
+    return {"count": len(items), "items": items}
+
+
+def _appointments(rows):
+    items = [
+        {
+            "id": i,
+            "doctor_id": 200 + i % 50,
+            "doctor": "Dr Example",
+            "specialty": "Cardiology",
+            "date": "2026-10-18",
+            "time": f"{9 + i % 8:02d}:00",
+            "name": f"Patient {i}",
+            "email": f"patient{i}@example.test",
+            "phone": "+23050000000",
+            "status": "booked",
+        }
+        for i in range(rows)
+    ]
+    return {"count": len(items), "items": items, "next_cursor": None}
+
+
+def _typed_rows(rows):
+    now = datetime.datetime(2026, 10, 18, 9, 30, tzinfo=datetime.timezone.utc)
+    return [
+        {
+            "id": i,
+            "slug": f"package-{i}",
+            "name": f"Package {i}",
+            "price_mur": decimal.Decimal("1450.00") + i,
+            "contents": ["CBC", "Lipid profile", "HbA1c"],
+            "created_at": now,
+            "updated_at": now + datetime.timedelta(minutes=i),
+            "date": now.date(),
+            "time": datetime.time(9, 0),
+        }
+        for i in range(rows)
+    ]
+
+
+def _bench(fn, repeat):
+    fn()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args(argv)
+
+    stdlib_app = Flask("bench_stdlib")
+    stdlib_app.json = DefaultJSONProvider(stdlib_app)
+    fast_app = Flask("bench_fast")
+    fast_app.json = FastJSONProvider(fast_app)
+
+    payloads = {
+        "doctor directory": _directory(args.rows),
+        "appointments page": _appointments(args.rows),
+        "rows with datetime/Decimal": _typed_rows(args.rows),
+    }
+
+    print(f"orjson: {'yes' if orjson else 'not installed (stdlib fallback)'}; "
+          f"{args.rows} rows, mean of {args.repeat} runs")
+    print(f"{'payload':<28}{'stdlib ms':>12}{'fast ms':>12}{'speedup':>10}{'bytes':>12}")
+    for name, data in payloads.items():
+        body = {"success": True, "data": data}
+        if name == "rows with datetime/Decimal":
+            # The stdlib encoder cannot render TIME values at all.
+            stdlib_body = {"success": True, "data": [{**r, "time": "09:00:00"} for r in data]}
+        else:
+            stdlib_body = body
+        with stdlib_app.app_context():
+            slow = _bench(lambda: stdlib_app.json.response(stdlib_body), args.repeat)
+        with fast_app.app_context():
+            fast = _bench(lambda: fast_app.json.response(body), args.repeat)
+            size = len(fast_app.json.response(body).get_data())
+        print(f"{name:<28}{slow:>12.2f}{fast:>12.2f}{slow / fast:>9.1f}x{size:>12}")
+
+    # The directory snapshot keeps its encoded body, so repeat requests only
+    # build a Response around cached bytes.
+    directory = payloads["doctor directory"]
+    bodies = {}
+    with fast_app.app_context():
+        cached = _bench(lambda: cached_success_response(bodies, ("all",), lambda: directory), args.repeat)
+    print(f"{'directory, cached body':<28}{'':>12}{cached:>12.3f}")
+
+
+if __name__ == "__main__":
+    main()
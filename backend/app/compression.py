@@ -0,0 +1,185 @@
+import threading
+import zlib
+from collections import OrderedDict
+
+from werkzeug.http import parse_accept_header
+
+from app.config import env_bool, env_int
+
+try:
+    import brotli
+except ImportError:  # optional: without it only gzip is offered
+    try:
+        import brotlicffi as brotli
+    except ImportError:
+        brotli = None
+
+# WSGI middleware that compresses text responses (JSON, CSV, HTML) with
+# brotli or gzip, whichever the client prefers. Bodies smaller than
+# COMPRESS_MIN_SIZE, responses that already carry a Content-Encoding and
+# binary types (avatars, quote uploads) pass through untouched. Buffered
+# responses are compressed in one go; streamed ones (the CSV exports) are
+# compressed chunk by chunk so memory stays bounded.
+#
+# Cacheable responses (a validator plus Cache-Control: public, i.e. the
+# public catalogue) keep their compressed variant keyed by path and ETag,
+# so a repeat hit reuses the bytes instead of compressing again.
+
+_COMPRESSIBLE_TYPES = {
+    "application/json",
+    "application/javascript",
+    "application/xml",
+    "image/svg+xml",
+}
+_SKIP_STATUS = {204, 206, 304}
+
+_variants = OrderedDict()
+_variants_lock = threading.Lock()
+
+
+def _encodings():
+    return ("br", "gzip") if brotli is not None else ("gzip",)
+
+
+def _is_compressible(content_type: str) -> bool:
+    mimetype = content_type.split(";", 1)[0].strip().lower()
+    return (
+        mimetype.startswith("text/")
+        or mimetype in _COMPRESSIBLE_TYPES
+        or mimetype.endswith(("+json", "+xml"))
+    )
+
+
+def _add_vary(headers):
+    for i, (name, value) in enumerate(headers):
+        if name.lower() == "vary":
+            if "accept-encoding" not in value.lower():
+                headers[i] = (name, f"{value}, Accept-Encoding")
+            return
+    headers.append(("Vary", "Accept-Encoding"))
+
+
+def _weaken_etag(headers):
+    # The compressed body is a different byte sequence, so a strong ETag
+    # would be wrong; a weak one still satisfies If-None-Match.
+    for i, (name, value) in enumerate(headers):
+        if name.lower() == "etag" and not value.startswith("W/"):
+            headers[i] = (name, "W/" + value)
+
+
+def _cached_variant(key):
+    with _variants_lock:
+        body = _variants.get(key)
+        if body is not None:
+            _variants.move_to_end(key)
+        return body
+
+
+def _store_variant(key, body, limit):
+    with _variants_lock:
+        _variants[key] = body
+        _variants.move_to_end(key)
+        while len(_variants) > limit:
+            _variants.popitem(last=False)
+
+
+def clear_cache():
+    with _variants_lock:
+        _variants.clear()
+
+
+class CompressionMiddleware:
+    def __init__(self, wsgi_app):
+        self.wsgi_app = wsgi_app
+        self.enabled = env_bool("COMPRESS_ENABLED", True)
+        self.min_size = env_int("COMPRESS_MIN_SIZE", 1024)
+        self.gzip_level = env_int("COMPRESS_GZIP_LEVEL", 6)
+        self.brotli_quality = env_int("COMPRESS_BROTLI_QUALITY", 5)
+        self.cache_entries = env_int("COMPRESS_CACHE_ENTRIES", 256)
+
+    def _negotiate(self, environ):
+        accept = parse_accept_header(environ.get("HTTP_ACCEPT_ENCODING"))
+        return accept.best_match(_encodings())
+
+    def _compress(self, encoding, data: bytes) -> bytes:
+        if encoding == "br":
+            return brotli.compress(data, quality=self.brotli_quality)
+        compressor = zlib.compressobj(self.gzip_level, zlib.DEFLATED, 31)
+        return compressor.compress(data) + compressor.flush()
+
+    def _compress_stream(self, encoding, app_iter):
+        try:
+            if encoding == "br":
+                compressor = brotli.Compressor(quality=self.brotli_quality)
+                process, finish = compressor.process, compressor.finish
+            else:
+                compressor = zlib.compressobj(self.gzip_level, zlib.DEFLATED, 31)
+                process, finish = compressor.compress, compressor.flush
+            for chunk in app_iter:
+                out = process(chunk)
+                if out:
+                    yield out
+            yield finish()
+        finally:
+            if hasattr(app_iter, "close"):
+                app_iter.close()
+
+    def __call__(self, environ, start_response):
+        if not self.enabled or environ.get("REQUEST_METHOD") == "HEAD":
+            return self.wsgi_app(environ, start_response)
+
+        captured = []
+
+        def capture(status, headers, exc_info=None):
+            captured[:] = [status, list(headers), exc_info]
+            # Flask never uses the legacy write() callable.
+            return None
+
+        app_iter = self.wsgi_app(environ, capture)
+        status, headers, exc_info = captured
+        found = {name.lower(): value for name, value in headers}
+
+        length = found.get("content-length")
+        if (
+            int(status.split(" ", 1)[0]) in _SKIP_STATUS
+            or "content-encoding" in found
+            or not _is_compressible(found.get("content-type", ""))
+            or "no-transform" in found.get("cache-control", "")
+            or (length is not None and int(length) < self.min_size)
+        ):
+            start_response(status, headers, exc_info)
+            return app_iter
+
+        _add_vary(headers)
+        encoding = self._negotiate(environ)
+        if encoding is None:
+            start_response(status, headers, exc_info)
+            return app_iter
+
+        headers = [(name, value) for name, value in headers if name.lower() != "content-length"]
+        headers.append(("Content-Encoding", encoding))
+        _weaken_etag(headers)
+
+        if length is None:
+            # Streamed response: no length up front, compress as it goes.
+            start_response(status, headers, exc_info)
+            return self._compress_stream(encoding, app_iter)
+
+        try:
+            data = b"".join(app_iter)
+        finally:
+            if hasattr(app_iter, "close"):
+                app_iter.close()
+
+        etag = found.get("etag")
+        cacheable = etag is not None and "public" in found.get("cache-control", "")
+        key = (environ.get("PATH_INFO"), environ.get("QUERY_STRING"), etag, encoding, len(data))
+        body = _cached_variant(key) if cacheable else None
+        if body is None:
+            body = self._compress(encoding, data)
+            if cacheable:
+                _store_variant(key, body, self.cache_entries)
+
+        headers.append(("Content-Length", str(len(body))))
+        start_response(status, headers, exc_info)
+        return [body]
@@ -1,8 +1,35 @@
+import functools
+import logging
 import os
+import random
+import re
+import sys
+import threading
+import time
+import uuid
 import psycopg
-from psycopg.rows import dict_row
+from flask import g, has_request_context, request
+from psycopg import sql
+from psycopg.pq import TransactionStatus
+from psycopg.rows import dict_row, tuple_row
+from psycopg_pool import ConnectionPool
 from pathlib import Path
 
+from app import metrics
+from app.config import env_float, env_int
+
+# One pool per process. Gunicorn workers fork from the master, and libpq
+# sockets and the pool's maintenance threads must never be shared across a
+# fork, so the pool is closed before forking and re-created lazily in the
+# child (the pid check is a fallback for forks that bypass os.fork hooks).
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+_DOLLAR_TAG_RE = re.compile(r"\$[A-Za-z_]*\$")
+
+logger = logging.getLogger(__name__)
+
 
 def _db_url():
     url = os.getenv("DATABASE_URL") or os.getenv("database_url")
@@ -11,8 +38,394 @@ def _db_url():
     return url.strip()
 
 
+# Query instrumentation. Every statement run through a pooled connection is
+# timed for app.metrics; inside a request it is also grouped by its
+# normalised text (literals and parameters replaced by ?), so the teardown
+# hook can flag shapes run more than DB_REPEATED_QUERY_THRESHOLD times, the
+# usual sign of an N+1 loop. Statements slower than DB_SLOW_QUERY_MS are
+# logged with their origin; with DB_EXPLAIN_SAMPLE_RATE > 0 that share of
+# slow statements is also logged with its EXPLAIN plan. Plain EXPLAIN only
+# plans the statement: EXPLAIN ANALYZE would run it a second time, and a
+# rolled-back savepoint does not undo advisory locks, sequence calls or
+# other side effects of the functions it calls.
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_COMMENT_RE = re.compile(r"--[^\n]*|/\*.*?\*/", re.S)
+_PARAM_RE = re.compile(r"%\(\w+\)s|%s|\b\d+(?:\.\d+)?\b")
+_LIST_RE = re.compile(r"\?(?:\s*,\s*\?)+")
+_SPACE_RE = re.compile(r"\s+")
+_EXPLAINABLE_RE = re.compile(r"^(?:select|with|insert|update|delete|merge)\b", re.I)
+
+
+@functools.lru_cache(maxsize=1024)
+def normalize_sql(text: str) -> str:
+    """Collapse a statement to its shape: no literals, comments or extra spaces."""
+    text = _STRING_RE.sub("?", text)
+    text = _COMMENT_RE.sub(" ", text)
+    text = _PARAM_RE.sub("?", text)
+    text = _LIST_RE.sub("?, ...", text)
+    return _SPACE_RE.sub(" ", text).strip().rstrip(";")
+
+
+def _query_text(query, conn) -> str:
+    if isinstance(query, sql.Composable):
+        return query.as_string(conn)
+    if isinstance(query, bytes):
+        return query.decode("utf-8", "replace")
+    return query
+
+
+def _origin() -> str:
+    """module:function:line of the first caller outside this module and psycopg."""
+    frame = sys._getframe(1)
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if filename != __file__ and f"{os.sep}psycopg" not in filename:
+            module = frame.f_globals.get("__name__", "?")
+            return f"{module}:{frame.f_code.co_name}:{frame.f_lineno}"
+        frame = frame.f_back
+    return "?"
+
+
+class TimedCursor(psycopg.Cursor):
+    """Cursor that times each statement and records it for the current request."""
+
+    def execute(self, query, params=None, **kwargs):
+        started = time.perf_counter()
+        ok = False
+        try:
+            result = super().execute(query, params, **kwargs)
+            ok = True
+            return result
+        finally:
+            self._record(query, params, time.perf_counter() - started, ok)
+
+    def executemany(self, query, params_seq, **kwargs):
+        started = time.perf_counter()
+        ok = False
+        try:
+            result = super().executemany(query, params_seq, **kwargs)
+            ok = True
+            return result
+        finally:
+            self._record(query, None, time.perf_counter() - started, ok)
+
+    def _record(self, query, params, seconds, ok):
+        metrics.record_query(seconds, query)
+        if query == "":
+            return
+        slow = seconds * 1000 >= env_float("DB_SLOW_QUERY_MS", 200.0)
+        in_request = has_request_context()
+        if not slow and not in_request:
+            return
+
+        statement = normalize_sql(_query_text(query, self.connection))
+        rows = max(self.rowcount, 0)
+        # Walking the stack is the costly part; do it at most once.
+        origin = _origin() if slow else None
+        if in_request:
+            stats = g.get("query_stats")
+            if stats is None:
+                stats = g.query_stats = {}
+            entry = stats.get(statement)
+            if entry is None:
+                entry = stats[statement] = {"count": 0, "seconds": 0.0, "rows": 0, "origin": origin or _origin()}
+            entry["count"] += 1
+            entry["seconds"] += seconds
+            entry["rows"] += rows
+        if slow:
+            self._log_slow(statement, query, params, seconds, rows, ok, origin)
+
+    def _log_slow(self, statement, query, params, seconds, rows, ok, origin):
+        metrics.inc("medconnect_db_slow_queries_total", {"origin": origin})
+        plan = None
+        rate = env_float("DB_EXPLAIN_SAMPLE_RATE", 0.0)
+        if ok and rate > 0 and random.random() < rate and _EXPLAINABLE_RE.match(statement):
+            plan = self._explain(query, params)
+        logger.warning(
+            "Slow query (%.1f ms, %d rows) at %s: %s%s",
+            seconds * 1000, rows, origin, statement[:2000], f"\n{plan}" if plan else "",
+        )
+
+    def _explain(self, query, params):
+        conn = self.connection
+        if conn.info.transaction_status not in (TransactionStatus.IDLE, TransactionStatus.INTRANS):
+            return None
+        if isinstance(query, sql.Composable):
+            explain = sql.SQL("EXPLAIN ") + query
+        elif isinstance(query, bytes):
+            explain = b"EXPLAIN " + query
+        else:
+            explain = "EXPLAIN " + query
+        try:
+            # The savepoint keeps a failed EXPLAIN from aborting the
+            # request's transaction.
+            with conn.transaction(force_rollback=True):
+                with psycopg.Cursor(conn, row_factory=tuple_row) as cur:
+                    cur.execute(explain, params)
+                    return "\n".join(row[0] for row in cur.fetchall())
+        except psycopg.Error as exc:
+            logger.info("EXPLAIN failed for slow query: %s", exc)
+            return None
+
+
+def _report_repeated_queries(exc=None):
+    stats = g.pop("query_stats", None)
+    if not stats:
+        return
+    threshold = env_int("DB_REPEATED_QUERY_THRESHOLD", 10)
+    for statement, entry in stats.items():
+        if entry["count"] <= threshold:
+            continue
+        metrics.inc("medconnect_db_repeated_queries_total",
+                    {"endpoint": request.endpoint or "unmatched", "origin": entry["origin"]})
+        logger.warning(
+            "Possible N+1 in %s: statement ran %d times (%.1f ms, %d rows) at %s: %s",
+            request.endpoint, entry["count"], entry["seconds"] * 1000, entry["rows"],
+            entry["origin"], statement[:2000],
+        )
+    if logger.isEnabledFor(logging.DEBUG):
+        for statement, entry in sorted(stats.items(), key=lambda item: -item[1]["seconds"]):
+            logger.debug("%s: %d x %.1f ms, %d rows at %s: %s", request.endpoint, entry["count"],
+                         entry["seconds"] * 1000, entry["rows"], entry["origin"], statement[:500])
+
+
+def _create_pool():
+    return ConnectionPool(
+        _db_url(),
+        min_size=env_int("DB_POOL_MIN_SIZE", 1),
+        max_size=env_int("DB_POOL_MAX_SIZE", 10),
+        timeout=env_float("DB_POOL_TIMEOUT", 10.0),
+        max_idle=env_float("DB_POOL_MAX_IDLE", 300.0),
+        max_lifetime=env_float("DB_POOL_MAX_LIFETIME", 1800.0),
+        check=ConnectionPool.check_connection,
+        kwargs={"row_factory": dict_row, "cursor_factory": TimedCursor},
+        name="medconnect",
+        open=True,
+    )
+
+
+def get_pool():
+    global _pool, _pool_pid
+    pid = os.getpid()
+    if _pool is None or _pool_pid != pid:
+        with _pool_lock:
+            if _pool is None or _pool_pid != pid:
+                _pool = _create_pool()
+                _pool_pid = pid
+    return _pool
+
+
+def close_pool():
+    global _pool, _pool_pid
+    pool = _pool
+    _pool = None
+    _pool_pid = None
+    if pool is not None and not pool.closed:
+        pool.close()
+
+
+def _reset_pool_in_child():
+    global _pool, _pool_pid, _pool_lock
+    _pool = None
+    _pool_pid = None
+    _pool_lock = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(before=close_pool, after_in_child=_reset_pool_in_child)
+
+
 def get_connection():
-    return psycopg.connect(_db_url(), row_factory=dict_row)
+    """Check a connection out of the pool.
+
+    Used as ``with get_connection() as conn``: the block commits on success,
+    rolls back on error and hands the connection back to the pool.
+    """
+    metrics.record_checkout()
+    return get_pool().connection()
+
+
+def get_db():
+    """Return the connection bound to the current request.
+
+    The first call checks a connection out of the pool; every later call in
+    the same request gets the same connection, so a request runs all of its
+    queries as one transaction. The transaction is committed once the
+    response is built (rolled back for 5xx responses) and the connection goes
+    back to the pool on teardown. Handlers that trigger external side effects
+    (SMS, email, file deletion) commit first so nothing is announced that
+    could still roll back.
+    """
+    conn = g.get("db_conn")
+    if conn is None:
+        conn = get_pool().getconn()
+        metrics.record_checkout()
+        g.db_conn = conn
+    return conn
+
+
+def _finish_request_transaction(response):
+    conn = g.get("db_conn")
+    if conn is not None and not conn.closed:
+        if response.status_code >= 500:
+            conn.rollback()
+        else:
+            conn.commit()
+    return response
+
+
+def _release_request_connection(exc=None):
+    conn = g.pop("db_conn", None)
+    if conn is None:
+        return
+    try:
+        if not conn.closed and conn.info.transaction_status != TransactionStatus.IDLE:
+            conn.rollback()
+    finally:
+        get_pool().putconn(conn)
+
+
+def init_app(app):
+    app.after_request(_finish_request_transaction)
+    app.teardown_request(_release_request_connection)
+    app.teardown_request(_report_repeated_queries)
+
+
+def stream_copy(sql, params=None):
+    """Yield the output of a ``COPY (...) TO STDOUT`` statement chunk by chunk.
+
+    Streaming responses are consumed after the request has been torn down,
+    so this checks out its own pooled connection instead of using get_db().
+    """
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            with cur.copy(sql, params) as copy:
+                for chunk in copy:
+                    yield bytes(chunk)
+
+
+def stream_rows(sql, params=None, itersize: int = 2000):
+    """Yield rows through a named server-side cursor, ``itersize`` rows per fetch."""
+    with get_connection() as conn:
+        with conn.cursor(name=f"stream_{uuid.uuid4().hex}") as cur:
+            cur.itersize = itersize
+            cur.execute(sql, params)
+            for row in cur:
+                yield row
+
+
+def pool_stats():
+    pool = _pool
+    if pool is None or _pool_pid != os.getpid():
+        return {"initialized": False}
+    stats = pool.get_stats()
+    return {
+        "initialized": True,
+        "min_size": pool.min_size,
+        "max_size": pool.max_size,
+        "size": stats.get("pool_size", 0),
+        "idle": stats.get("pool_available", 0),
+        "waiting": stats.get("requests_waiting", 0),
+        "requests": stats.get("requests_num", 0),
+        "requests_queued": stats.get("requests_queued", 0),
+        "requests_wait_ms": stats.get("requests_wait_ms", 0),
+        "requests_errors": stats.get("requests_errors", 0),
+        "connections_opened": stats.get("connections_num", 0),
+        "connections_lost": stats.get("connections_lost", 0),
+        "usage_ms": stats.get("usage_ms", 0),
+    }
+
+
+def _pool_metrics():
+    stats = pool_stats()
+    if not stats["initialized"]:
+        return
+    metrics.set_gauge("medconnect_db_pool_connections", {"state": "idle"}, stats["idle"])
+    metrics.set_gauge("medconnect_db_pool_connections", {"state": "in_use"}, stats["size"] - stats["idle"])
+    metrics.set_gauge("medconnect_db_pool_connections", {"state": "waiting"}, stats["waiting"])
+    metrics.set_total("medconnect_db_pool_connections_opened_total", None, stats["connections_opened"])
+
+
+metrics.register_collector(_pool_metrics)
+
+
+def _split_sql_statements(sql_text: str):
+    """Split a migration file on top-level semicolons.
+
+    Semicolons inside quoted strings, dollar-quoted bodies (DO blocks,
+    functions) and comments do not end a statement.
+    """
+    statements = []
+    current = []
+    i = 0
+    n = len(sql_text)
+    while i < n:
+        ch = sql_text[i]
+        if ch == "-" and sql_text.startswith("--", i):
+            end = sql_text.find("\n", i)
+            end = n if end == -1 else end
+            current.append(sql_text[i:end])
+            i = end
+            continue
+        if ch == "/" and sql_text.startswith("/*", i):
+            end = sql_text.find("*/", i + 2)
+            end = n if end == -1 else end + 2
+            current.append(sql_text[i:end])
+            i = end
+            continue
+        if ch == "'":
+            end = i + 1
+            while end < n:
+                if sql_text[end] == "'":
+                    if sql_text.startswith("''", end):
+                        end += 2
+                        continue
+                    break
+                end += 1
+            current.append(sql_text[i:end + 1])
+            i = end + 1
+            continue
+        if ch == "$":
+            match = _DOLLAR_TAG_RE.match(sql_text, i)
+            if match:
+                tag = match.group(0)
+                end = sql_text.find(tag, match.end())
+                end = n if end == -1 else end + len(tag)
+                current.append(sql_text[i:end])
+                i = end
+                continue
+        if ch == ";":
+            statement = "".join(current).strip()
+            if _has_sql(statement):
+                statements.append(statement)
+            current = []
+            i += 1
+            continue
+        current.append(ch)
+        i += 1
+
+    statement = "".join(current).strip()
+    if _has_sql(statement):
+        statements.append(statement)
+    return statements
+
+
+def _has_sql(statement: str) -> bool:
+    for line in statement.splitlines():
+        line = line.strip()
+        if line and not line.startswith("--"):
+            return True
+    return False
+
+
+# Files starting with this line run statement by statement in autocommit
+# mode, for online changes that commit in batches or build indexes
+# CONCURRENTLY; such a file must be safe to re-run after a partial failure.
+_NO_TRANSACTION_MARK = "-- migrate: no-transaction"
+
+# Every worker runs init_db on start; the advisory lock lets one of them
+# apply pending migrations while the others wait and then find none left.
+_MIGRATION_LOCK_ID = 7265019
 
 
 def apply_migrations():
@@ -21,32 +434,51 @@ def apply_migrations():
         raise RuntimeError(f"Migrations directory not found: {migrations_dir}")
 
     with get_connection() as conn:
-        with conn.cursor() as cur:
-            cur.execute("""
-                CREATE TABLE IF NOT EXISTS schema_migrations (
-                    version TEXT PRIMARY KEY,
-                    applied_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
-                );
-            """)
+        conn.execute("SELECT pg_advisory_lock(%s);", (_MIGRATION_LOCK_ID,))
+        try:
+            with conn.cursor() as cur:
+                cur.execute("""
+                    CREATE TABLE IF NOT EXISTS schema_migrations (
+                        version TEXT PRIMARY KEY,
+                        applied_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+                    );
+                """)
 
-            cur.execute("SELECT version FROM schema_migrations;")
-            applied = {row.get("version") for row in cur.fetchall() or []}
+                cur.execute("SELECT version FROM schema_migrations;")
+                applied = {row.get("version") for row in cur.fetchall() or []}
+            conn.commit()
 
+            # Each file commits on its own, so a later failure does not undo
+            # migrations that already went through.
             for path in sorted(migrations_dir.glob("*.sql")):
                 version = path.name
                 if version in applied:
                     continue
 
                 sql_text = path.read_text(encoding="utf-8")
-                statements = [s.strip() for s in sql_text.split(";") if s.strip()]
-                for statement in statements:
-                    cur.execute(statement)
+                statements = _split_sql_statements(sql_text)
+                if sql_text.startswith(_NO_TRANSACTION_MARK):
+                    conn.autocommit = True
+                    try:
+                        for statement in statements:
+                            conn.execute(statement)
+                    finally:
+                        conn.autocommit = False
+                else:
+                    with conn.cursor() as cur:
+                        for statement in statements:
+                            cur.execute(statement)
 
-                cur.execute(
-                    "INSERT INTO schema_migrations (version) VALUES (%s);",
+                conn.execute(
+                    "INSERT INTO schema_migrations (version) VALUES (%s) ON CONFLICT (version) DO NOTHING;",
                     (version,),
                 )
-        conn.commit()
+                conn.commit()
+        finally:
+            if conn.info.transaction_status != TransactionStatus.IDLE:
+                conn.rollback()
+            conn.execute("SELECT pg_advisory_unlock(%s);", (_MIGRATION_LOCK_ID,))
+            conn.commit()
 
 
 def init_db():
@@ -0,0 +1,128 @@
+import logging
+import os
+import threading
+import time
+
+import psycopg
+from psycopg import sql
+
+from app.config import env_bool, env_float
+from app.db import _db_url
+
+# Cross-process cache invalidation over Postgres LISTEN/NOTIFY.
+#
+# Each worker process runs one daemon thread holding a dedicated autocommit
+# connection that LISTENs on every subscribed channel and hands payloads to
+# the subscribers. While that connection is down a notification could be
+# missed, so callers must check is_listening() and bypass their caches until
+# it is back; subscribers also get a ``None`` payload (meaning "drop
+# everything") whenever the connection is (re)established or lost.
+
+logger = logging.getLogger(__name__)
+
+_subscribers = {}
+_listening = set()
+_state_lock = threading.Lock()
+_thread = None
+_thread_pid = None
+
+
+def subscribe(channel: str, callback):
+    """Call ``callback(payload)`` for every NOTIFY on ``channel`` in this process."""
+    with _state_lock:
+        _subscribers.setdefault(channel, []).append(callback)
+
+
+def is_listening(channel: str) -> bool:
+    """True while this process is receiving notifications on ``channel``.
+
+    Starts the listener thread on first use in each process.
+    """
+    if not env_bool("DB_EVENTS_ENABLED", True):
+        return False
+    _ensure_started()
+    with _state_lock:
+        return channel in _listening
+
+
+def listener_stats():
+    with _state_lock:
+        return {
+            "running": _thread is not None and _thread_pid == os.getpid() and _thread.is_alive(),
+            "channels": sorted(_listening),
+        }
+
+
+def _ensure_started():
+    global _thread, _thread_pid
+    pid = os.getpid()
+    if _thread is not None and _thread_pid == pid:
+        return
+    with _state_lock:
+        if _thread is not None and _thread_pid == pid:
+            return
+        _listening.clear()
+        _thread = threading.Thread(target=_run, name="db-events-listener", daemon=True)
+        _thread_pid = pid
+        _thread.start()
+
+
+def _reset_in_child():
+    global _thread, _thread_pid, _state_lock
+    _state_lock = threading.Lock()
+    _thread = None
+    _thread_pid = None
+    _listening.clear()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_in_child)
+
+
+def _dispatch(channel, payload):
+    with _state_lock:
+        callbacks = list(_subscribers.get(channel, []))
+    for callback in callbacks:
+        try:
+            callback(payload)
+        except Exception:
+            logger.exception("db event subscriber failed on channel %s", channel)
+
+
+def _dispatch_reset(channels):
+    for channel in channels:
+        _dispatch(channel, None)
+
+
+def _listen_new_channels(conn):
+    with _state_lock:
+        pending = [c for c in _subscribers if c not in _listening]
+    for channel in pending:
+        conn.execute(sql.SQL("LISTEN {}").format(sql.Identifier(channel)))
+    if pending:
+        with _state_lock:
+            _listening.update(pending)
+        # Anything cached before LISTEN took effect may already be stale.
+        _dispatch_reset(pending)
+
+
+def _run():
+    poll_seconds = env_float("DB_EVENTS_POLL_SECONDS", 1.0)
+    backoff = 1.0
+    while True:
+        try:
+            with psycopg.connect(_db_url(), autocommit=True) as conn:
+                backoff = 1.0
+                while True:
+                    _listen_new_channels(conn)
+                    for notify in conn.notifies(timeout=poll_seconds):
+                        _dispatch(notify.channel, notify.payload)
+        except Exception:
+            logger.warning("db event listener disconnected; retrying in %.0fs", backoff, exc_info=True)
+        finally:
+            with _state_lock:
+                lost = list(_listening)
+                _listening.clear()
+            _dispatch_reset(lost)
+        time.sleep(backoff)
+        backoff = min(backoff * 2, 30.0)
@@ -0,0 +1,56 @@
+import threading
+
+from app import db_events
+
+# The public doctor directory (GET /api/doctors, /api/doctors/<id>) is read
+# far more often than doctors are edited, so each worker keeps one
+# serialized snapshot of it in memory. Writers call invalidate() after their
+# commit so their own worker reflects the change at once; a trigger on
+# doctors NOTIFYs DIRECTORY_CHANNEL so every other worker drops its snapshot
+# too. As with the weekly schedule cache, the snapshot is only trusted while
+# this worker is LISTENing; otherwise every request rebuilds it.
+DIRECTORY_CHANNEL = "doctor_directory"
+
+_snapshot = None
+_snapshot_lock = threading.Lock()
+_generation = 0
+
+
+def invalidate(payload=None):
+    """Drop the snapshot; also the db_events callback for DIRECTORY_CHANNEL."""
+    global _snapshot, _generation
+    with _snapshot_lock:
+        _generation += 1
+        _snapshot = None
+
+
+db_events.subscribe(DIRECTORY_CHANNEL, invalidate)
+
+
+def get_snapshot(build):
+    """Return the cached snapshot, calling ``build()`` to create it if needed.
+
+    ``build`` returns a dict with ``items`` (public doctors ordered by id),
+    ``by_id`` and ``by_specialty`` (lower-cased specialty -> items); the
+    snapshot adds ``version``, which changes whenever it is rebuilt.
+    """
+    global _snapshot
+    listening = db_events.is_listening(DIRECTORY_CHANNEL)
+    if listening:
+        with _snapshot_lock:
+            if _snapshot is not None:
+                return _snapshot
+            generation = _generation
+
+    snapshot = build()
+    if not listening:
+        return {**snapshot, "version": None}
+
+    with _snapshot_lock:
+        # A write that committed while we were reading may already have been
+        # announced; keep the stale build out of the cache.
+        if generation != _generation:
+            return {**snapshot, "version": None}
+        snapshot["version"] = generation
+        _snapshot = snapshot
+        return snapshot
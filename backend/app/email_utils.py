@@ -1,51 +1,159 @@
+import atexit
+import logging
 import os
-import smtplib
+import queue
+import random
+import threading
+import time
 from email.message import EmailMessage
 
+from app.config import env_float, env_int
+from app.resilience import CircuitOpenError
+from app.transports import get_email_transport, smtp_settings
+
 try:
     from flask import current_app
 except Exception:  # pragma: no cover - used only when flask context is absent
     current_app = None
 
+logger = logging.getLogger(__name__)
 
-def send_email(to_address: str, subject: str, body: str) -> bool:
-    host = os.getenv("SMTP_HOST") or ""
-    if not host.strip():
-        _log_warning("SMTP_HOST not set; skipping email send.")
-        return False
+# Emails are handed to a bounded in-process queue and sent by a few
+# background threads, each holding one session of the configured transport
+# (EMAIL_TRANSPORT); for SMTP that is a long-lived authenticated connection
+# reused across messages and re-opened when the server drops it. Like the DB
+# pool, the queue and its threads belong to one process and are re-created
+# lazily after a fork.
+_outbox = None
+_outbox_pid = None
+_outbox_lock = threading.Lock()
 
-    port = int(os.getenv("SMTP_PORT", "587"))
-    username = os.getenv("SMTP_USER") or os.getenv("SMTP_USERNAME") or ""
-    password = os.getenv("SMTP_PASSWORD") or ""
-    from_address = os.getenv("SMTP_FROM") or username or "no-reply@medconnect.local"
 
-    use_ssl = os.getenv("SMTP_USE_SSL", "false").strip().lower() in {"1", "true", "yes"}
-    use_tls = os.getenv("SMTP_USE_TLS", "true").strip().lower() not in {"0", "false", "no"}
+def send_email(to_address: str, subject: str, body: str) -> bool:
+    """Queue an email for background delivery.
+
+    Returns False when the transport is not configured or the queue is
+    full; the caller never waits on the mail server.
+    """
+    reason = get_email_transport().unavailable_reason()
+    if reason:
+        _log_warning(f"{reason}; skipping email send.")
+        return False
 
     msg = EmailMessage()
     msg["Subject"] = subject
-    msg["From"] = from_address
+    msg["From"] = smtp_settings()["from_address"]
     msg["To"] = to_address
     msg.set_content(body or "")
 
     try:
-        if use_ssl:
-            server = smtplib.SMTP_SSL(host, port, timeout=10)
-        else:
-            server = smtplib.SMTP(host, port, timeout=10)
-
-        with server:
-            server.ehlo()
-            if use_tls and not use_ssl:
-                server.starttls()
-                server.ehlo()
-            if username and password:
-                server.login(username, password)
-            server.send_message(msg)
-        return True
-    except Exception as exc:
-        _log_exception("Email send failed", exc)
+        _get_outbox().put_nowait(msg)
+    except queue.Full:
+        _log_warning("Email queue is full; dropping message.")
         return False
+    return True
+
+
+def flush_emails(timeout: float = None) -> bool:
+    """Wait until queued emails have been handed to the transport; True if drained in time."""
+    outbox = _outbox
+    if outbox is None or _outbox_pid != os.getpid():
+        return True
+    if timeout is None:
+        timeout = env_float("EMAIL_FLUSH_TIMEOUT", 10.0)
+    deadline = time.monotonic() + timeout
+    while outbox.unfinished_tasks:
+        if time.monotonic() >= deadline:
+            return False
+        time.sleep(0.05)
+    return True
+
+
+def _get_outbox():
+    global _outbox, _outbox_pid
+    pid = os.getpid()
+    if _outbox is None or _outbox_pid != pid:
+        with _outbox_lock:
+            if _outbox is None or _outbox_pid != pid:
+                outbox = queue.Queue(maxsize=env_int("EMAIL_QUEUE_SIZE", 1000))
+                for i in range(max(1, env_int("EMAIL_SMTP_CONNECTIONS", 2))):
+                    worker = _SendWorker(outbox)
+                    threading.Thread(target=worker.run, name=f"email-{i}", daemon=True).start()
+                _outbox = outbox
+                _outbox_pid = pid
+    return _outbox
+
+
+def _reset_outbox_in_child():
+    global _outbox, _outbox_pid, _outbox_lock
+    _outbox = None
+    _outbox_pid = None
+    _outbox_lock = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_outbox_in_child)
+
+atexit.register(flush_emails)
+
+
+class _SendWorker:
+    def __init__(self, outbox):
+        self.outbox = outbox
+        self.session = None
+        self.batch_size = max(1, env_int("EMAIL_BATCH_SIZE", 20))
+        self.idle_seconds = env_float("EMAIL_SMTP_IDLE_SECONDS", 60.0)
+        self.max_defer_seconds = env_float("EMAIL_MAX_DEFER_SECONDS", 300.0)
+
+    def run(self):
+        while True:
+            try:
+                first = self.outbox.get(timeout=self.idle_seconds)
+            except queue.Empty:
+                # Servers drop idle sessions anyway; release ours first.
+                self._close()
+                continue
+            batch = [first]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.outbox.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self._send_batch(batch)
+            finally:
+                for _ in batch:
+                    self.outbox.task_done()
+
+    def _send_batch(self, batch):
+        for msg in batch:
+            self._send(msg)
+
+    def _send(self, msg):
+        # While the relay's circuit is open, hold the message and wait for
+        # the half-open probe; the queue is bounded, so new emails are
+        # dropped rather than piling up if the outage lasts.
+        deadline = time.monotonic() + self.max_defer_seconds
+        while True:
+            try:
+                if self.session is None:
+                    self.session = get_email_transport().open_session()
+                self.session.send(msg)
+                return
+            except CircuitOpenError as exc:
+                if time.monotonic() + exc.retry_after > deadline:
+                    logger.error("Email to %s dropped: %s", msg.get("To"), exc)
+                    return
+                time.sleep(exc.retry_after + random.uniform(0, 1))
+            except Exception:
+                logger.exception("Email send failed to %s", msg.get("To"))
+                return
+
+    def _close(self):
+        session = self.session
+        self.session = None
+        if session is not None:
+            session.close()
 
 
 def _log_warning(message: str) -> None:
@@ -54,9 +162,3 @@ def _log_warning(message: str) -> None:
     else:
         print(message)
 
-
-def _log_exception(message: str, exc: Exception) -> None:
-    if current_app:
-        current_app.logger.exception("%s: %s", message, exc)
-    else:
-        print(f"{message}: {exc}")
@@ -0,0 +1,53 @@
+import functools
+import hashlib
+import json
+
+from flask import current_app, make_response, request
+
+from app.config import env_int
+
+# Conditional GETs for the public catalogue (doctors, lab packages, weekly
+# availability). Each endpoint supplies a strong ETag computed from a cheap
+# version (a cached content digest or MAX(updated_at)); when the client
+# already holds it we answer 304 before the view runs or serializes
+# anything. Cache-Control lets browsers and a CDN reuse a response for
+# CATALOGUE_MAX_AGE seconds and serve it stale while revalidating for
+# CATALOGUE_STALE_WHILE_REVALIDATE more.
+
+
+def make_etag(*parts) -> str:
+    """Digest ``parts`` (anything JSON can render) into an ETag value."""
+    raw = json.dumps(parts, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.blake2b(raw.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def _cache_control() -> str:
+    max_age = env_int("CATALOGUE_MAX_AGE", 60)
+    stale = env_int("CATALOGUE_STALE_WHILE_REVALIDATE", 300)
+    return f"public, max-age={max_age}, stale-while-revalidate={stale}"
+
+
+def conditional(get_etag):
+    """Decorate a GET view with ETag / If-None-Match handling.
+
+    ``get_etag(**view_args)`` returns the current ETag, or None to run the
+    view without caching (e.g. for a resource that does not exist). Only
+    200 responses are marked cacheable.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            etag = get_etag(*args, **kwargs)
+            if etag is None:
+                return view(*args, **kwargs)
+            if request.if_none_match.contains_weak(etag):
+                response = current_app.response_class(status=304)
+            else:
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+            response.set_etag(etag)
+            response.headers["Cache-Control"] = _cache_control()
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,82 @@
+import datetime
+import decimal
+import uuid
+
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # optional: without it responses use Flask's stdlib encoder
+    orjson = None
+
+# Flask's JSON provider, backed by orjson when it is installed. Output matches
+# what jsonify produced before: sorted keys, compact separators, dates and
+# datetimes as RFC 822 (http_date) and Decimal/UUID as strings; TIME values,
+# which the stdlib encoder rejected, are rendered in ISO format.
+
+
+_WEEKDAYS = ("Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun")
+_MONTHS = ("Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec")
+
+
+def http_date(value) -> str:
+    """werkzeug.http.http_date without the email.utils round trip.
+
+    Naive datetimes and plain dates are taken as UTC, as werkzeug does.
+    """
+    if isinstance(value, datetime.datetime):
+        if value.tzinfo is not None:
+            value = value.astimezone(datetime.timezone.utc)
+        hour, minute, second = value.hour, value.minute, value.second
+    else:
+        hour = minute = second = 0
+    return (
+        f"{_WEEKDAYS[value.weekday()]}, {value.day:02d} {_MONTHS[value.month - 1]} "
+        f"{value.year:04d} {hour:02d}:{minute:02d}:{second:02d} GMT"
+    )
+
+
+def _default(o):
+    if isinstance(o, datetime.date):
+        return http_date(o)
+    if isinstance(o, datetime.time):
+        return o.isoformat()
+    if isinstance(o, (decimal.Decimal, uuid.UUID)):
+        return str(o)
+    if hasattr(o, "__html__"):
+        return str(o.__html__())
+    raise TypeError(f"Object of type {type(o).__name__} is not JSON serializable")
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    default = staticmethod(_default)
+
+    def _options(self):
+        # Datetimes go through _default so they keep the http_date format.
+        options = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+        if self.sort_keys:
+            options |= orjson.OPT_SORT_KEYS
+        return options
+
+    def dumps_bytes(self, obj) -> bytes:
+        if orjson is None:
+            return super().dumps(obj, separators=(",", ":")).encode("utf-8")
+        return orjson.dumps(obj, default=_default, option=self._options())
+
+    def dumps(self, obj, **kwargs):
+        # Keyword arguments (indent, separators, ...) are stdlib-only.
+        if orjson is None or kwargs:
+            return super().dumps(obj, **kwargs)
+        return orjson.dumps(obj, default=_default, option=self._options()).decode("utf-8")
+
+    def loads(self, s, **kwargs):
+        if orjson is None or kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        pretty = (self.compact is None and self._app.debug) or self.compact is False
+        if orjson is None or pretty:
+            return super().response(*args, **kwargs)
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(self.dumps_bytes(obj) + b"\n", mimetype=self.mimetype)
@@ -0,0 +1,450 @@
+import atexit
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+import uuid
+
+from flask import request
+
+try:
+    import fcntl
+except ImportError:  # not on Windows; there the dev server is a single process
+    fcntl = None
+
+from app.config import env_bool, env_float, env_str
+
+# Request and provider metrics in Prometheus text format.
+#
+# Each process (every gunicorn worker, the SMS dispatcher) records into its
+# own in-memory registry and a background thread writes it to
+# METRICS_DIR/<pid>.json every METRICS_FLUSH_SECONDS. GET /metrics merges
+# the snapshots of all processes: counters and histograms are summed
+# across every file, so totals survive worker restarts, while gauges (in
+# flight requests, pool size) only count processes that are still alive.
+# Snapshots of processes that have exited (or whose pid was reused) are
+# folded into METRICS_DIR/retired.json and deleted, so a scrape reads one
+# file per live process plus that aggregate.
+
+logger = logging.getLogger(__name__)
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# name -> (type, help)
+METRICS = {
+    "medconnect_http_requests_total": ("counter", "HTTP requests by endpoint and status."),
+    "medconnect_http_request_duration_seconds": ("histogram", "Time to build a response."),
+    "medconnect_http_requests_in_flight": ("gauge", "Requests being handled right now."),
+    "medconnect_http_request_db_seconds_total": ("counter", "Time requests spent waiting on queries."),
+    "medconnect_http_request_python_seconds_total": ("counter", "Request time spent outside queries."),
+    "medconnect_db_queries_total": ("counter", "Queries executed by requests."),
+    "medconnect_db_connection_checkouts_total": ("counter", "Pool connections checked out by requests."),
+    "medconnect_db_slow_queries_total": ("counter", "Statements over DB_SLOW_QUERY_MS, by origin."),
+    "medconnect_db_repeated_queries_total": ("counter", "Requests that repeated one statement shape (N+1)."),
+    "medconnect_db_pool_connections": ("gauge", "Connections held by the pool, by state."),
+    "medconnect_db_pool_connections_opened_total": ("counter", "Connections the pool has opened."),
+    "medconnect_outbound_duration_seconds": ("histogram", "Duration of calls to SMS/email providers."),
+    "medconnect_outbound_rejected_total": ("counter", "Provider calls skipped by an open circuit."),
+    "medconnect_outbound_circuit_open": ("gauge", "1 while a provider circuit is open."),
+}
+
+_lock = threading.Lock()
+_counters = {}
+_histograms = {}
+_gauges = {}
+_collectors = []
+_current = threading.local()
+
+_token = uuid.uuid4().hex
+_writer_pid = None
+
+
+def _labels(labels) -> tuple:
+    return tuple(sorted((labels or {}).items()))
+
+
+def inc(name: str, labels=None, value: float = 1.0):
+    key = (name, _labels(labels))
+    with _lock:
+        _counters[key] = _counters.get(key, 0.0) + value
+    _ensure_writer()
+
+
+def set_total(name: str, labels=None, value: float = 0.0):
+    """Set a counter kept elsewhere (e.g. by the pool) to its current total."""
+    key = (name, _labels(labels))
+    with _lock:
+        _counters[key] = float(value)
+
+
+def set_gauge(name: str, labels=None, value: float = 0.0):
+    key = (name, _labels(labels))
+    with _lock:
+        _gauges[key] = float(value)
+
+
+def add_gauge(name: str, labels=None, value: float = 1.0):
+    key = (name, _labels(labels))
+    with _lock:
+        _gauges[key] = _gauges.get(key, 0.0) + value
+
+
+def observe(name: str, labels, seconds: float):
+    key = (name, _labels(labels))
+    with _lock:
+        hist = _histograms.get(key)
+        if hist is None:
+            hist = _histograms[key] = [0] * (len(BUCKETS) + 1) + [0.0]
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                hist[i] += 1
+                break
+        else:
+            hist[len(BUCKETS)] += 1
+        hist[-1] += seconds
+    _ensure_writer()
+
+
+def register_collector(fn):
+    """Call ``fn()`` before every snapshot, to refresh gauges read from elsewhere."""
+    _collectors.append(fn)
+
+
+# -- per request ------------------------------------------------------------
+
+def record_query(seconds: float, query=None):
+    """Called by the DB cursor after each execute()."""
+    state = getattr(_current, "request", None)
+    if state is not None:
+        state["db"] += seconds
+        # The pool's connection check runs an empty statement.
+        if query != "":
+            state["queries"] += 1
+
+
+def record_checkout():
+    state = getattr(_current, "request", None)
+    if state is not None:
+        state["checkouts"] += 1
+
+
+def _before_request():
+    _current.request = {"started": time.perf_counter(), "db": 0.0, "queries": 0,
+                        "checkouts": 0, "status": 500}
+    add_gauge("medconnect_http_requests_in_flight")
+
+
+def _after_request(response):
+    state = getattr(_current, "request", None)
+    if state is not None:
+        state["status"] = response.status_code
+    return response
+
+
+def _teardown_request(exc=None):
+    state = getattr(_current, "request", None)
+    if state is None:
+        return
+    _current.request = None
+    add_gauge("medconnect_http_requests_in_flight", value=-1)
+
+    elapsed = time.perf_counter() - state["started"]
+    labels = {"blueprint": request.blueprint or "app",
+              "endpoint": request.endpoint or "unmatched",
+              "method": request.method}
+    inc("medconnect_http_requests_total", {**labels, "status": str(state["status"])})
+    observe("medconnect_http_request_duration_seconds", labels, elapsed)
+    inc("medconnect_http_request_db_seconds_total", labels, state["db"])
+    inc("medconnect_http_request_python_seconds_total", labels, max(0.0, elapsed - state["db"]))
+    inc("medconnect_db_queries_total", labels, state["queries"])
+    inc("medconnect_db_connection_checkouts_total", labels, state["checkouts"])
+
+
+def init_app(app):
+    if not env_bool("METRICS_ENABLED", True):
+        return
+    # Durations are taken at teardown, so they include the commit done in
+    # db's after_request.
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+    app.teardown_request(_teardown_request)
+
+
+# -- snapshots ---------------------------------------------------------------
+
+def _metrics_dir():
+    return env_str("METRICS_DIR", os.path.join(tempfile.gettempdir(), "medconnect-metrics"))
+
+
+def _snapshot():
+    for collector in list(_collectors):
+        try:
+            collector()
+        except Exception:
+            logger.exception("metrics collector failed")
+    with _lock:
+        return {
+            "pid": os.getpid(),
+            "token": _token,
+            "counters": [[name, labels, value] for (name, labels), value in _counters.items()],
+            "histograms": [[name, labels, hist] for (name, labels), hist in _histograms.items()],
+            "gauges": [[name, labels, value] for (name, labels), value in _gauges.items()],
+        }
+
+
+def _snapshot_path(pid) -> str:
+    return os.path.join(_metrics_dir(), f"{pid}.json")
+
+
+def flush():
+    """Write this process's snapshot to METRICS_DIR."""
+    path = _snapshot_path(os.getpid())
+    snapshot = _snapshot()
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        _write_json(path, snapshot)
+    except OSError as exc:
+        logger.warning("Could not write metrics snapshot %s: %s", path, exc)
+
+
+_RETIRED = "retired.json"
+# Tokens already folded into retired.json, so a crash between writing it and
+# deleting the source file cannot count a snapshot twice.
+_RETIRED_TOKENS_KEPT = 1000
+
+
+def _read_json(path):
+    try:
+        with open(path, encoding="utf-8") as fh:
+            return json.load(fh)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_json(path, data):
+    tmp = f"{path}.{_token}.tmp"
+    with open(tmp, "w", encoding="utf-8") as fh:
+        json.dump(data, fh, separators=(",", ":"))
+    os.replace(tmp, path)
+
+
+class _DirectoryLock:
+    """flock on METRICS_DIR/.lock, so only one process compacts at a time."""
+
+    def __init__(self, directory):
+        self.path = os.path.join(directory, ".lock")
+        self.fh = None
+
+    def __enter__(self):
+        if fcntl is not None:
+            self.fh = open(self.path, "a")
+            fcntl.flock(self.fh, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        if self.fh is not None:
+            fcntl.flock(self.fh, fcntl.LOCK_UN)
+            self.fh.close()
+
+
+def _retire(directory, paths):
+    """Fold the counters and histograms of ``paths`` into retired.json, then delete them."""
+    retired_path = os.path.join(directory, _RETIRED)
+    retired = _read_json(retired_path) or {"tokens": []}
+    seen = set(retired.get("tokens", []))
+    merged = [retired]
+    for path in paths:
+        snapshot = _read_json(path)
+        if snapshot is not None and snapshot.get("token") not in seen:
+            snapshot["gauges"] = []
+            merged.append(snapshot)
+            seen.add(snapshot.get("token"))
+    if len(merged) > 1:
+        counters, histograms, _ = _merge(merged)
+        tokens = retired.get("tokens", []) + [s.get("token") for s in merged[1:]]
+        _write_json(retired_path, {
+            "token": "retired",
+            "tokens": tokens[-_RETIRED_TOKENS_KEPT:],
+            "counters": [[name, labels, value] for (name, labels), value in counters.items()],
+            "histograms": [[name, labels, hist] for (name, labels), hist in histograms.items()],
+            "gauges": [],
+        })
+    for path in paths:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def _snapshot_pid(filename):
+    stem = filename.split(".", 1)[0]
+    return int(stem) if stem.isdigit() else None
+
+
+def _compact(directory, names):
+    """Retire snapshots (and stray temp files) of processes that have exited.
+
+    Runs with the directory lock held; returns the names still present.
+    """
+    snapshots, leftovers, kept = [], [], []
+    for filename in names:
+        pid = _snapshot_pid(filename)
+        if pid is None or pid == os.getpid() or _is_alive(pid):
+            kept.append(filename)
+        elif filename.endswith(".json"):
+            snapshots.append(os.path.join(directory, filename))
+        else:
+            leftovers.append(os.path.join(directory, filename))
+    if snapshots:
+        _retire(directory, snapshots)
+        if _RETIRED not in kept:
+            kept.append(_RETIRED)
+    for path in leftovers:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+    return kept
+
+
+def _retire_previous_owner():
+    # A file left by an earlier process with the same pid is folded into
+    # retired.json rather than overwritten.
+    path = _snapshot_path(os.getpid())
+    snapshot = _read_json(path)
+    if snapshot is None or snapshot.get("token") == _token:
+        return
+    directory = _metrics_dir()
+    try:
+        os.makedirs(directory, exist_ok=True)
+        with _DirectoryLock(directory):
+            _retire(directory, [path])
+    except OSError as exc:
+        logger.warning("Could not retire metrics snapshot %s: %s", path, exc)
+
+
+def _writer_loop(interval: float):
+    while True:
+        time.sleep(interval)
+        flush()
+
+
+def _ensure_writer():
+    global _writer_pid
+    pid = os.getpid()
+    if _writer_pid == pid:
+        return
+    with _lock:
+        if _writer_pid == pid:
+            return
+        _writer_pid = pid
+    _retire_previous_owner()
+    interval = env_float("METRICS_FLUSH_SECONDS", 5.0)
+    threading.Thread(target=_writer_loop, args=(interval,), name="metrics-writer", daemon=True).start()
+    atexit.register(flush)
+
+
+def _reset_in_child():
+    global _lock, _counters, _histograms, _gauges, _token, _writer_pid
+    _lock = threading.Lock()
+    _counters, _histograms, _gauges = {}, {}, {}
+    _token = uuid.uuid4().hex
+    _writer_pid = None
+    _current.request = None
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_in_child)
+
+
+# -- exposition ---------------------------------------------------------------
+
+def _is_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _load_snapshots():
+    own = _snapshot()
+    snapshots = [own]
+    directory = _metrics_dir()
+    if not os.path.isdir(directory):
+        return snapshots
+    try:
+        # Compacting and reading under one lock, so a scrape never sees a
+        # snapshot both on its own and inside retired.json.
+        with _DirectoryLock(directory):
+            names = _compact(directory, os.listdir(directory))
+            for filename in names:
+                if not filename.endswith(".json"):
+                    continue
+                snapshot = _read_json(os.path.join(directory, filename))
+                if snapshot is None or snapshot.get("token") == own["token"]:
+                    continue
+                snapshots.append(snapshot)
+    except OSError as exc:
+        logger.warning("Could not read metrics snapshots in %s: %s", directory, exc)
+    return snapshots
+
+
+def _merge(snapshots):
+    counters, histograms, gauges = {}, {}, {}
+    for snapshot in snapshots:
+        for name, labels, value in snapshot.get("counters", []):
+            key = (name, tuple(map(tuple, labels)))
+            counters[key] = counters.get(key, 0.0) + value
+        for name, labels, value in snapshot.get("gauges", []):
+            key = (name, tuple(map(tuple, labels)))
+            gauges[key] = gauges.get(key, 0.0) + value
+        for name, labels, hist in snapshot.get("histograms", []):
+            key = (name, tuple(map(tuple, labels)))
+            total = histograms.get(key)
+            histograms[key] = list(hist) if total is None else [a + b for a, b in zip(total, hist)]
+    return counters, histograms, gauges
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels, extra=()) -> str:
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in pairs) + "}"
+
+
+def _format_value(value) -> str:
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+def render() -> str:
+    """All processes' metrics in the Prometheus text exposition format."""
+    counters, histograms, gauges = _merge(_load_snapshots())
+    lines = []
+    for name, (kind, help_text) in METRICS.items():
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        if kind == "histogram":
+            for (metric, labels), hist in sorted(histograms.items()):
+                if metric != name:
+                    continue
+                cumulative = 0
+                for bound, count in zip(BUCKETS + ("+Inf",), hist[:-1]):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{_format_labels(labels, [('le', bound)])} {cumulative}")
+                lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(hist[-1])}")
+                lines.append(f"{name}_count{_format_labels(labels)} {cumulative}")
+            continue
+        values = counters if kind == "counter" else gauges
+        for (metric, labels), value in sorted(values.items()):
+            if metric == name:
+                lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+    return "\n".join(lines) + "\n"
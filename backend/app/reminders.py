@@ -0,0 +1,112 @@
+"""Queue next-day appointment reminders for every doctor.
+
+Run once a day, e.g. ``python -m app.reminders`` from a cron job; ``--date``
+picks another day and ``--send`` also runs the SMS dispatcher until the
+queue is drained. Appointments that already have a reminder (queued, sent,
+or sent by a doctor from the dashboard) are skipped, so re-running the job
+for the same day only picks up new bookings.
+"""
+import argparse
+import datetime
+import logging
+
+from app.db import close_pool, get_connection
+from app.routes.utils import format_date, format_time, parse_date
+from app.sms_outbox import reminder_text
+
+logger = logging.getLogger("reminders")
+
+TEMPLATE_KEY = "reminder"
+# Arbitrary constant for pg_advisory_xact_lock so two runs never overlap.
+REMINDER_LOCK_KEY = 72010014
+
+
+def queue_reminders(target_date: datetime.date):
+    """Queue reminders for ``target_date``; returns (queued, missing_phone) or None if another run holds the lock."""
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT pg_try_advisory_xact_lock(%s) AS locked", (REMINDER_LOCK_KEY,))
+            if not cur.fetchone().get("locked"):
+                return None
+
+            cur.execute(
+                """
+                SELECT a.id, a.doctor_id, a.doctor, a.date, a.time, a.phone
+                FROM appointments a
+                WHERE a.date = %s
+                  AND LOWER(a.status) <> 'cancelled'
+                  AND NOT EXISTS (
+                      SELECT 1 FROM sms_outbox o
+                      WHERE o.appointment_id = a.id
+                        AND o.template_key = %s
+                        AND o.status <> 'failed'
+                  )
+                  AND NOT EXISTS (
+                      SELECT 1 FROM doctor_notify_logs l
+                      WHERE l.appointment_id = a.id
+                        AND l.template_key = %s
+                        AND l.sent
+                  )
+                ORDER BY a.time ASC, a.id ASC
+                """,
+                (target_date, TEMPLATE_KEY, TEMPLATE_KEY),
+            )
+            rows = cur.fetchall() or []
+
+            outbox_rows = []
+            missing_phone = 0
+            for row in rows:
+                phone = str(row.get("phone") or "").strip()
+                if not phone:
+                    missing_phone += 1
+                    continue
+                body = reminder_text(row.get("doctor"), format_date(row.get("date")), format_time(row.get("time")))
+                outbox_rows.append((phone, body, TEMPLATE_KEY, row.get("id"), row.get("doctor_id")))
+
+            if outbox_rows:
+                cur.executemany(
+                    """
+                    INSERT INTO sms_outbox
+                        (to_phone, body, template_key, appointment_id, doctor_id)
+                    VALUES
+                        (%s, %s, %s, %s, %s)
+                    """,
+                    outbox_rows,
+                )
+    return len(outbox_rows), missing_phone
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Queue next-day appointment reminders.")
+    parser.add_argument("--date", help="appointment date to remind about (YYYY-MM-DD, default: tomorrow)")
+    parser.add_argument("--send", action="store_true", help="run the SMS dispatcher until the queue is drained")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(levelname)s %(message)s")
+
+    if args.date:
+        target_date = parse_date(args.date)
+        if target_date is None:
+            parser.error("--date must be a date (YYYY-MM-DD)")
+    else:
+        target_date = datetime.date.today() + datetime.timedelta(days=1)
+
+    try:
+        result = queue_reminders(target_date)
+        if result is None:
+            logger.warning("another reminder run is in progress; nothing queued")
+            return 1
+        queued, missing_phone = result
+        logger.info("reminders for %s: %d queued, %d without a phone number", target_date, queued, missing_phone)
+
+        if args.send:
+            from app.sms_dispatcher import run
+
+            run(once=True)
+    finally:
+        close_pool()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,229 @@
+import logging
+import os
+import random
+import threading
+import time
+
+from app import metrics
+from app.config import env_float, env_int
+
+# Guards for calls to outbound providers (Twilio, SMTP).
+#
+# Each provider gets a circuit breaker: after BREAKER_FAILURE_THRESHOLD
+# consecutive failures it opens and calls fail fast with CircuitOpenError
+# for BREAKER_RESET_SECONDS, then lets a single probe call through
+# (half-open) and closes again if that succeeds. Retries are jittered and
+# drawn from one process-wide budget, so a degraded provider cannot multiply
+# the load it is already failing under. State lives per process; counters
+# are exposed through stats().
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    def __init__(self, name: str, retry_at: float):
+        super().__init__(f"{name} circuit is open")
+        self.name = name
+        self.retry_at = retry_at
+
+    @property
+    def retry_after(self) -> float:
+        return max(0.0, self.retry_at - time.monotonic())
+
+
+class CircuitBreaker:
+    def __init__(self, name: str, failure_threshold: int = None, reset_seconds: float = None):
+        self.name = name
+        self.failure_threshold = failure_threshold or env_int("BREAKER_FAILURE_THRESHOLD", 5)
+        self.reset_seconds = reset_seconds or env_float("BREAKER_RESET_SECONDS", 30.0)
+        self._lock = threading.Lock()
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self._probe_in_flight = False
+        self.counters = {"calls": 0, "successes": 0, "failures": 0, "rejected": 0, "opened": 0}
+        self.last_error = None
+
+    def before_call(self):
+        """Raise CircuitOpenError unless a call may go through now."""
+        with self._lock:
+            if self.state == OPEN and time.monotonic() - self.opened_at >= self.reset_seconds:
+                self.state = HALF_OPEN
+                self._probe_in_flight = False
+            if self.state == OPEN or (self.state == HALF_OPEN and self._probe_in_flight):
+                self.counters["rejected"] += 1
+                raise CircuitOpenError(self.name, self._retry_at())
+            if self.state == HALF_OPEN:
+                self._probe_in_flight = True
+            self.counters["calls"] += 1
+
+    def record_success(self):
+        with self._lock:
+            self.counters["successes"] += 1
+            self.consecutive_failures = 0
+            if self.state != CLOSED:
+                logger.info("%s circuit closed", self.name)
+            self.state = CLOSED
+            self._probe_in_flight = False
+
+    def record_failure(self, error=None):
+        with self._lock:
+            self.counters["failures"] += 1
+            self.consecutive_failures += 1
+            self.last_error = str(error) if error is not None else None
+            if self.state == HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+                if self.state != OPEN:
+                    self.counters["opened"] += 1
+                    logger.warning("%s circuit opened after %d failures: %s",
+                                   self.name, self.consecutive_failures, self.last_error)
+                self.state = OPEN
+                self.opened_at = time.monotonic()
+            self._probe_in_flight = False
+
+    def is_open(self) -> bool:
+        with self._lock:
+            return self.state == OPEN and time.monotonic() - self.opened_at < self.reset_seconds
+
+    def _retry_at(self) -> float:
+        if self.opened_at is None:
+            return time.monotonic()
+        return self.opened_at + self.reset_seconds
+
+    def stats(self):
+        with self._lock:
+            return {
+                "state": self.state,
+                "consecutive_failures": self.consecutive_failures,
+                "retry_in_seconds": round(max(0.0, self._retry_at() - time.monotonic()), 1)
+                if self.state == OPEN else 0.0,
+                "last_error": self.last_error,
+                **self.counters,
+            }
+
+
+class RetryBudget:
+    """Token bucket shared by every provider: each first attempt earns
+    ``ratio`` tokens and each retry spends one, so retries stay a bounded
+    fraction of traffic. ``min_tokens`` keeps a trickle available when idle."""
+
+    def __init__(self, ratio: float = None, min_tokens: float = None, max_tokens: float = None):
+        self.ratio = ratio if ratio is not None else env_float("RETRY_BUDGET_RATIO", 0.2)
+        self.min_tokens = min_tokens if min_tokens is not None else env_float("RETRY_BUDGET_MIN", 10.0)
+        self.max_tokens = max_tokens if max_tokens is not None else env_float("RETRY_BUDGET_MAX", 100.0)
+        self._lock = threading.Lock()
+        self.tokens = self.min_tokens
+        self.counters = {"granted": 0, "denied": 0}
+
+    def record_attempt(self):
+        with self._lock:
+            self.tokens = min(self.max_tokens, self.tokens + self.ratio)
+
+    def try_spend(self) -> bool:
+        with self._lock:
+            if self.tokens >= 1.0:
+                self.tokens -= 1.0
+                self.counters["granted"] += 1
+                return True
+            self.counters["denied"] += 1
+            return False
+
+    def stats(self):
+        with self._lock:
+            return {"tokens": round(self.tokens, 2), "ratio": self.ratio, **self.counters}
+
+
+_breakers = {}
+_registry_lock = threading.Lock()
+_budget = RetryBudget()
+
+
+def breaker(name: str) -> CircuitBreaker:
+    with _registry_lock:
+        if name not in _breakers:
+            _breakers[name] = CircuitBreaker(name)
+        return _breakers[name]
+
+
+def backoff_delay(attempt: int, base: float = None, cap: float = None) -> float:
+    """Full-jitter exponential backoff for retry number ``attempt`` (1-based)."""
+    base = base if base is not None else env_float("RETRY_BASE_SECONDS", 0.2)
+    cap = cap if cap is not None else env_float("RETRY_MAX_SECONDS", 2.0)
+    return random.uniform(0, min(cap, base * (2 ** (attempt - 1))))
+
+
+def call(name: str, fn, retries: int = None, is_retryable=None):
+    """Run ``fn()`` behind the ``name`` breaker with budgeted, jittered retries.
+
+    ``is_retryable(exc)`` decides whether a failure is worth another try and
+    whether it counts against the breaker (caller errors such as a rejected
+    recipient say nothing about provider health). Raises CircuitOpenError
+    only when ``fn`` was never called because the breaker is open; if the
+    breaker opens between retries, the last real error is raised instead,
+    since that attempt may already have reached the provider.
+    """
+    retries = retries if retries is not None else env_int("PROVIDER_RETRIES", 2)
+    cb = breaker(name)
+    _budget.record_attempt()
+    attempt = 0
+    last_error = None
+    while True:
+        try:
+            cb.before_call()
+        except CircuitOpenError:
+            metrics.inc("medconnect_outbound_rejected_total", {"provider": name})
+            if last_error is not None:
+                raise last_error from None
+            raise
+        started = time.perf_counter()
+        try:
+            result = fn()
+        except Exception as exc:
+            metrics.observe("medconnect_outbound_duration_seconds",
+                            {"provider": name, "outcome": "error"}, time.perf_counter() - started)
+            last_error = exc
+            retryable = is_retryable(exc) if is_retryable else True
+            if retryable:
+                cb.record_failure(exc)
+            else:
+                cb.record_success()
+            if not retryable or attempt >= retries or not _budget.try_spend():
+                raise
+            attempt += 1
+            time.sleep(backoff_delay(attempt))
+            continue
+        metrics.observe("medconnect_outbound_duration_seconds",
+                        {"provider": name, "outcome": "ok"}, time.perf_counter() - started)
+        cb.record_success()
+        return result
+
+
+def _reset_in_child():
+    global _registry_lock
+    _registry_lock = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_in_child)
+
+
+def _breaker_metrics():
+    with _registry_lock:
+        breakers = dict(_breakers)
+    for name, cb in breakers.items():
+        metrics.set_gauge("medconnect_outbound_circuit_open", {"provider": name}, 1 if cb.is_open() else 0)
+
+
+metrics.register_collector(_breaker_metrics)
+
+
+def stats():
+    with _registry_lock:
+        breakers = dict(_breakers)
+    return {
+        "breakers": {name: cb.stats() for name, cb in sorted(breakers.items())},
+        "retry_budget": _budget.stats(),
+    }
@@ -1,10 +1,20 @@
-import csv
-import io
 from flask import Blueprint, jsonify, request, session, Response
-
-from app.db import get_connection
-from app.routes.utils import success_response, error_response
-from sms import send_sms
+import datetime
+from psycopg.errors import UniqueViolation
+
+from app import availability_engine as engine
+from app.db import get_db, stream_copy
+from app.sms_outbox import enqueue_sms, queued_response
+from app.routes.utils import (
+    success_response,
+    error_response,
+    parse_date,
+    parse_time,
+    serialize_appointment,
+    parse_page_limit,
+    encode_cursor,
+    decode_cursor,
+)
 
 appointments_bp = Blueprint("appointments", __name__)
 
@@ -19,25 +29,26 @@ def _require_admin():
 
 
 def fetch_doctor(doctor_id: int):
-    with get_connection() as conn:
-        with conn.cursor() as cur:
-            cur.execute(
-                """
-                SELECT id, full_name, specialty, is_active
-                FROM doctors
-                WHERE id = %s
-                LIMIT 1
-                """,
-                (doctor_id,),
-            )
-            return cur.fetchone()
+    with get_db().cursor() as cur:
+        cur.execute(
+            """
+            SELECT id, full_name, specialty, is_active
+            FROM doctors
+            WHERE id = %s
+            LIMIT 1
+            """,
+            (doctor_id,),
+        )
+        return cur.fetchone()
 
 
-def fetch_one(appt_id: int):
-    with get_connection() as conn:
-        with conn.cursor() as cur:
-            cur.execute("SELECT * FROM appointments WHERE id = %s", (appt_id,))
-            return cur.fetchone()
+def fetch_one(appt_id: int, for_update: bool = False):
+    sql = "SELECT * FROM appointments WHERE id = %s"
+    if for_update:
+        sql += " FOR UPDATE"
+    with get_db().cursor() as cur:
+        cur.execute(sql, (appt_id,))
+        return cur.fetchone()
 
 
 @appointments_bp.get("/api/admin/appointments/export")
@@ -67,60 +78,43 @@ def admin_export_appointments():
             return error_response(400, "validation_error", "doctor_id must be an integer")
 
     if from_date:
+        start = parse_date(from_date)
+        if start is None:
+            return error_response(400, "validation_error", "from must be a date (YYYY-MM-DD)")
         where.append("date >= %s")
-        params.append(from_date)
+        params.append(start)
 
     if to_date:
+        end = parse_date(to_date)
+        if end is None:
+            return error_response(400, "validation_error", "to must be a date (YYYY-MM-DD)")
         where.append("date <= %s")
-        params.append(to_date)
+        params.append(end)
 
+    # Column aliases double as the CSV header row.
     sql = """
-        SELECT id, date, time, name, email, phone, doctor, specialty, status, doctor_id
-        FROM appointments
+        COPY (
+            SELECT id,
+                   TO_CHAR(date, 'YYYY-MM-DD') AS date,
+                   TO_CHAR(time, 'HH24:MI') AS time,
+                   name AS patient_name,
+                   email AS patient_email,
+                   phone AS patient_phone,
+                   doctor AS doctor_name,
+                   doctor_id,
+                   specialty,
+                   status
+            FROM appointments
     """
     if where:
         sql += " WHERE " + " AND ".join(where)
-    sql += " ORDER BY date DESC, time DESC, id DESC"
-
-    with get_connection() as conn:
-        with conn.cursor() as cur:
-            cur.execute(sql, tuple(params))
-            rows = cur.fetchall() or []
-
-    output = io.StringIO()
-    writer = csv.writer(output)
-    writer.writerow([
-        "id",
-        "date",
-        "time",
-        "patient_name",
-        "patient_email",
-        "patient_phone",
-        "doctor_name",
-        "doctor_id",
-        "specialty",
-        "status",
-    ])
-
-    for r in rows:
-        writer.writerow([
-            r.get("id"),
-            r.get("date"),
-            r.get("time"),
-            r.get("name"),
-            r.get("email"),
-            r.get("phone"),
-            r.get("doctor"),
-            r.get("doctor_id"),
-            r.get("specialty"),
-            r.get("status"),
-        ])
-
-    csv_data = output.getvalue()
+    sql += " ORDER BY appointments.date DESC, appointments.time DESC, id DESC"
+    sql += " ) TO STDOUT WITH (FORMAT csv, HEADER true)"
+
     headers = {
         "Content-Disposition": "attachment; filename=appointments-export.csv"
     }
-    return Response(csv_data, mimetype="text/csv; charset=utf-8", headers=headers)
+    return Response(stream_copy(sql, tuple(params)), mimetype="text/csv; charset=utf-8", headers=headers)
 
 @appointments_bp.route("/api/appointments/slots", methods=["GET"])
 def get_booked_slots():
@@ -139,31 +133,21 @@ def get_booked_slots():
     except ValueError:
         return error_response(400, "validation_error", "doctor_id must be an integer")
 
-    with get_connection() as conn:
-        with conn.cursor() as cur:
-            cur.execute(
-                """
-                SELECT time, status
-                FROM appointments
-                WHERE doctor_id = %s AND date = %s
-                """,
-                (did, date),
-            )
-            rows = cur.fetchall()
+    day = parse_date(date)
+    if day is None:
+        return error_response(400, "validation_error", "date must be a date (YYYY-MM-DD)")
 
-    booked = []
-    for row in rows or []:
-        status = str(row.get("status") or "").strip().lower()
-        if status == "cancelled":
-            continue
-        t = str(row.get("time") or "").strip()
-        if t:
-            booked.append(t)
+    weekly = engine.get_weekly([did])
+    if did not in weekly:
+        return success_response({"doctor_id": did, "date": day.isoformat(), "booked": [], "slots": [], "free": []})
 
+    calendar = engine.Calendar(weekly, day, day)
     return success_response({
         "doctor_id": did,
-        "date": date,
-        "booked": sorted(list(set(booked))),
+        "date": day.isoformat(),
+        "booked": engine.bits_to_times(calendar.booked_slots(did, day)),
+        "slots": engine.bits_to_times(calendar.open_slots(did, day)),
+        "free": engine.bits_to_times(calendar.free_slots(did, day)),
     })
 
 
@@ -200,17 +184,52 @@ def list_appointments():
         where.append("LOWER(email) = %s")
         params.append(str(email).strip().lower())
 
-    sql = "SELECT * FROM appointments"
-    if where:
-        sql += " WHERE " + " AND ".join(where)
-    sql += " ORDER BY id DESC"
+    limit = parse_page_limit(request.args.get("limit"))
+    if limit is None:
+        return error_response(400, "validation_error", "limit must be a positive integer")
 
-    with get_connection() as conn:
-        with conn.cursor() as cur:
-            cur.execute(sql, tuple(params))
-            rows = cur.fetchall()
+    page_where = list(where)
+    page_params = list(params)
+    cursor = request.args.get("cursor")
+    if cursor:
+        after = decode_cursor(cursor, 1)
+        if after is None or not isinstance(after[0], int):
+            return error_response(400, "validation_error", "Invalid cursor")
+        page_where.append("id < %s")
+        page_params.append(after[0])
 
-    return success_response({"count": len(rows), "items": rows})
+    sql = "SELECT * FROM appointments"
+    if page_where:
+        sql += " WHERE " + " AND ".join(page_where)
+    sql += " ORDER BY id DESC LIMIT %s"
+    page_params.append(limit + 1)
+
+    include_total = (request.args.get("include_total") or "").strip().lower() in ("1", "true", "yes")
+
+    with get_db().cursor() as cur:
+        cur.execute(sql, tuple(page_params))
+        rows = cur.fetchall() or []
+
+        total = None
+        if include_total:
+            count_sql = "SELECT COUNT(*) AS count FROM appointments"
+            if where:
+                count_sql += " WHERE " + " AND ".join(where)
+            cur.execute(count_sql, tuple(params))
+            total = cur.fetchone().get("count", 0)
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    items = [serialize_appointment(r) for r in rows]
+
+    data = {
+        "count": len(items),
+        "items": items,
+        "next_cursor": encode_cursor([rows[-1]["id"]]) if has_more else None,
+    }
+    if include_total:
+        data["total"] = total
+    return success_response(data)
 
 
 @appointments_bp.route("/api/appointments", methods=["POST"])
@@ -238,6 +257,13 @@ def create_appointment():
     except (TypeError, ValueError):
         return error_response(400, "validation_error", "doctor_id must be an integer")
 
+    appt_date = parse_date(payload["date"])
+    if appt_date is None:
+        return error_response(400, "validation_error", "date must be a date (YYYY-MM-DD)")
+    appt_time = parse_time(payload["time"])
+    if appt_time is None:
+        return error_response(400, "validation_error", "time must be a time (HH:MM)")
+
     doctor = fetch_doctor(doctor_id)
     if not doctor or not doctor.get("is_active"):
         return error_response(400, "validation_error", f"Invalid doctor_id: {doctor_id}")
@@ -247,61 +273,52 @@ def create_appointment():
     if doctor_name and full_name and doctor_name != full_name:
         return error_response(400, "validation_error", "doctor_id does not match selected doctor name")
 
-    with get_connection() as conn:
-        with conn.cursor() as cur:
-            cur.execute(
-                """
-                SELECT 1
-                FROM appointments
-                WHERE doctor_id = %s AND date = %s AND time = %s
-                  AND LOWER(COALESCE(status, '')) <> 'cancelled'
-                LIMIT 1;
-                """,
-                (doctor_id, payload["date"], payload["time"]),
-            )
-            if cur.fetchone():
-                return error_response(409, "conflict", "Selected slot is no longer available")
+    weekly = engine.get_weekly([doctor_id])
+    calendar = engine.Calendar(weekly, appt_date, appt_date)
+    minute = engine.minute_of(appt_time)
+    if not (calendar.open_slots(doctor_id, appt_date) >> minute) & 1:
+        return error_response(400, "validation_error", "Selected time is outside the doctor's availability")
+    now = datetime.datetime.now()
+    if appt_date < now.date() or (appt_date == now.date() and (engine.elapsed_bits(now) >> minute) & 1):
+        return error_response(400, "validation_error", "Selected time has already passed")
+
+    with get_db().cursor() as cur:
+        cur.execute(
+            """
+            INSERT INTO appointments
+                (doctor_id, doctor, specialty, date, time, name, email, phone, status)
+            VALUES
+                (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+            ON CONFLICT (doctor_id, date, time) WHERE LOWER(status) <> 'cancelled'
+            DO NOTHING
+            RETURNING *;
+            """,
+            (
+                doctor_id,
+                payload["doctor"],
+                payload["specialty"],
+                appt_date,
+                appt_time,
+                payload["name"],
+                payload["email"],
+                payload["phone"],
+                "booked",
+            ),
+        )
+        appt = serialize_appointment(cur.fetchone())
 
-            cur.execute(
-                """
-                INSERT INTO appointments
-                    (doctor_id, doctor, specialty, date, time, name, email, phone, status)
-                VALUES
-                    (%s, %s, %s, %s, %s, %s, %s, %s, %s)
-                RETURNING *;
-                """,
-                (
-                    doctor_id,
-                    payload["doctor"],
-                    payload["specialty"],
-                    payload["date"],
-                    payload["time"],
-                    payload["name"],
-                    payload["email"],
-                    payload["phone"],
-                    "booked",
-                ),
-            )
-            appt = cur.fetchone()
-        conn.commit()
+    if not appt:
+        return error_response(409, "conflict", "Selected slot is no longer available")
 
-    sms_result = {"ok": False, "error": "not_sent"}
-    try:
-        sms_text = (
-            f"MedConnect: Appointment confirmed with {appt['doctor']} "
-            f"on {appt['date']} at {appt['time']}."
-        )
-        sms_result = send_sms(appt["phone"], sms_text)
-    except Exception as e:
-        sms_result = {"ok": False, "error": str(e)}
+    sms_text = (
+        f"MedConnect: Appointment confirmed with {appt['doctor']} "
+        f"on {appt['date']} at {appt['time']}."
+    )
+    sms_id = enqueue_sms(appt["phone"], sms_text, "booking_confirmed", appt["id"], doctor_id)
 
     return success_response({
         "appointment": appt,
-        "sms": {
-            "sent": bool(sms_result.get("ok")),
-            "sid": sms_result.get("sid"),
-            "error": sms_result.get("error") if not sms_result.get("ok") else None,
-        },
+        "sms": queued_response(sms_id),
     }, 201)
 
 
@@ -318,7 +335,7 @@ def update_appointment(appt_id: int):
     if not new_status or new_status not in allowed:
         return error_response(400, "validation_error", "Invalid status")
 
-    appt = fetch_one(appt_id)
+    appt = fetch_one(appt_id, for_update=True)
     if not appt:
         return error_response(404, "not_found", "Appointment not found")
 
@@ -336,31 +353,26 @@ def update_appointment(appt_id: int):
 
     old_status = str(appt.get("status") or "").strip().lower()
 
-    with get_connection() as conn:
-        with conn.cursor() as cur:
+    try:
+        with get_db().cursor() as cur:
             cur.execute(
                 "UPDATE appointments SET status = %s WHERE id = %s RETURNING *;",
                 (new_status, appt_id),
             )
-            updated = cur.fetchone()
-        conn.commit()
+            updated = serialize_appointment(cur.fetchone())
+    except UniqueViolation:
+        get_db().rollback()
+        return error_response(409, "conflict", "Selected slot is no longer available")
 
-    sms_result = {"ok": False, "error": "not_sent"}
-    try:
-        if new_status != old_status:
-            sms_text = (
-                f"MedConnect: Your appointment with {updated.get('doctor','your doctor')} "
-                f"on {updated.get('date','')} at {updated.get('time','')} is now {new_status}."
-            )
-            sms_result = send_sms(updated.get("phone", ""), sms_text)
-    except Exception as e:
-        sms_result = {"ok": False, "error": str(e)}
+    sms_id = None
+    if new_status != old_status and updated.get("phone"):
+        sms_text = (
+            f"MedConnect: Your appointment with {updated.get('doctor','your doctor')} "
+            f"on {updated.get('date','')} at {updated.get('time','')} is now {new_status}."
+        )
+        sms_id = enqueue_sms(updated["phone"], sms_text, "status_changed", appt_id, updated.get("doctor_id"))
 
     return success_response({
         "appointment": updated,
-        "sms": {
-            "sent": bool(sms_result.get("ok")),
-            "sid": sms_result.get("sid"),
-            "error": sms_result.get("error") if not sms_result.get("ok") else None,
-        },
+        "sms": queued_response(sms_id),
     })
@@ -1,7 +1,7 @@
 from flask import Blueprint, request, session, jsonify
 from werkzeug.security import generate_password_hash, check_password_hash
 
-from app.db import get_connection
+from app.db import get_db
 from app.routes.utils import success_response, error_response
 
 auth_bp = Blueprint("auth", __name__)
@@ -36,10 +36,9 @@ def _find_user_by_email(email: str):
     email = _norm_email(email)
     if not email:
         return None
-    with get_connection() as conn:
-        with conn.cursor() as cur:
-            cur.execute("SELECT * FROM users WHERE LOWER(email) = %s LIMIT 1", (email,))
-            return cur.fetchone()
+    with get_db().cursor() as cur:
+        cur.execute("SELECT * FROM users WHERE LOWER(email) = %s LIMIT 1", (email,))
+        return cur.fetchone()
 
 
 def _ensure_seed_users():
@@ -73,29 +72,27 @@ def _ensure_seed_users():
         },
     ]
 
-    with get_connection() as conn:
-        with conn.cursor() as cur:
-            for s in seeds:
-                cur.execute("SELECT id FROM users WHERE LOWER(email) = %s", (_norm_email(s["email"]),))
-                if cur.fetchone():
-                    continue
-
-                cur.execute(
-                    """
-                    INSERT INTO users (email, password_hash, name, phone, role, patient_id, doctor_id)
-                    VALUES (%s, %s, %s, %s, %s, %s, %s)
-                    """,
-                    (
-                        _norm_email(s["email"]),
-                        generate_password_hash(s["password"]),
-                        s["name"],
-                        s["phone"],
-                        s["role"],
-                        s["patient_id"],
-                        s["doctor_id"],
-                    ),
-                )
-        conn.commit()
+    with get_db().cursor() as cur:
+        for s in seeds:
+            cur.execute("SELECT id FROM users WHERE LOWER(email) = %s", (_norm_email(s["email"]),))
+            if cur.fetchone():
+                continue
+
+            cur.execute(
+                """
+                INSERT INTO users (email, password_hash, name, phone, role, patient_id, doctor_id)
+                VALUES (%s, %s, %s, %s, %s, %s, %s)
+                """,
+                (
+                    _norm_email(s["email"]),
+                    generate_password_hash(s["password"]),
+                    s["name"],
+                    s["phone"],
+                    s["role"],
+                    s["patient_id"],
+                    s["doctor_id"],
+                ),
+            )
 
 
 @auth_bp.post("/api/auth/register")
@@ -127,25 +124,23 @@ def register():
 
     pwd_hash = generate_password_hash(password)
 
-    with get_connection() as conn:
-        with conn.cursor() as cur:
-            cur.execute(
-                """
-                INSERT INTO users (email, password_hash, name, phone, role)
-                VALUES (%s, %s, %s, %s, %s)
-                RETURNING *;
-                """,
-                (email, pwd_hash, name, phone, "patient"),
-            )
-            user = cur.fetchone()
-
-            patient_id = 1000 + int(user["id"])
-            cur.execute(
-                "UPDATE users SET patient_id = %s WHERE id = %s RETURNING *;",
-                (patient_id, user["id"]),
-            )
-            user = cur.fetchone()
-        conn.commit()
+    with get_db().cursor() as cur:
+        cur.execute(
+            """
+            INSERT INTO users (email, password_hash, name, phone, role)
+            VALUES (%s, %s, %s, %s, %s)
+            RETURNING *;
+            """,
+            (email, pwd_hash, name, phone, "patient"),
+        )
+        user = cur.fetchone()
+
+        patient_id = 1000 + int(user["id"])
+        cur.execute(
+            "UPDATE users SET patient_id = %s WHERE id = %s RETURNING *;",
+            (patient_id, user["id"]),
+        )
+        user = cur.fetchone()
 
     _set_session(user)
     return success_response({"user": _public_user(user)}, 201)
@@ -188,10 +183,9 @@ def me():
     if not user_id:
         return error_response(401, "unauthorized", "Unauthorized")
 
-    with get_connection() as conn:
-        with conn.cursor() as cur:
-            cur.execute("SELECT * FROM users WHERE id = %s LIMIT 1", (user_id,))
-            user = cur.fetchone()
+    with get_db().cursor() as cur:
+        cur.execute("SELECT * FROM users WHERE id = %s LIMIT 1", (user_id,))
+        user = cur.fetchone()
 
     if not user:
         session.clear()
@@ -199,13 +193,12 @@ def me():
 
     user_payload = _public_user(user)
     if (user_payload.get("role") or "").strip().lower() == "doctor" and user_payload.get("doctor_id"):
-        with get_connection() as conn:
-            with conn.cursor() as cur:
-                cur.execute(
-                    "SELECT full_name, specialty, avatar_url FROM doctors WHERE id = %s LIMIT 1",
-                    (user_payload.get("doctor_id"),),
-                )
-                doctor_row = cur.fetchone()
+        with get_db().cursor() as cur:
+            cur.execute(
+                "SELECT full_name, specialty, avatar_url FROM doctors WHERE id = %s LIMIT 1",
+                (user_payload.get("doctor_id"),),
+            )
+            doctor_row = cur.fetchone()
         if doctor_row:
             user_payload["specialty"] = doctor_row.get("specialty")
             user_payload["avatar_url"] = doctor_row.get("avatar_url")
@@ -225,15 +218,13 @@ def forgot_password():
     if not email:
         return error_response(400, "validation_error", "Email is required")
 
-    with get_connection() as conn:
-        with conn.cursor() as cur:
-            cur.execute(
-                """
-                INSERT INTO password_reset_requests (email, phone)
-                VALUES (%s, %s)
-                """,
-                (email, phone or None),
-            )
-        conn.commit()
+    with get_db().cursor() as cur:
+        cur.execute(
+            """
+            INSERT INTO password_reset_requests (email, phone)
+            VALUES (%s, %s)
+            """,
+            (email, phone or None),
+        )
 
     return success_response({"message": "Password reset request received"})
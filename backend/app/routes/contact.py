@@ -3,7 +3,7 @@ import os
 import re
 from flask import Blueprint, request, jsonify
 
-from app.db import get_connection
+from app.db import get_db
 from app.routes.utils import success_response
 from app.email_utils import send_email
 
@@ -82,27 +82,27 @@ def create_contact_message():
             },
         }), 400
 
-    with get_connection() as conn:
-        with conn.cursor() as cur:
-            cur.execute(
-                """
-                INSERT INTO contact_messages
-                    (type, first_name, last_name, email, phone, message)
-                VALUES
-                    (%s, %s, %s, %s, %s, %s)
-                RETURNING id, created_at;
-                """,
-                (
-                    enquiry_type,
-                    first_name,
-                    last_name,
-                    email,
-                    phone,
-                    message,
-                ),
-            )
-            row = cur.fetchone()
-        conn.commit()
+    with get_db().cursor() as cur:
+        cur.execute(
+            """
+            INSERT INTO contact_messages
+                (type, first_name, last_name, email, phone, message)
+            VALUES
+                (%s, %s, %s, %s, %s, %s)
+            RETURNING id, created_at;
+            """,
+            (
+                enquiry_type,
+                first_name,
+                last_name,
+                email,
+                phone,
+                message,
+            ),
+        )
+        row = cur.fetchone()
+
+    get_db().commit()
 
     submitted_at = row.get("created_at")
     if isinstance(submitted_at, datetime.datetime):
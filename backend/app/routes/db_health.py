@@ -1,14 +1,56 @@
-from flask import Blueprint, jsonify
-from app.db import get_connection
-from app.routes.utils import success_response
+from flask import Blueprint, jsonify, session
+from app import resilience
+from app.db import get_db, pool_stats
+from app.routes.utils import success_response, error_response
 
 db_health_bp = Blueprint("db_health", __name__)
 
 
+def _require_admin():
+    role = (session.get("role") or "").strip().lower()
+    if not role:
+        return error_response(401, "unauthorized", "Unauthorized")
+    if role != "admin":
+        return error_response(403, "forbidden", "Forbidden")
+    return None
+
+
 @db_health_bp.get("/api/db-health")
 def db_health():
-    with get_connection() as conn:
-        with conn.cursor() as cur:
-            cur.execute("SELECT 1 AS ok;")
-            row = cur.fetchone()
-    return success_response({"ok": True, "db": row})
+    with get_db().cursor() as cur:
+        cur.execute("SELECT 1 AS ok;")
+        row = cur.fetchone()
+    return success_response({"ok": True, "db": row, "pool": pool_stats()})
+
+
+@db_health_bp.get("/api/admin/providers/health")
+def providers_health():
+    """Breaker state of this worker plus the SMS backlog.
+
+    SMS go out from the dispatcher process, so its Twilio breaker is not
+    visible here; a growing pending count or old head of queue is the sign.
+    """
+    auth = _require_admin()
+    if auth:
+        return auth
+
+    with get_db().cursor() as cur:
+        cur.execute(
+            """
+            SELECT
+                COUNT(*) FILTER (WHERE status = 'pending') AS pending,
+                COUNT(*) FILTER (WHERE status = 'sending') AS sending,
+                COUNT(*) FILTER (
+                    WHERE status = 'failed' AND created_at >= NOW() - INTERVAL '1 hour'
+                ) AS failed_last_hour,
+                EXTRACT(EPOCH FROM NOW() - MIN(created_at) FILTER (WHERE status = 'pending'))
+                    AS oldest_pending_seconds
+            FROM sms_outbox
+            WHERE status IN ('pending', 'sending', 'failed')
+            """
+        )
+        outbox = cur.fetchone() or {}
+
+    oldest = outbox.get("oldest_pending_seconds")
+    outbox["oldest_pending_seconds"] = round(float(oldest), 1) if oldest is not None else None
+    return success_response({**resilience.stats(), "sms_outbox": outbox})
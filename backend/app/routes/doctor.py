@@ -1,17 +1,36 @@
 import datetime
-import json
 import time
 import uuid
 from pathlib import Path
 from flask import Blueprint, jsonify, request, session
-
-from app.db import get_connection
-from sms import send_sms
+from psycopg.errors import UniqueViolation
+from psycopg.types.json import Jsonb
+
+from app import doctor_directory
+from app.db import get_db
+from app.sms_outbox import enqueue_sms, enqueue_sms_many, queued_response, reminder_text
+from app.routes.utils import (
+    RawJSON,
+    format_date,
+    format_time,
+    parse_date,
+    parse_time,
+    parse_page_limit,
+    encode_cursor,
+    decode_cursor,
+    raw_success_response,
+    sql_date,
+    sql_time,
+)
 
 
 doctor_bp = Blueprint("doctor", __name__)
 
 ALLOWED_STATUS = {"booked", "confirmed", "cancelled", "completed"}
+NOTIFY_TEMPLATES = ("reminder", "change", "custom")
+BULK_NOTIFY_STATUSES = ("booked", "confirmed")
+MAX_BULK_NOTIFY_DAYS = 31
+MAX_BULK_NOTIFY_TARGETS = 500
 ALLOWED_AVATAR_MIME = {
     "image/jpeg": "jpg",
     "image/png": "png",
@@ -78,6 +97,8 @@ def _serialize_appt(row: dict):
     if not row:
         return None
     data = dict(row)
+    data["date"] = format_date(row.get("date"))
+    data["time"] = format_time(row.get("time"))
     data.setdefault("patient_name", row.get("name"))
     data.setdefault("patient_email", row.get("email"))
     data.setdefault("patient_phone", row.get("phone"))
@@ -85,26 +106,6 @@ def _serialize_appt(row: dict):
     return data
 
 
-def _parse_list_field(raw):
-    if raw is None:
-        return []
-    if isinstance(raw, list):
-        return [str(v).strip() for v in raw if str(v).strip()]
-    if isinstance(raw, str):
-        val = raw.strip()
-        if not val:
-            return []
-    try:
-        parsed = json.loads(raw)
-        if isinstance(parsed, list):
-            return [str(v).strip() for v in parsed if str(v).strip()]
-    except Exception:
-        pass
-    if isinstance(raw, str):
-        return [raw.strip()]
-    return []
-
-
 def _normalize_list_input(value):
     if value is None:
         return None
@@ -117,18 +118,48 @@ def _normalize_list_input(value):
 
 
 def _log_notify(appointment_id: int, doctor_id: int, template_key: str, sent: bool, error: str = None):
-    with get_connection() as conn:
-        with conn.cursor() as cur:
-            cur.execute(
-                """
-                INSERT INTO doctor_notify_logs
-                    (appointment_id, doctor_id, template_key, sent, error)
-                VALUES
-                    (%s, %s, %s, %s, %s)
-                """,
-                (appointment_id, doctor_id, template_key, sent, error),
-            )
-        conn.commit()
+    with get_db().cursor() as cur:
+        cur.execute(
+            """
+            INSERT INTO doctor_notify_logs
+                (appointment_id, doctor_id, template_key, sent, error)
+            VALUES
+                (%s, %s, %s, %s, %s)
+            """,
+            (appointment_id, doctor_id, template_key, sent, error),
+        )
+
+
+def _log_notify_many(rows):
+    """Insert (appointment_id, doctor_id, template_key, sent, error) rows in one statement."""
+    if not rows:
+        return
+    values = ", ".join(["(%s, %s, %s, %s, %s)"] * len(rows))
+    params = [value for row in rows for value in row]
+    with get_db().cursor() as cur:
+        cur.execute(
+            f"""
+            INSERT INTO doctor_notify_logs
+                (appointment_id, doctor_id, template_key, sent, error)
+            VALUES {values}
+            """,
+            params,
+        )
+
+
+def _notify_message(template_key: str, appt: dict, custom_message: str) -> str:
+    doctor_name = appt.get("doctor") or "your doctor"
+    date = format_date(appt.get("date")) or ""
+    time = format_time(appt.get("time")) or ""
+
+    if template_key == "reminder":
+        return reminder_text(doctor_name, date, time)
+    if template_key == "change":
+        return (
+            f"MedConnect: Please check your appointment details with {doctor_name} "
+            f"on {date} at {time}. There may be updates."
+        )
+    return custom_message
 
 
 @doctor_bp.get("/api/doctor/appointments")
@@ -144,32 +175,94 @@ def list_doctor_appointments():
     range_key = (request.args.get("range") or "all").strip().lower()
 
     today = datetime.date.today()
-    today_iso = today.isoformat()
-    week_end = (today + datetime.timedelta(days=6)).isoformat()
+    week_end = today + datetime.timedelta(days=6)
 
-    sql = "SELECT * FROM appointments WHERE doctor_id = %s"
+    where = "doctor_id = %s"
     params = [doctor_id]
 
     if range_key == "today":
-        sql += " AND date = %s"
-        params.append(today_iso)
+        where += " AND date = %s"
+        params.append(today)
     elif range_key == "week":
-        sql += " AND date >= %s AND date <= %s"
-        params.extend([today_iso, week_end])
+        where += " AND date >= %s AND date <= %s"
+        params.extend([today, week_end])
     elif range_key == "all":
         pass
     else:
         return _error(400, "validation_error", "range must be today, week, or all")
 
-    sql += " ORDER BY date ASC, time ASC"
+    limit = parse_page_limit(request.args.get("limit"))
+    if limit is None:
+        return _error(400, "validation_error", "limit must be a positive integer")
+
+    sql = "SELECT * FROM appointments WHERE " + where
+    page_params = list(params)
+    cursor = request.args.get("cursor")
+    if cursor:
+        after = decode_cursor(cursor, 3)
+        after_date = parse_date(after[0]) if after else None
+        after_time = parse_time(after[1]) if after else None
+        if after_date is None or after_time is None or not isinstance(after[2], int):
+            return _error(400, "validation_error", "Invalid cursor")
+        sql += " AND (date, time, id) > (%s, %s, %s)"
+        page_params.extend([after_date, after_time, after[2]])
+
+    sql += " ORDER BY date ASC, time ASC, id ASC LIMIT %s"
+    page_params.append(limit + 1)
+
+    include_total = (request.args.get("include_total") or "").strip().lower() in ("1", "true", "yes")
+
+    # One extra row tells whether there is a next page; the items are
+    # _serialize_appt(row) built by Postgres, and the last row's key comes
+    # back alongside for the cursor.
+    page_params.append(limit)
+    with get_db().cursor() as cur:
+        cur.execute(
+            f"""
+            WITH page AS (
+                SELECT a.*, ROW_NUMBER() OVER (ORDER BY date ASC, time ASC, id ASC) AS page_row
+                FROM ({sql}) a
+            ),
+            shown AS (SELECT * FROM page WHERE page_row <= %s)
+            SELECT
+                (SELECT COUNT(*) FROM page) AS fetched,
+                COALESCE(json_agg(
+                    (to_jsonb(shown) - 'page_row') || jsonb_build_object(
+                        'date', {sql_date("shown.date")},
+                        'time', {sql_time("shown.time")},
+                        'patient_name', shown.name,
+                        'patient_email', shown.email,
+                        'patient_phone', shown.phone,
+                        'doctor_name', shown.doctor
+                    ) ORDER BY page_row
+                ), '[]')::text AS items,
+                COUNT(*) AS count,
+                (array_agg(date ORDER BY page_row DESC))[1] AS last_date,
+                (array_agg(time ORDER BY page_row DESC))[1] AS last_time,
+                (array_agg(id ORDER BY page_row DESC))[1] AS last_id
+            FROM shown
+            """,
+            tuple(page_params),
+        )
+        page = cur.fetchone()
+
+        total = None
+        if include_total:
+            cur.execute("SELECT COUNT(*) AS count FROM appointments WHERE " + where, tuple(params))
+            total = cur.fetchone().get("count", 0)
 
-    with get_connection() as conn:
-        with conn.cursor() as cur:
-            cur.execute(sql, tuple(params))
-            rows = cur.fetchall()
+    next_cursor = None
+    if page["fetched"] > limit:
+        next_cursor = encode_cursor([page["last_date"].isoformat(), page["last_time"].isoformat(), page["last_id"]])
 
-    items = [_serialize_appt(r) for r in (rows or [])]
-    return jsonify({"success": True, "data": {"count": len(items), "items": items}}), 200
+    data = {
+        "count": page["count"],
+        "items": RawJSON(page["items"]),
+        "next_cursor": next_cursor,
+    }
+    if include_total:
+        data["total"] = total
+    return raw_success_response(data)
 
 
 @doctor_bp.get("/api/doctor/summary")
@@ -182,40 +275,39 @@ def doctor_summary():
     if doctor_id is None:
         return _error(403, "forbidden", "Forbidden")
 
-    today = datetime.date.today().isoformat()
-    week_end = (datetime.date.today() + datetime.timedelta(days=6)).isoformat()
-
-    with get_connection() as conn:
-        with conn.cursor() as cur:
-            cur.execute("SELECT COUNT(*) AS count FROM appointments WHERE doctor_id = %s", (doctor_id,))
-            total = cur.fetchone().get("count", 0)
-
-            cur.execute(
-                "SELECT COUNT(*) AS count FROM appointments WHERE doctor_id = %s AND date = %s",
-                (doctor_id, today),
-            )
-            today_count = cur.fetchone().get("count", 0)
+    today = datetime.date.today()
+    week_end = today + datetime.timedelta(days=6)
 
-            cur.execute(
-                """
-                SELECT COUNT(*) AS count
-                FROM appointments
-                WHERE doctor_id = %s AND date >= %s AND date <= %s
-                """,
-                (doctor_id, today, week_end),
-            )
-            week_count = cur.fetchone().get("count", 0)
+    with get_db().cursor() as cur:
+        cur.execute("SELECT COUNT(*) AS count FROM appointments WHERE doctor_id = %s", (doctor_id,))
+        total = cur.fetchone().get("count", 0)
 
-            cur.execute(
-                """
-                SELECT status, COUNT(*) AS count
-                FROM appointments
-                WHERE doctor_id = %s
-                GROUP BY status
-                """,
-                (doctor_id,),
-            )
-            status_rows = cur.fetchall()
+        cur.execute(
+            "SELECT COUNT(*) AS count FROM appointments WHERE doctor_id = %s AND date = %s",
+            (doctor_id, today),
+        )
+        today_count = cur.fetchone().get("count", 0)
+
+        cur.execute(
+            """
+            SELECT COUNT(*) AS count
+            FROM appointments
+            WHERE doctor_id = %s AND date >= %s AND date <= %s
+            """,
+            (doctor_id, today, week_end),
+        )
+        week_count = cur.fetchone().get("count", 0)
+
+        cur.execute(
+            """
+            SELECT status, COUNT(*) AS count
+            FROM appointments
+            WHERE doctor_id = %s
+            GROUP BY status
+            """,
+            (doctor_id,),
+        )
+        status_rows = cur.fetchall()
 
     by_status = {str(r.get("status") or "").strip().lower(): r.get("count", 0) for r in status_rows or []}
 
@@ -241,10 +333,9 @@ def doctor_profile():
     if doctor_id is None:
         return _error(403, "forbidden", "Forbidden")
 
-    with get_connection() as conn:
-        with conn.cursor() as cur:
-            cur.execute("SELECT * FROM doctors WHERE id = %s LIMIT 1", (doctor_id,))
-            row = cur.fetchone()
+    with get_db().cursor() as cur:
+        cur.execute("SELECT * FROM doctors WHERE id = %s LIMIT 1", (doctor_id,))
+        row = cur.fetchone()
 
     if not row:
         return _error(404, "not_found", "Doctor not found")
@@ -256,9 +347,9 @@ def doctor_profile():
             "full_name": row.get("full_name"),
             "specialty": row.get("specialty"),
             "bio": row.get("bio") or "",
-            "experience": _parse_list_field(row.get("experience")),
-            "certifications": _parse_list_field(row.get("certifications")),
-            "specialisations": _parse_list_field(row.get("specialisations")),
+            "experience": row.get("experience") or [],
+            "certifications": row.get("certifications") or [],
+            "specialisations": row.get("specialisations") or [],
         },
     }), 200
 
@@ -280,17 +371,9 @@ def doctor_update_profile():
         bio = str(payload.get("bio") or "").strip()
         updates["bio"] = bio or None
 
-    if "experience" in payload:
-        items = _normalize_list_input(payload.get("experience"))
-        updates["experience"] = json.dumps(items) if items else None
-
-    if "certifications" in payload:
-        items = _normalize_list_input(payload.get("certifications"))
-        updates["certifications"] = json.dumps(items) if items else None
-
-    if "specialisations" in payload:
-        items = _normalize_list_input(payload.get("specialisations"))
-        updates["specialisations"] = json.dumps(items) if items else None
+    for field in ("experience", "certifications", "specialisations"):
+        if field in payload:
+            updates[field] = Jsonb(_normalize_list_input(payload.get(field)) or [])
 
     if not updates:
         return _error(400, "validation_error", "No fields to update")
@@ -306,15 +389,16 @@ def doctor_update_profile():
     sql = "UPDATE doctors SET " + ", ".join(fields) + " WHERE id = %s RETURNING *;"
 
     updated = None
-    with get_connection() as conn:
-        with conn.cursor() as cur:
-            cur.execute(sql, tuple(values))
-            updated = cur.fetchone()
-        conn.commit()
+    with get_db().cursor() as cur:
+        cur.execute(sql, tuple(values))
+        updated = cur.fetchone()
 
     if not updated:
         return _error(404, "not_found", "Doctor not found")
 
+    get_db().commit()
+    doctor_directory.invalidate()
+
     return jsonify({
         "success": True,
         "data": {
@@ -322,9 +406,9 @@ def doctor_update_profile():
             "full_name": updated.get("full_name"),
             "specialty": updated.get("specialty"),
             "bio": updated.get("bio") or "",
-            "experience": _parse_list_field(updated.get("experience")),
-            "certifications": _parse_list_field(updated.get("certifications")),
-            "specialisations": _parse_list_field(updated.get("specialisations")),
+            "experience": updated.get("experience") or [],
+            "certifications": updated.get("certifications") or [],
+            "specialisations": updated.get("specialisations") or [],
         },
     }), 200
 
@@ -345,48 +429,42 @@ def doctor_update_status(appt_id: int):
     if not new_status or new_status not in ALLOWED_STATUS:
         return _error(400, "validation_error", "Invalid status")
 
-    with get_connection() as conn:
-        with conn.cursor() as cur:
-            cur.execute(
-                "SELECT * FROM appointments WHERE id = %s AND doctor_id = %s LIMIT 1",
-                (appt_id, doctor_id),
-            )
-            appt = cur.fetchone()
+    with get_db().cursor() as cur:
+        cur.execute(
+            "SELECT * FROM appointments WHERE id = %s AND doctor_id = %s LIMIT 1 FOR UPDATE",
+            (appt_id, doctor_id),
+        )
+        appt = cur.fetchone()
 
     if not appt:
         return _error(404, "not_found", "Appointment not found")
 
     old_status = str(appt.get("status") or "").strip().lower()
 
-    with get_connection() as conn:
-        with conn.cursor() as cur:
+    try:
+        with get_db().cursor() as cur:
             cur.execute(
                 "UPDATE appointments SET status = %s WHERE id = %s RETURNING *;",
                 (new_status, appt_id),
             )
-            updated = cur.fetchone()
-        conn.commit()
-
-    sms_result = {"ok": False, "error": "not_sent"}
-    try:
-        if new_status != old_status:
-            sms_text = (
-                f"MedConnect: Your appointment with {updated.get('doctor','your doctor')} "
-                f"on {updated.get('date','')} at {updated.get('time','')} is now {new_status}."
-            )
-            sms_result = send_sms(updated.get("phone", ""), sms_text)
-    except Exception as e:
-        sms_result = {"ok": False, "error": str(e)}
+            updated = _serialize_appt(cur.fetchone())
+    except UniqueViolation:
+        get_db().rollback()
+        return _error(409, "conflict", "Selected slot is no longer available")
+
+    sms_id = None
+    if new_status != old_status and updated.get("phone"):
+        sms_text = (
+            f"MedConnect: Your appointment with {updated.get('doctor','your doctor')} "
+            f"on {updated.get('date','')} at {updated.get('time','')} is now {new_status}."
+        )
+        sms_id = enqueue_sms(updated["phone"], sms_text, "status_changed", appt_id, doctor_id)
 
     return jsonify({
         "success": True,
         "data": {
-            "appointment": _serialize_appt(updated),
-            "sms": {
-                "sent": bool(sms_result.get("ok")),
-                "sid": sms_result.get("sid"),
-                "error": sms_result.get("error") if not sms_result.get("ok") else None,
-            },
+            "appointment": updated,
+            "sms": queued_response(sms_id),
         },
     }), 200
 
@@ -405,53 +483,130 @@ def doctor_notify_patient(appt_id: int):
     template_key = str(payload.get("template_key") or "").strip().lower()
     custom_message = str(payload.get("custom_message") or "").strip()
 
-    with get_connection() as conn:
-        with conn.cursor() as cur:
-            cur.execute(
-                "SELECT * FROM appointments WHERE id = %s AND doctor_id = %s LIMIT 1",
-                (appt_id, doctor_id),
-            )
-            appt = cur.fetchone()
+    with get_db().cursor() as cur:
+        cur.execute(
+            "SELECT * FROM appointments WHERE id = %s AND doctor_id = %s LIMIT 1",
+            (appt_id, doctor_id),
+        )
+        appt = cur.fetchone()
 
     if not appt:
         return _error(404, "not_found", "Appointment not found")
 
-    if template_key not in ("reminder", "change", "custom"):
+    if template_key not in NOTIFY_TEMPLATES:
         return _error(400, "validation_error", "Invalid template_key")
+    if template_key == "custom" and not custom_message:
+        return _error(400, "validation_error", "custom_message is required for custom template")
 
-    doctor_name = appt.get("doctor") or "your doctor"
-    date = appt.get("date") or ""
-    time = appt.get("time") or ""
-
-    if template_key == "reminder":
-        message = f"MedConnect: Reminder of your appointment with {doctor_name} on {date} at {time}."
-    elif template_key == "change":
-        message = (
-            f"MedConnect: Please check your appointment details with {doctor_name} "
-            f"on {date} at {time}. There may be updates."
-        )
-    else:
-        if not custom_message:
-            return _error(400, "validation_error", "custom_message is required for custom template")
-        message = custom_message
+    message = _notify_message(template_key, appt, custom_message)
 
     phone = str(appt.get("phone") or "").strip()
     if not phone:
         _log_notify(appt_id, doctor_id, template_key, False, "Missing patient phone")
         return _error(400, "validation_error", "Patient phone number is missing")
 
-    sms_result = send_sms(phone, message)
-    sent = bool(sms_result.get("ok"))
-    err = sms_result.get("error") if not sent else None
+    # The dispatcher writes the doctor_notify_logs row once the send settles.
+    sms_id = enqueue_sms(phone, message, template_key, appt_id, doctor_id)
+
+    return jsonify({
+        "success": True,
+        "data": queued_response(sms_id),
+    }), 200
 
-    _log_notify(appt_id, doctor_id, template_key, sent, err)
+
+@doctor_bp.post("/api/doctor/appointments/notify-bulk")
+def doctor_notify_bulk():
+    guard = _require_doctor()
+    if guard:
+        return guard
+
+    doctor_id = _doctor_scope_id()
+    if doctor_id is None:
+        return _error(403, "forbidden", "Forbidden")
+
+    payload = request.get_json(silent=True) or {}
+    template_key = str(payload.get("template_key") or "").strip().lower()
+    custom_message = str(payload.get("custom_message") or "").strip()
+
+    if template_key not in NOTIFY_TEMPLATES:
+        return _error(400, "validation_error", "Invalid template_key")
+    if template_key == "custom" and not custom_message:
+        return _error(400, "validation_error", "custom_message is required for custom template")
+
+    if payload.get("date"):
+        start = end = parse_date(payload.get("date"))
+        if start is None:
+            return _error(400, "validation_error", "date must be a date (YYYY-MM-DD)")
+    elif payload.get("from") or payload.get("to"):
+        start = parse_date(payload.get("from"))
+        end = parse_date(payload.get("to") or payload.get("from"))
+        if start is None or end is None:
+            return _error(400, "validation_error", "from and to must be dates (YYYY-MM-DD)")
+    else:
+        start = end = datetime.date.today()
+    if end < start or (end - start).days + 1 > MAX_BULK_NOTIFY_DAYS:
+        return _error(400, "validation_error", f"Range must be 1 to {MAX_BULK_NOTIFY_DAYS} days")
+
+    statuses = payload.get("statuses") or list(BULK_NOTIFY_STATUSES)
+    if isinstance(statuses, str):
+        statuses = statuses.split(",")
+    if not isinstance(statuses, list):
+        return _error(400, "validation_error", "statuses must be an array")
+    statuses = sorted({str(s).strip().lower() for s in statuses if str(s).strip()})
+    if not statuses or any(s not in ALLOWED_STATUS for s in statuses):
+        return _error(400, "validation_error", "Invalid status in statuses")
+
+    with get_db().cursor() as cur:
+        cur.execute(
+            """
+            SELECT id, doctor, date, time, phone, status
+            FROM appointments
+            WHERE doctor_id = %s AND date >= %s AND date <= %s
+              AND LOWER(status) = ANY(%s)
+            ORDER BY date ASC, time ASC, id ASC
+            LIMIT %s
+            """,
+            (doctor_id, start, end, statuses, MAX_BULK_NOTIFY_TARGETS + 1),
+        )
+        targets = cur.fetchall() or []
+
+    if len(targets) > MAX_BULK_NOTIFY_TARGETS:
+        return _error(400, "validation_error", f"At most {MAX_BULK_NOTIFY_TARGETS} appointments per request; narrow the filters")
+
+    messages = []
+    missing_phone = []
+    for appt in targets:
+        phone = str(appt.get("phone") or "").strip()
+        if not phone:
+            missing_phone.append((appt.get("id"), doctor_id, template_key, False, "Missing patient phone"))
+            continue
+        messages.append((phone, _notify_message(template_key, appt, custom_message), template_key, appt.get("id"), doctor_id))
+
+    # Sending happens in the dispatcher's worker pool, which also logs each
+    # outcome; only the appointments that cannot be messaged are logged here.
+    queued = enqueue_sms_many(messages)
+    _log_notify_many(missing_phone)
+
+    results = []
+    for appt in targets:
+        sms_id = queued.get(appt.get("id"))
+        results.append({
+            "appointment_id": appt.get("id"),
+            "date": format_date(appt.get("date")),
+            "time": format_time(appt.get("time")),
+            "queued": sms_id is not None,
+            "id": sms_id,
+            "error": None if sms_id is not None else "Missing patient phone",
+        })
 
     return jsonify({
         "success": True,
         "data": {
-            "sent": sent,
-            "sid": sms_result.get("sid"),
-            "error": err,
+            "from": start.isoformat(),
+            "to": end.isoformat(),
+            "count": len(results),
+            "queued": len(queued),
+            "items": results,
         },
     }), 200
 
@@ -493,29 +648,30 @@ def doctor_upload_avatar():
     avatar_url = f"/uploads/avatars/{filename}"
     previous_url = None
 
-    with get_connection() as conn:
-        with conn.cursor() as cur:
-            cur.execute("SELECT avatar_url FROM doctors WHERE id = %s LIMIT 1", (doctor_id,))
-            row = cur.fetchone()
-            if not row:
-                try:
-                    file_path.unlink()
-                except Exception:
-                    pass
-                return _error(404, "not_found", "Doctor not found")
-
-            previous_url = row.get("avatar_url")
-            cur.execute(
-                """
-                UPDATE doctors
-                SET avatar_url = %s, updated_at = NOW()
-                WHERE id = %s
-                RETURNING avatar_url
-                """,
-                (avatar_url, doctor_id),
-            )
-            updated = cur.fetchone()
-        conn.commit()
+    with get_db().cursor() as cur:
+        cur.execute("SELECT avatar_url FROM doctors WHERE id = %s LIMIT 1", (doctor_id,))
+        row = cur.fetchone()
+        if not row:
+            try:
+                file_path.unlink()
+            except Exception:
+                pass
+            return _error(404, "not_found", "Doctor not found")
+
+        previous_url = row.get("avatar_url")
+        cur.execute(
+            """
+            UPDATE doctors
+            SET avatar_url = %s, updated_at = NOW()
+            WHERE id = %s
+            RETURNING avatar_url
+            """,
+            (avatar_url, doctor_id),
+        )
+        updated = cur.fetchone()
+
+    get_db().commit()
+    doctor_directory.invalidate()
 
     if previous_url and previous_url != avatar_url:
         _delete_avatar_file(previous_url)
@@ -535,25 +691,26 @@ def doctor_delete_avatar():
 
     previous_url = None
 
-    with get_connection() as conn:
-        with conn.cursor() as cur:
-            cur.execute("SELECT avatar_url FROM doctors WHERE id = %s LIMIT 1", (doctor_id,))
-            row = cur.fetchone()
-            if not row:
-                return _error(404, "not_found", "Doctor not found")
+    with get_db().cursor() as cur:
+        cur.execute("SELECT avatar_url FROM doctors WHERE id = %s LIMIT 1", (doctor_id,))
+        row = cur.fetchone()
+        if not row:
+            return _error(404, "not_found", "Doctor not found")
+
+        previous_url = row.get("avatar_url")
+        cur.execute(
+            """
+            UPDATE doctors
+            SET avatar_url = NULL, updated_at = NOW()
+            WHERE id = %s
+            RETURNING avatar_url
+            """,
+            (doctor_id,),
+        )
+        cur.fetchone()
 
-            previous_url = row.get("avatar_url")
-            cur.execute(
-                """
-                UPDATE doctors
-                SET avatar_url = NULL, updated_at = NOW()
-                WHERE id = %s
-                RETURNING avatar_url
-                """,
-                (doctor_id,),
-            )
-            cur.fetchone()
-        conn.commit()
+    get_db().commit()
+    doctor_directory.invalidate()
 
     if previous_url:
         _delete_avatar_file(previous_url)
@@ -1,16 +1,37 @@
-import json
+import html
+import re
 import secrets
-from flask import Blueprint, jsonify, request, session
+from flask import Blueprint, g, jsonify, request, session
+from psycopg.types.json import Jsonb
 from werkzeug.security import generate_password_hash
 
-from app.db import get_connection
-from app.routes.utils import success_response
+from app import availability_engine, doctor_directory
+from app.db import get_db
+from app.http_cache import conditional, make_etag
+from app.routes.utils import (
+    RawJSON,
+    cached_success_response,
+    parse_page_limit,
+    raw_success_response,
+    sql_time,
+    success_response,
+)
 from app.email_utils import send_email
 
 doctors_bp = Blueprint("doctors", __name__)
 
 VALID_DAYS = {"mon", "tue", "wed", "thu", "fri", "sat", "sun"}
 
+SEARCH_DEFAULT_LIMIT = 20
+SEARCH_MAX_LIMIT = 50
+SEARCH_MAX_TERMS = 8
+# ts_headline wraps matches in these; they are swapped for <mark> after the
+# rest of the text has been HTML-escaped.
+_HIGHLIGHT_START = "\x01"
+_HIGHLIGHT_STOP = "\x02"
+
+_trigram_available = None
+
 
 def _error(status: int, code: str, message: str):
     return jsonify({"success": False, "error": {"code": code, "message": message}}), status
@@ -145,56 +166,22 @@ def _coerce_bool(value, field: str):
     return None, f"{field} must be a boolean"
 
 
-def _parse_days_from_row(raw):
-    if raw is None:
-        return []
-    if isinstance(raw, list):
-        return [str(d).strip().lower() for d in raw if str(d).strip()]
-    try:
-        parsed = json.loads(raw)
-        if isinstance(parsed, list):
-            return [str(d).strip().lower() for d in parsed if str(d).strip()]
-    except Exception:
-        pass
-    return []
-
-
-def _parse_list_field(raw):
-    if raw is None:
-        return []
-    if isinstance(raw, list):
-        return [str(v).strip() for v in raw if str(v).strip()]
-    if isinstance(raw, str):
-        val = raw.strip()
-        if not val:
-            return []
-    try:
-        parsed = json.loads(raw)
-        if isinstance(parsed, list):
-            return [str(v).strip() for v in parsed if str(v).strip()]
-    except Exception:
-        pass
-    if isinstance(raw, str):
-        return [raw.strip()]
-    return []
-
-
 def _serialize_doctor(row: dict, public: bool = False):
     if not row:
         return None
-    days = _parse_days_from_row(row.get("availability_days"))
+    # List fields are JSONB arrays, normalised on write; psycopg returns lists.
     data = {
         "id": row.get("id"),
         "full_name": row.get("full_name"),
         "specialty": row.get("specialty"),
         "avatar_url": row.get("avatar_url"),
-        "availability_days": days,
+        "availability_days": row.get("availability_days") or [],
         "availability_start": _format_time(row.get("availability_start")),
         "availability_end": _format_time(row.get("availability_end")),
         "bio": row.get("bio"),
-        "experience": _parse_list_field(row.get("experience")),
-        "certifications": _parse_list_field(row.get("certifications")),
-        "specialisations": _parse_list_field(row.get("specialisations")),
+        "experience": row.get("experience") or [],
+        "certifications": row.get("certifications") or [],
+        "specialisations": row.get("specialisations") or [],
     }
     if public:
         return data
@@ -209,66 +196,202 @@ def _serialize_doctor(row: dict, public: bool = False):
 
 
 def _fetch_doctor_row(doctor_id: int):
-    with get_connection() as conn:
-        with conn.cursor() as cur:
-            cur.execute("SELECT * FROM doctors WHERE id = %s LIMIT 1", (doctor_id,))
-            return cur.fetchone()
+    with get_db().cursor() as cur:
+        cur.execute("SELECT * FROM doctors WHERE id = %s LIMIT 1", (doctor_id,))
+        return cur.fetchone()
+
+
+def _build_directory():
+    """Serialize every active doctor once for doctor_directory.get_snapshot()."""
+    with get_db().cursor() as cur:
+        cur.execute(
+            """
+            SELECT *, ROW_NUMBER() OVER (ORDER BY full_name ASC) AS name_rank
+            FROM doctors
+            WHERE is_active = TRUE
+            ORDER BY id ASC
+            """
+        )
+        rows = cur.fetchall() or []
+
+    items = []
+    by_id = {}
+    by_specialty = {}
+    for row in rows:
+        item = _serialize_doctor(row, public=True)
+        items.append(item)
+        by_id[item["id"]] = item
+        by_specialty.setdefault((row.get("specialty") or "").lower(), []).append(item)
+
+    by_name = [
+        {"id": row.get("id"), "full_name": row.get("full_name"), "specialty": row.get("specialty")}
+        for row in sorted(rows, key=lambda r: r.get("name_rank"))
+    ]
+    return {
+        "items": items,
+        "by_id": by_id,
+        "by_specialty": by_specialty,
+        "by_name": by_name,
+        # Same rows give the same digest in every worker, so it doubles as
+        # the ETag of every directory response.
+        "etag": make_etag(items, by_name),
+        # Encoded response bodies, filled on first use (see cached_success_response).
+        "bodies": {},
+    }
+
+
+def _directory():
+    if "doctor_directory" not in g:
+        g.doctor_directory = doctor_directory.get_snapshot(_build_directory)
+    return g.doctor_directory
+
+
+def _directory_etag(doctor_id: int = None):
+    directory = _directory()
+    if doctor_id is not None and doctor_id not in directory["by_id"]:
+        return None
+    return directory["etag"]
+
+
+def _search_tsquery(q: str):
+    """Turn free text into a prefix-matching AND query, or None if it has no words."""
+    terms = re.findall(r"\w+", q)[:SEARCH_MAX_TERMS]
+    if not terms:
+        return None
+    return " & ".join(f"'{term}':*" for term in terms)
+
+
+def _has_trigram(cur) -> bool:
+    # Migration 017 only installs pg_trgm where the server provides it.
+    global _trigram_available
+    if _trigram_available is None:
+        cur.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+        _trigram_available = cur.fetchone() is not None
+    return _trigram_available
+
+
+def _highlight(text):
+    if not text:
+        return None
+    escaped = html.escape(text, quote=False)
+    return escaped.replace(_HIGHLIGHT_START, "<mark>").replace(_HIGHLIGHT_STOP, "</mark>")
+
+
+@doctors_bp.get("/api/doctors/search")
+def search_doctors():
+    q = str(request.args.get("q") or "").strip()[:200]
+    if not q:
+        return _error(400, "validation_error", "q is required")
+
+    limit = parse_page_limit(request.args.get("limit"), SEARCH_DEFAULT_LIMIT, SEARCH_MAX_LIMIT)
+    if limit is None:
+        return _error(400, "validation_error", "limit must be a positive integer")
+    try:
+        offset = int(request.args.get("offset") or 0)
+    except ValueError:
+        offset = -1
+    if offset < 0:
+        return _error(400, "validation_error", "offset must be a non-negative integer")
+
+    tsquery = _search_tsquery(q)
+    if tsquery is None:
+        return success_response({"count": 0, "items": [], "next_offset": None})
+
+    headline_opts = f"StartSel={_HIGHLIGHT_START}, StopSel={_HIGHLIGHT_STOP}"
+    params = {
+        "tsquery": tsquery,
+        "q": q,
+        "limit": limit,
+        "offset": offset,
+        "short_opts": headline_opts + ", HighlightAll=true",
+        "bio_opts": headline_opts + ", MaxWords=25, MinWords=10, MaxFragments=2",
+    }
+
+    with get_db().cursor() as cur:
+        # Only ids and scores are ranked over all matches; full rows and
+        # ts_headline, the expensive part, are fetched for the page alone.
+        if _has_trigram(cur):
+            score = "ts_rank(d.search_vector, q.query) + word_similarity(%(q)s, d.full_name || ' ' || d.specialty)"
+            match = "(d.search_vector @@ q.query OR %(q)s <%% (d.full_name || ' ' || d.specialty))"
+        else:
+            score = "ts_rank(d.search_vector, q.query)"
+            match = "d.search_vector @@ q.query"
+        cur.execute(
+            f"""
+            WITH q AS (SELECT to_tsquery('english', %(tsquery)s) AS query),
+            page AS (
+                SELECT d.id, {score} AS score, COUNT(*) OVER () AS total
+                FROM doctors d, q
+                WHERE d.is_active = TRUE AND {match}
+                ORDER BY score DESC, d.id ASC
+                LIMIT %(limit)s OFFSET %(offset)s
+            )
+            SELECT d.*, page.score, page.total,
+                   ts_headline('english', d.full_name, q.query, %(short_opts)s) AS full_name_hl,
+                   ts_headline('english', d.specialty, q.query, %(short_opts)s) AS specialty_hl,
+                   ts_headline('english', COALESCE(d.bio, ''), q.query, %(bio_opts)s) AS bio_hl
+            FROM page
+            JOIN doctors d ON d.id = page.id
+            CROSS JOIN q
+            ORDER BY page.score DESC, page.id ASC
+            """,
+            params,
+        )
+        rows = cur.fetchall() or []
+
+    items = []
+    for row in rows:
+        item = _serialize_doctor(row, public=True)
+        item["score"] = round(float(row.get("score") or 0), 4)
+        item["highlights"] = {
+            "full_name": _highlight(row.get("full_name_hl")),
+            "specialty": _highlight(row.get("specialty_hl")),
+            "bio": _highlight(row.get("bio_hl")),
+        }
+        items.append(item)
+
+    total = rows[0].get("total") if rows else 0
+    next_offset = offset + len(rows) if offset + len(rows) < total else None
+    return success_response({"count": total, "items": items, "next_offset": next_offset})
 
 
 @doctors_bp.route("/api/doctors", methods=["GET"])
+@conditional(_directory_etag)
 def list_doctors():
     specialty = request.args.get("specialty")
     available = request.args.get("available")
     active = (request.args.get("active") or "").strip().lower()
 
-    sql = "SELECT * FROM doctors WHERE is_active = TRUE"
-    params = []
-
-    if specialty:
-        sql += " AND LOWER(specialty) = %s"
-        params.append(str(specialty).strip().lower())
-
     if available is not None and str(available).strip().lower() == "false":
         return success_response({"count": 0, "items": []})
 
-    if active in ("1", "true", "yes"):
-        sql = """
-            SELECT id, full_name, specialty
-            FROM doctors
-            WHERE is_active = TRUE
-            ORDER BY full_name ASC
-        """
-        with get_connection() as conn:
-            with conn.cursor() as cur:
-                cur.execute(sql)
-                rows = cur.fetchall()
-
-        return jsonify([
-            {
-                "id": r.get("id"),
-                "full_name": r.get("full_name"),
-                "specialty": r.get("specialty"),
-            }
-            for r in rows or []
-        ]), 200
-
-    sql += " ORDER BY id ASC"
+    directory = _directory()
 
-    with get_connection() as conn:
-        with conn.cursor() as cur:
-            cur.execute(sql, tuple(params))
-            rows = cur.fetchall()
+    if active in ("1", "true", "yes"):
+        return jsonify(directory["by_name"]), 200
 
-    items = [_serialize_doctor(r, public=True) for r in (rows or [])]
-    return success_response({"count": len(items), "items": items})
+    if specialty:
+        key = str(specialty).strip().lower()
+        items = directory["by_specialty"].get(key)
+        if items is None:
+            return success_response({"count": 0, "items": []})
+        cache_key = ("specialty", key)
+    else:
+        items = directory["items"]
+        cache_key = ("all",)
+    return cached_success_response(
+        directory["bodies"], cache_key, lambda: {"count": len(items), "items": items}
+    )
 
 
 @doctors_bp.get("/api/doctors/<int:doctor_id>")
+@conditional(_directory_etag)
 def get_doctor_public(doctor_id: int):
-    row = _fetch_doctor_row(doctor_id)
-    if not row or not row.get("is_active"):
+    directory = _directory()
+    item = directory["by_id"].get(doctor_id)
+    if item is None:
         return _error(404, "not_found", "Doctor not found")
-    return success_response(_serialize_doctor(row, public=True))
+    return cached_success_response(directory["bodies"], ("doctor", doctor_id), lambda: item)
 
 
 @doctors_bp.route("/api/admin/doctors", methods=["GET"])
@@ -277,13 +400,34 @@ def admin_list_doctors():
     if guard:
         return guard
 
-    with get_connection() as conn:
-        with conn.cursor() as cur:
-            cur.execute("SELECT * FROM doctors ORDER BY id ASC")
-            rows = cur.fetchall()
+    # Same shape as _serialize_doctor(row), assembled by Postgres.
+    with get_db().cursor() as cur:
+        cur.execute(
+            f"""
+            SELECT COALESCE(json_agg(json_build_object(
+                       'id', id,
+                       'full_name', full_name,
+                       'specialty', specialty,
+                       'avatar_url', avatar_url,
+                       'availability_days', availability_days,
+                       'availability_start', {sql_time("availability_start")},
+                       'availability_end', {sql_time("availability_end")},
+                       'bio', bio,
+                       'experience', experience,
+                       'certifications', certifications,
+                       'specialisations', specialisations,
+                       'email', email,
+                       'phone', phone,
+                       'is_active', COALESCE(is_active, FALSE),
+                       'created_at', created_at,
+                       'updated_at', updated_at
+                   ) ORDER BY id ASC), '[]')::text AS items
+            FROM doctors
+            """
+        )
+        items = cur.fetchone().get("items")
 
-    items = [_serialize_doctor(r) for r in (rows or [])]
-    return jsonify({"success": True, "data": items}), 200
+    return raw_success_response(RawJSON(items))
 
 
 @doctors_bp.route("/api/admin/doctors/<int:doctor_id>", methods=["GET"])
@@ -342,53 +486,54 @@ def admin_create_doctor():
     temp_password = _generate_temp_password()
     pwd_hash = generate_password_hash(temp_password)
 
-    with get_connection() as conn:
-        with conn.cursor() as cur:
-            cur.execute("SELECT 1 FROM doctors WHERE LOWER(email) = %s LIMIT 1", (email,))
-            if cur.fetchone():
-                return _error(409, "conflict", "email must be unique")
-
-            cur.execute("SELECT 1 FROM users WHERE LOWER(email) = %s LIMIT 1", (email,))
-            if cur.fetchone():
-                return _error(409, "conflict", "user with email already exists")
-
-            cur.execute(
-                """
-                INSERT INTO doctors
-                    (full_name, email, specialty, phone, is_active,
-                     availability_days, availability_start, availability_end)
-                VALUES
-                    (%s, %s, %s, %s, %s, %s, %s, %s)
-                RETURNING *;
-                """,
-                (
-                    full_name,
-                    email,
-                    specialty,
-                    phone,
-                    True if is_active is None else is_active,
-                    json.dumps(days),
-                    start_norm,
-                    end_norm,
-                ),
-            )
-            row = cur.fetchone()
-
-            cur.execute(
-                """
-                INSERT INTO users (email, password_hash, name, phone, role, doctor_id)
-                VALUES (%s, %s, %s, %s, %s, %s)
-                """,
-                (
-                    email,
-                    pwd_hash,
-                    full_name,
-                    phone,
-                    "doctor",
-                    row.get("id"),
-                ),
-            )
-        conn.commit()
+    with get_db().cursor() as cur:
+        cur.execute("SELECT 1 FROM doctors WHERE LOWER(email) = %s LIMIT 1", (email,))
+        if cur.fetchone():
+            return _error(409, "conflict", "email must be unique")
+
+        cur.execute("SELECT 1 FROM users WHERE LOWER(email) = %s LIMIT 1", (email,))
+        if cur.fetchone():
+            return _error(409, "conflict", "user with email already exists")
+
+        cur.execute(
+            """
+            INSERT INTO doctors
+                (full_name, email, specialty, phone, is_active,
+                 availability_days, availability_start, availability_end)
+            VALUES
+                (%s, %s, %s, %s, %s, %s, %s, %s)
+            RETURNING *;
+            """,
+            (
+                full_name,
+                email,
+                specialty,
+                phone,
+                True if is_active is None else is_active,
+                Jsonb(days),
+                start_norm,
+                end_norm,
+            ),
+        )
+        row = cur.fetchone()
+
+        cur.execute(
+            """
+            INSERT INTO users (email, password_hash, name, phone, role, doctor_id)
+            VALUES (%s, %s, %s, %s, %s, %s)
+            """,
+            (
+                email,
+                pwd_hash,
+                full_name,
+                phone,
+                "doctor",
+                row.get("id"),
+            ),
+        )
+
+    get_db().commit()
+    doctor_directory.invalidate()
 
     try:
         email_body = "\n".join([
@@ -463,7 +608,7 @@ def admin_update_doctor(doctor_id: int):
         if err:
             return _error(400, "validation_error", err)
         if days is not None:
-            updates["availability_days"] = json.dumps(days)
+            updates["availability_days"] = Jsonb(days)
 
     start_min, start_norm, start_err = _parse_time_field(
         payload.get("availability_start"), "availability_start", False
@@ -498,22 +643,23 @@ def admin_update_doctor(doctor_id: int):
     if not updates:
         return _error(400, "validation_error", "No fields to update")
 
+    availability_changed = any(key.startswith("availability_") for key in updates)
+
     if "email" in updates and updates["email"] != _norm_email(row.get("email")):
-        with get_connection() as conn:
-            with conn.cursor() as cur:
-                cur.execute(
-                    "SELECT 1 FROM doctors WHERE LOWER(email) = %s AND id <> %s LIMIT 1",
-                    (updates["email"], doctor_id),
-                )
-                if cur.fetchone():
-                    return _error(409, "conflict", "email must be unique")
-
-                cur.execute(
-                    "SELECT 1 FROM users WHERE LOWER(email) = %s AND doctor_id <> %s LIMIT 1",
-                    (updates["email"], doctor_id),
-                )
-                if cur.fetchone():
-                    return _error(409, "conflict", "user with email already exists")
+        with get_db().cursor() as cur:
+            cur.execute(
+                "SELECT 1 FROM doctors WHERE LOWER(email) = %s AND id <> %s LIMIT 1",
+                (updates["email"], doctor_id),
+            )
+            if cur.fetchone():
+                return _error(409, "conflict", "email must be unique")
+
+            cur.execute(
+                "SELECT 1 FROM users WHERE LOWER(email) = %s AND doctor_id <> %s LIMIT 1",
+                (updates["email"], doctor_id),
+            )
+            if cur.fetchone():
+                return _error(409, "conflict", "user with email already exists")
 
     fields = []
     values = []
@@ -527,31 +673,41 @@ def admin_update_doctor(doctor_id: int):
     sql = "UPDATE doctors SET " + ", ".join(fields) + " WHERE id = %s RETURNING *;"
 
     updated = None
-    with get_connection() as conn:
-        with conn.cursor() as cur:
-            cur.execute(sql, tuple(values))
-            updated = cur.fetchone()
-
-            user_updates = {}
-            if "full_name" in updates:
-                user_updates["name"] = updates["full_name"]
-            if "email" in updates:
-                user_updates["email"] = updates["email"]
-            if "phone" in updates:
-                user_updates["phone"] = updates["phone"]
-
-            if user_updates:
-                fields = []
-                params = []
-                for key, value in user_updates.items():
-                    fields.append(f"{key} = %s")
-                    params.append(value)
-                params.append(doctor_id)
-                cur.execute(
-                    f"UPDATE users SET {', '.join(fields)} WHERE doctor_id = %s;",
-                    tuple(params),
-                )
-        conn.commit()
+    with get_db().cursor() as cur:
+        cur.execute(sql, tuple(values))
+        updated = cur.fetchone()
+
+        # Bookable slots come from the weekly schedule tables; replace that
+        # schedule with the edited hours so the form is not silently ignored.
+        if availability_changed:
+            availability_engine.save_weekly(
+                cur, doctor_id, availability_engine.schedule_from_row(updated), sync_columns=False
+            )
+
+        user_updates = {}
+        if "full_name" in updates:
+            user_updates["name"] = updates["full_name"]
+        if "email" in updates:
+            user_updates["email"] = updates["email"]
+        if "phone" in updates:
+            user_updates["phone"] = updates["phone"]
+
+        if user_updates:
+            fields = []
+            params = []
+            for key, value in user_updates.items():
+                fields.append(f"{key} = %s")
+                params.append(value)
+            params.append(doctor_id)
+            cur.execute(
+                f"UPDATE users SET {', '.join(fields)} WHERE doctor_id = %s;",
+                tuple(params),
+            )
+
+    get_db().commit()
+    doctor_directory.invalidate()
+    if availability_changed:
+        availability_engine.invalidate_weekly(doctor_id)
 
     return jsonify({"success": True, "data": _serialize_doctor(updated)}), 200
 
@@ -571,18 +727,19 @@ def admin_update_doctor_status(doctor_id: int):
     if not row:
         return _error(404, "not_found", "Doctor not found")
 
-    with get_connection() as conn:
-        with conn.cursor() as cur:
-            cur.execute(
-                """
-                UPDATE doctors
-                SET is_active = %s, updated_at = NOW()
-                WHERE id = %s
-                RETURNING *;
-                """,
-                (is_active, doctor_id),
-            )
-            updated = cur.fetchone()
-        conn.commit()
+    with get_db().cursor() as cur:
+        cur.execute(
+            """
+            UPDATE doctors
+            SET is_active = %s, updated_at = NOW()
+            WHERE id = %s
+            RETURNING *;
+            """,
+            (is_active, doctor_id),
+        )
+        updated = cur.fetchone()
+
+    get_db().commit()
+    doctor_directory.invalidate()
 
     return jsonify({"success": True, "data": _serialize_doctor(updated)}), 200
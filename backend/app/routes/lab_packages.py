@@ -3,8 +3,9 @@ import re
 from decimal import Decimal, InvalidOperation
 from flask import Blueprint, request, session
 
-from app.db import get_connection
-from app.routes.utils import success_response, error_response
+from app.db import get_db
+from app.http_cache import conditional, make_etag
+from app.routes.utils import RawJSON, raw_success_response, success_response, error_response
 
 
 lab_packages_bp = Blueprint("lab_packages", __name__)
@@ -65,41 +66,37 @@ def _row_to_payload(row):
     }
 
 
+def _packages_etag():
+    # Every admin write bumps updated_at; the count catches removed rows.
+    with get_db().cursor() as cur:
+        cur.execute("SELECT COUNT(*) AS total, MAX(updated_at) AS last_update FROM lab_packages")
+        row = cur.fetchone() or {}
+    return make_etag("lab_packages", row.get("total"), row.get("last_update"))
+
+
 @lab_packages_bp.get("/api/lab-packages")
+@conditional(_packages_etag)
 def list_public_packages():
-    with get_connection() as conn:
-        with conn.cursor() as cur:
-            cur.execute(
-                """
-                SELECT id, slug, name, price_mur, currency, preparation_note,
-                       category, contents
-                FROM lab_packages
-                WHERE is_active = TRUE
-                ORDER BY sort_order ASC, id ASC
-                """
-            )
-            rows = cur.fetchall() or []
-
-    data = []
-    for row in rows:
-        contents = row.get("contents")
-        if isinstance(contents, str):
-            try:
-                contents = json.loads(contents)
-            except Exception:
-                contents = []
-        data.append({
-            "id": row.get("id"),
-            "slug": row.get("slug"),
-            "name": row.get("name"),
-            "price_mur": float(row.get("price_mur")) if row.get("price_mur") is not None else 0,
-            "currency": row.get("currency"),
-            "preparation_note": row.get("preparation_note"),
-            "category": row.get("category"),
-            "contents": contents or [],
-        })
-
-    return success_response(data)
+    with get_db().cursor() as cur:
+        cur.execute(
+            """
+            SELECT COALESCE(json_agg(json_build_object(
+                       'id', id,
+                       'slug', slug,
+                       'name', name,
+                       'price_mur', COALESCE(price_mur, 0)::float8,
+                       'currency', currency,
+                       'preparation_note', preparation_note,
+                       'category', category,
+                       'contents', CASE WHEN jsonb_typeof(contents) = 'array' THEN contents ELSE '[]'::jsonb END
+                   ) ORDER BY sort_order ASC, id ASC), '[]')::text AS items
+            FROM lab_packages
+            WHERE is_active = TRUE
+            """
+        )
+        data = RawJSON(cur.fetchone().get("items"))
+
+    return raw_success_response(data)
 
 
 @lab_packages_bp.get("/api/admin/lab-packages")
@@ -108,16 +105,15 @@ def admin_list_packages():
     if guard:
         return guard
 
-    with get_connection() as conn:
-        with conn.cursor() as cur:
-            cur.execute(
-                """
-                SELECT *
-                FROM lab_packages
-                ORDER BY sort_order ASC, id ASC
-                """
-            )
-            rows = cur.fetchall() or []
+    with get_db().cursor() as cur:
+        cur.execute(
+            """
+            SELECT *
+            FROM lab_packages
+            ORDER BY sort_order ASC, id ASC
+            """
+        )
+        rows = cur.fetchall() or []
 
     data = [_row_to_payload(row) for row in rows]
     return success_response(data)
@@ -165,33 +161,31 @@ def admin_create_package():
     if field_errors:
         return error_response(400, "validation_error", "Validation error")
 
-    with get_connection() as conn:
-        with conn.cursor() as cur:
-            cur.execute("SELECT 1 FROM lab_packages WHERE slug = %s", (slug,))
-            if cur.fetchone():
-                return error_response(409, "conflict", "Slug already exists")
-
-            cur.execute(
-                """
-                INSERT INTO lab_packages
-                    (slug, name, price_mur, currency, preparation_note, category, contents, sort_order)
-                VALUES
-                    (%s, %s, %s, %s, %s, %s, %s, %s)
-                RETURNING *
-                """,
-                (
-                    slug,
-                    name,
-                    price_mur,
-                    currency,
-                    preparation_note,
-                    category,
-                    json.dumps(contents),
-                    sort_order,
-                ),
-            )
-            row = cur.fetchone()
-        conn.commit()
+    with get_db().cursor() as cur:
+        cur.execute("SELECT 1 FROM lab_packages WHERE slug = %s", (slug,))
+        if cur.fetchone():
+            return error_response(409, "conflict", "Slug already exists")
+
+        cur.execute(
+            """
+            INSERT INTO lab_packages
+                (slug, name, price_mur, currency, preparation_note, category, contents, sort_order)
+            VALUES
+                (%s, %s, %s, %s, %s, %s, %s, %s)
+            RETURNING *
+            """,
+            (
+                slug,
+                name,
+                price_mur,
+                currency,
+                preparation_note,
+                category,
+                json.dumps(contents),
+                sort_order,
+            ),
+        )
+        row = cur.fetchone()
 
     return success_response(_row_to_payload(row), 201)
 
@@ -213,14 +207,13 @@ def admin_update_package(package_id: int):
             return error_response(400, "validation_error", "Slug is required")
         if not _is_valid_slug(slug):
             return error_response(400, "validation_error", "Slug must be url-friendly")
-        with get_connection() as conn:
-            with conn.cursor() as cur:
-                cur.execute(
-                    "SELECT 1 FROM lab_packages WHERE slug = %s AND id <> %s",
-                    (slug, package_id),
-                )
-                if cur.fetchone():
-                    return error_response(409, "conflict", "Slug already exists")
+        with get_db().cursor() as cur:
+            cur.execute(
+                "SELECT 1 FROM lab_packages WHERE slug = %s AND id <> %s",
+                (slug, package_id),
+            )
+            if cur.fetchone():
+                return error_response(409, "conflict", "Slug already exists")
         updates.append("slug = %s")
         params.append(slug)
 
@@ -274,11 +267,9 @@ def admin_update_package(package_id: int):
 
     sql = "UPDATE lab_packages SET " + ", ".join(updates) + " WHERE id = %s RETURNING *;"
 
-    with get_connection() as conn:
-        with conn.cursor() as cur:
-            cur.execute(sql, tuple(params))
-            row = cur.fetchone()
-        conn.commit()
+    with get_db().cursor() as cur:
+        cur.execute(sql, tuple(params))
+        row = cur.fetchone()
 
     if not row:
         return error_response(404, "not_found", "Lab package not found")
@@ -298,14 +289,12 @@ def admin_update_status(package_id: int):
     if not isinstance(is_active, bool):
         return error_response(400, "validation_error", "is_active must be boolean")
 
-    with get_connection() as conn:
-        with conn.cursor() as cur:
-            cur.execute(
-                "UPDATE lab_packages SET is_active = %s, updated_at = NOW() WHERE id = %s RETURNING *",
-                (is_active, package_id),
-            )
-            row = cur.fetchone()
-        conn.commit()
+    with get_db().cursor() as cur:
+        cur.execute(
+            "UPDATE lab_packages SET is_active = %s, updated_at = NOW() WHERE id = %s RETURNING *",
+            (is_active, package_id),
+        )
+        row = cur.fetchone()
 
     if not row:
         return error_response(404, "not_found", "Lab package not found")
@@ -0,0 +1,27 @@
+import hmac
+
+from flask import Blueprint, Response, request, session
+
+from app import metrics
+from app.config import env_str
+from app.routes.utils import error_response
+
+metrics_bp = Blueprint("metrics", __name__)
+
+
+def _authorized() -> bool:
+    """An admin session, or ``Authorization: Bearer $METRICS_TOKEN`` for scrapers."""
+    if (session.get("role") or "").strip().lower() == "admin":
+        return True
+    token = env_str("METRICS_TOKEN")
+    auth = request.headers.get("Authorization") or ""
+    if not token or not auth.startswith("Bearer "):
+        return False
+    return hmac.compare_digest(auth[len("Bearer "):].strip().encode(), token.encode())
+
+
+@metrics_bp.get("/metrics")
+def prometheus_metrics():
+    if not _authorized():
+        return error_response(401, "unauthorized", "Unauthorized")
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
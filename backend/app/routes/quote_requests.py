@@ -3,13 +3,14 @@ import io
 import json
 import os
 import re
+import shutil
 import uuid
 import datetime
 from pathlib import Path
 from flask import Blueprint, request, send_file, jsonify, session, Response
 
-from app.db import get_connection
-from app.routes.utils import success_response, error_response
+from app.db import get_db, stream_rows
+from app.routes.utils import RawJSON, raw_success_response, sql_http_date, success_response, error_response
 from app.email_utils import send_email
 
 
@@ -24,6 +25,7 @@ ALLOWED_MIMES = {
     "image/png",
 }
 MAX_FILE_SIZE = 5 * 1024 * 1024
+EXPORT_CHUNK_SIZE = 64 * 1024
 
 UPLOADS_ROOT = Path(os.getenv("UPLOADS_DIR") or (Path(__file__).resolve().parents[2] / "uploads"))
 QUOTE_UPLOADS_ROOT = UPLOADS_ROOT / "quote_requests"
@@ -119,6 +121,50 @@ def _categories_from_row(raw):
     return []
 
 
+def _export_csv_chunks(sql, params):
+    output = io.StringIO()
+    writer = csv.writer(output)
+    writer.writerow([
+        "id",
+        "created_at",
+        "first_name",
+        "last_name",
+        "email",
+        "phone",
+        "gender",
+        "dob",
+        "status",
+        "service_categories",
+        "preferred_doctor",
+        "message",
+        "admin_notes",
+    ])
+
+    for r in stream_rows(sql, params):
+        categories = _categories_from_row(r.get("service_categories"))
+        writer.writerow([
+            r.get("id"),
+            r.get("created_at"),
+            r.get("first_name"),
+            r.get("last_name"),
+            r.get("email"),
+            r.get("phone"),
+            r.get("gender"),
+            r.get("dob"),
+            r.get("status"),
+            ", ".join(categories),
+            r.get("doctor_name"),
+            r.get("message"),
+            r.get("admin_notes"),
+        ])
+        if output.tell() >= EXPORT_CHUNK_SIZE:
+            yield output.getvalue()
+            output.seek(0)
+            output.truncate(0)
+
+    yield output.getvalue()
+
+
 @quote_requests_bp.post("/api/quote-requests")
 def create_quote_request():
     # Rate limiting placeholder: consider throttling by IP/email in production.
@@ -208,58 +254,57 @@ def create_quote_request():
         }), 400
 
     if doctor_id is not None:
-        with get_connection() as conn:
-            with conn.cursor() as cur:
-                cur.execute(
-                    "SELECT id, full_name FROM doctors WHERE id = %s AND is_active = TRUE",
-                    (doctor_id,),
-                )
-                doc_row = cur.fetchone()
-                if not doc_row:
-                    return jsonify({
-                        "success": False,
-                        "error": {
-                            "message": "Validation error",
-                            "field_errors": {"doctor_id": "Selected doctor is not available"},
-                        },
-                    }), 400
-                preferred_doctor = doc_row.get("full_name")
-
-    with get_connection() as conn:
-        with conn.cursor() as cur:
+        with get_db().cursor() as cur:
             cur.execute(
-                """
-                INSERT INTO quote_requests
-                    (first_name, last_name, gender, dob, phone, email, service_categories,
-                     doctor_id, message, status)
-                VALUES
-                    (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-                RETURNING id, created_at;
-                """,
-                (
-                    first_name,
-                    last_name,
-                    gender,
-                    dob,
-                    phone,
-                    email,
-                    json.dumps(service_categories),
-                    doctor_id,
-                    message,
-                    "new",
-                ),
+                "SELECT id, full_name FROM doctors WHERE id = %s AND is_active = TRUE",
+                (doctor_id,),
             )
-            row = cur.fetchone()
-            quote_request_id = row.get("id")
-            created_at = row.get("created_at")
-        conn.commit()
+            doc_row = cur.fetchone()
+            if not doc_row:
+                return jsonify({
+                    "success": False,
+                    "error": {
+                        "message": "Validation error",
+                        "field_errors": {"doctor_id": "Selected doctor is not available"},
+                    },
+                }), 400
+            preferred_doctor = doc_row.get("full_name")
+
+    with get_db().cursor() as cur:
+        cur.execute(
+            """
+            INSERT INTO quote_requests
+                (first_name, last_name, gender, dob, phone, email, service_categories,
+                 doctor_id, message, status)
+            VALUES
+                (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+            RETURNING id, created_at;
+            """,
+            (
+                first_name,
+                last_name,
+                gender,
+                dob,
+                phone,
+                email,
+                json.dumps(service_categories),
+                doctor_id,
+                message,
+                "new",
+            ),
+        )
+        row = cur.fetchone()
+        quote_request_id = row.get("id")
+        created_at = row.get("created_at")
 
     folder = QUOTE_UPLOADS_ROOT / str(quote_request_id)
 
-    if id_document:
-        saved = _save_file(id_document, folder)
-        with get_connection() as conn:
-            with conn.cursor() as cur:
+    # The quote row only exists once the request commits; if anything below
+    # fails it rolls back, so the files already written must go with it.
+    try:
+        if id_document:
+            saved = _save_file(id_document, folder)
+            with get_db().cursor() as cur:
                 cur.execute(
                     """
                     INSERT INTO quote_request_files
@@ -276,12 +321,10 @@ def create_quote_request():
                         saved["size"],
                     ),
                 )
-            conn.commit()
 
-    for doc in valid_documents:
-        saved = _save_file(doc, folder)
-        with get_connection() as conn:
-            with conn.cursor() as cur:
+        for doc in valid_documents:
+            saved = _save_file(doc, folder)
+            with get_db().cursor() as cur:
                 cur.execute(
                     """
                     INSERT INTO quote_request_files
@@ -298,7 +341,11 @@ def create_quote_request():
                         saved["size"],
                     ),
                 )
-            conn.commit()
+
+        get_db().commit()
+    except Exception:
+        shutil.rmtree(folder, ignore_errors=True)
+        raise
 
     uploaded_files_count = len(valid_documents) + (1 if id_document else 0)
     submitted_at = created_at.isoformat() if isinstance(created_at, datetime.datetime) else ""
@@ -368,10 +415,18 @@ def admin_list_quote_requests():
         except ValueError:
             pass
 
-    sql = """
-        SELECT qr.id, qr.first_name, qr.last_name, qr.email, qr.phone,
-               qr.status, qr.service_categories, qr.created_at,
-               d.full_name AS doctor_name
+    sql = f"""
+        SELECT COUNT(*) AS count,
+               COALESCE(json_agg(json_build_object(
+                   'id', qr.id,
+                   'created_at', {sql_http_date("qr.created_at")},
+                   'full_name', btrim(COALESCE(qr.first_name, '') || ' ' || COALESCE(qr.last_name, '')),
+                   'email', qr.email,
+                   'phone', qr.phone,
+                   'status', qr.status,
+                   'preferred_doctor', d.full_name,
+                   'categories', json_text_list(qr.service_categories)
+               ) ORDER BY qr.created_at DESC), '[]')::text AS items
         FROM quote_requests qr
         LEFT JOIN doctors d ON d.id = qr.doctor_id
     """
@@ -379,28 +434,11 @@ def admin_list_quote_requests():
     if filters:
         sql += " WHERE " + " AND ".join(filters)
 
-    sql += " ORDER BY qr.created_at DESC"
-
-    with get_connection() as conn:
-        with conn.cursor() as cur:
-            cur.execute(sql, tuple(params))
-            rows = cur.fetchall() or []
+    with get_db().cursor() as cur:
+        cur.execute(sql, tuple(params))
+        row = cur.fetchone()
 
-    items = []
-    for r in rows:
-        categories = _categories_from_row(r.get("service_categories"))
-        items.append({
-            "id": r.get("id"),
-            "created_at": r.get("created_at"),
-            "full_name": f"{r.get('first_name')} {r.get('last_name')}".strip(),
-            "email": r.get("email"),
-            "phone": r.get("phone"),
-            "status": r.get("status"),
-            "preferred_doctor": r.get("doctor_name"),
-            "categories": categories,
-        })
-
-    return success_response({"count": len(items), "items": items})
+    return raw_success_response({"count": row.get("count"), "items": RawJSON(row.get("items"))})
 
 
 @quote_requests_bp.get("/api/admin/quote-requests/export")
@@ -459,52 +497,14 @@ def admin_export_quote_requests():
 
     sql += " ORDER BY qr.created_at DESC"
 
-    with get_connection() as conn:
-        with conn.cursor() as cur:
-            cur.execute(sql, tuple(params))
-            rows = cur.fetchall() or []
-
-    output = io.StringIO()
-    writer = csv.writer(output)
-    writer.writerow([
-        "id",
-        "created_at",
-        "first_name",
-        "last_name",
-        "email",
-        "phone",
-        "gender",
-        "dob",
-        "status",
-        "service_categories",
-        "preferred_doctor",
-        "message",
-        "admin_notes",
-    ])
-
-    for r in rows:
-        categories = _categories_from_row(r.get("service_categories"))
-        writer.writerow([
-            r.get("id"),
-            r.get("created_at"),
-            r.get("first_name"),
-            r.get("last_name"),
-            r.get("email"),
-            r.get("phone"),
-            r.get("gender"),
-            r.get("dob"),
-            r.get("status"),
-            ", ".join(categories),
-            r.get("doctor_name"),
-            r.get("message"),
-            r.get("admin_notes"),
-        ])
-
-    csv_data = output.getvalue()
     headers = {
         "Content-Disposition": "attachment; filename=quote-requests-export.csv"
     }
-    return Response(csv_data, mimetype="text/csv; charset=utf-8", headers=headers)
+    return Response(
+        _export_csv_chunks(sql, tuple(params)),
+        mimetype="text/csv; charset=utf-8",
+        headers=headers,
+    )
 
 
 @quote_requests_bp.get("/api/admin/quote-requests/<int:quote_request_id>")
@@ -513,32 +513,31 @@ def admin_get_quote_request(quote_request_id: int):
     if guard:
         return guard
 
-    with get_connection() as conn:
-        with conn.cursor() as cur:
-            cur.execute(
-                """
-                SELECT qr.*, d.full_name AS doctor_name
-                FROM quote_requests qr
-                LEFT JOIN doctors d ON d.id = qr.doctor_id
-                WHERE qr.id = %s
-                """,
-                (quote_request_id,),
-            )
-            row = cur.fetchone()
-
-            if not row:
-                return error_response(404, "not_found", "Quote request not found")
-
-            cur.execute(
-                """
-                SELECT *
-                FROM quote_request_files
-                WHERE quote_request_id = %s
-                ORDER BY created_at ASC
-                """,
-                (quote_request_id,),
-            )
-            files = cur.fetchall() or []
+    with get_db().cursor() as cur:
+        cur.execute(
+            """
+            SELECT qr.*, d.full_name AS doctor_name
+            FROM quote_requests qr
+            LEFT JOIN doctors d ON d.id = qr.doctor_id
+            WHERE qr.id = %s
+            """,
+            (quote_request_id,),
+        )
+        row = cur.fetchone()
+
+        if not row:
+            return error_response(404, "not_found", "Quote request not found")
+
+        cur.execute(
+            """
+            SELECT *
+            FROM quote_request_files
+            WHERE quote_request_id = %s
+            ORDER BY created_at ASC
+            """,
+            (quote_request_id,),
+        )
+        files = cur.fetchall() or []
 
     categories = _categories_from_row(row.get("service_categories"))
 
@@ -605,11 +604,9 @@ def admin_update_quote_request(quote_request_id: int):
 
     sql = "UPDATE quote_requests SET " + ", ".join(updates) + " WHERE id = %s RETURNING *;"
 
-    with get_connection() as conn:
-        with conn.cursor() as cur:
-            cur.execute(sql, tuple(params))
-            row = cur.fetchone()
-        conn.commit()
+    with get_db().cursor() as cur:
+        cur.execute(sql, tuple(params))
+        row = cur.fetchone()
 
     if not row:
         return error_response(404, "not_found", "Quote request not found")
@@ -628,18 +625,17 @@ def admin_download_quote_request_file(quote_request_id: int, file_id: int):
     if guard:
         return guard
 
-    with get_connection() as conn:
-        with conn.cursor() as cur:
-            cur.execute(
-                """
-                SELECT *
-                FROM quote_request_files
-                WHERE id = %s AND quote_request_id = %s
-                LIMIT 1
-                """,
-                (file_id, quote_request_id),
-            )
-            row = cur.fetchone()
+    with get_db().cursor() as cur:
+        cur.execute(
+            """
+            SELECT *
+            FROM quote_request_files
+            WHERE id = %s AND quote_request_id = %s
+            LIMIT 1
+            """,
+            (file_id, quote_request_id),
+        )
+        row = cur.fetchone()
 
     if not row:
         return error_response(404, "not_found", "File not found")
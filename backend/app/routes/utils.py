@@ -1,4 +1,13 @@
-from flask import jsonify
+import base64
+import binascii
+import datetime
+import json
+import re
+
+from flask import current_app, jsonify
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 500
 
 
 def success_response(data=None, status=200):
@@ -7,3 +16,143 @@ def success_response(data=None, status=200):
 
 def error_response(status, code, message):
     return jsonify({"success": False, "error": {"code": code, "message": message}}), status
+
+
+def cached_success_response(cache: dict, key, build_data, status=200):
+    """success_response whose encoded body is kept in ``cache[key]``.
+
+    For payloads that do not change while ``cache`` lives, such as the
+    doctor directory snapshot: the body is encoded on first use only.
+    """
+    body = cache.get(key)
+    if body is None:
+        body = current_app.json.dumps_bytes({"success": True, "data": build_data()})
+        cache[key] = body
+    return current_app.response_class(body, status=status, mimetype="application/json")
+
+
+class RawJSON(str):
+    """JSON text built by Postgres, spliced into a response without re-encoding."""
+
+
+def raw_success_response(data, status=200):
+    """success_response for list endpoints whose items come from json_agg.
+
+    ``data`` is a RawJSON document or a flat dict whose RawJSON values are
+    inserted verbatim; other values go through the app's JSON provider, like
+    every other response.
+    """
+    if not isinstance(data, RawJSON):
+        dumps = current_app.json.dumps
+        data = "{" + ",".join(
+            f"{dumps(key)}:{value if isinstance(value, RawJSON) else dumps(value)}"
+            for key, value in data.items()
+        ) + "}"
+    body = '{"success":true,"data":' + data + "}"
+    return current_app.response_class(body, status=status, mimetype="application/json")
+
+
+# SQL counterparts of the formatting above and of Flask's JSON encoder, for
+# queries that assemble response JSON in the database.
+
+def sql_date(expr: str) -> str:
+    return f"to_char({expr}, 'YYYY-MM-DD')"
+
+
+def sql_time(expr: str) -> str:
+    return f"to_char({expr}, 'HH24:MI')"
+
+
+def sql_http_date(expr: str) -> str:
+    """How jsonify renders a datetime: RFC 822 in GMT."""
+    return f"""to_char(({expr}) AT TIME ZONE 'UTC', 'Dy, DD Mon YYYY HH24:MI:SS "GMT"')"""
+
+
+def parse_date(value):
+    """Parse a YYYY-MM-DD value; returns None when missing or malformed."""
+    raw = str(value or "").strip()
+    if not raw:
+        return None
+    try:
+        return datetime.date.fromisoformat(raw)
+    except ValueError:
+        return None
+
+
+_TIME_RE = re.compile(r"^([01]\d|2[0-3]):([0-5]\d)(?::00)?$")
+
+
+def parse_time(value):
+    """Parse an HH:MM value (HH:MM:00 is accepted too); returns None when missing or malformed.
+
+    Only whole minutes are valid: slots, availability bitmaps and the
+    (doctor_id, date, time) unique index all work at minute precision, so
+    seconds, fractions and UTC offsets are rejected rather than stored.
+    """
+    match = _TIME_RE.match(str(value or "").strip())
+    if not match:
+        return None
+    return datetime.time(int(match.group(1)), int(match.group(2)))
+
+
+def format_date(value):
+    if value is None:
+        return None
+    if hasattr(value, "isoformat"):
+        return value.isoformat()
+    return str(value)
+
+
+def format_time(value):
+    if value is None:
+        return None
+    if hasattr(value, "strftime"):
+        return value.strftime("%H:%M")
+    return str(value)
+
+
+def serialize_appointment(row):
+    """Render an appointments row with the API's YYYY-MM-DD / HH:MM strings."""
+    if not row:
+        return row
+    data = dict(row)
+    if "date" in data:
+        data["date"] = format_date(data["date"])
+    if "time" in data:
+        data["time"] = format_time(data["time"])
+    return data
+
+
+def parse_page_limit(value, default=DEFAULT_PAGE_SIZE, maximum=MAX_PAGE_SIZE):
+    """Parse a ``limit`` query param; returns None when it is not a positive integer."""
+    raw = str(value or "").strip()
+    if not raw:
+        return default
+    try:
+        limit = int(raw)
+    except ValueError:
+        return None
+    if limit < 1:
+        return None
+    return min(limit, maximum)
+
+
+def encode_cursor(values) -> str:
+    """Encode keyset values (the sort key of the last row) as an opaque token."""
+    raw = json.dumps(list(values), separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(token, size: int):
+    """Decode a token from encode_cursor; returns None when it is malformed."""
+    raw = str(token or "").strip()
+    if not raw:
+        return None
+    try:
+        padded = raw + "=" * (-len(raw) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+    except (ValueError, binascii.Error, UnicodeError):
+        return None
+    if not isinstance(values, list) or len(values) != size:
+        return None
+    return values
@@ -0,0 +1,237 @@
+"""Send queued SMS from sms_outbox.
+
+Run next to the web workers as ``python -m app.sms_dispatcher``; ``--once``
+sends whatever is due and exits. Several dispatchers can run at once: rows
+are claimed with FOR UPDATE SKIP LOCKED, so each message goes to exactly one
+of them. A claim is the row's id plus the ``attempts`` value it was claimed
+with; results are only written back while that claim still holds, so a
+dispatcher whose lease ran out cannot overwrite the one that took over.
+"""
+import argparse
+import logging
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from app.config import env_float, env_int
+from app.db import close_pool, get_connection
+from app.transports import get_sms_transport
+from sms import send_sms
+
+logger = logging.getLogger("sms_dispatcher")
+
+
+def claim_batch(conn, limit: int, lease_seconds: float):
+    """Mark up to ``limit`` due rows as sending and return them."""
+    with conn.cursor() as cur:
+        cur.execute(
+            """
+            UPDATE sms_outbox
+            SET status = 'sending',
+                attempts = attempts + 1,
+                locked_until = NOW() + make_interval(secs => %s)
+            WHERE id IN (
+                SELECT id
+                FROM sms_outbox
+                WHERE (status = 'pending' AND next_attempt_at <= NOW())
+                   OR (status = 'sending' AND locked_until < NOW())
+                ORDER BY next_attempt_at ASC, id ASC
+                LIMIT %s
+                FOR UPDATE SKIP LOCKED
+            )
+            RETURNING *
+            """,
+            (lease_seconds, limit),
+        )
+        rows = cur.fetchall() or []
+    conn.commit()
+    return rows
+
+
+def default_lease_seconds(batch_size: int, workers: int) -> float:
+    """How long a batch may hold its rows: every message timing out on every try."""
+    tries = env_int("PROVIDER_RETRIES", 2) + 1
+    per_try = env_float("TWILIO_CONNECT_TIMEOUT", 3.0) + env_float("TWILIO_READ_TIMEOUT", 10.0)
+    per_message = tries * per_try + (tries - 1) * env_float("RETRY_MAX_SECONDS", 2.0)
+    rounds = -(-batch_size // max(workers, 1))
+    return max(60.0, 1.5 * rounds * per_message)
+
+
+def _send(row):
+    try:
+        return send_sms(row.get("to_phone"), row.get("body"))
+    except Exception as e:
+        return {"ok": False, "error": str(e)}
+
+
+def _retry_delay(attempts: int) -> float:
+    base = env_float("SMS_RETRY_BASE_SECONDS", 30.0)
+    cap = env_float("SMS_RETRY_MAX_SECONDS", 3600.0)
+    delay = min(cap, base * (2 ** max(attempts - 1, 0)))
+    # Full jitter keeps retries from a provider outage from arriving in step.
+    return random.uniform(delay / 2, delay)
+
+
+def _update_claimed(cur, query, params_seq):
+    """Run a claim-guarded UPDATE ... RETURNING id per row; return the ids updated."""
+    if not params_seq:
+        return set()
+    cur.executemany(query, params_seq, returning=True)
+    ids = set()
+    while True:
+        ids.update(row["id"] for row in cur.fetchall())
+        if not cur.nextset():
+            return ids
+
+
+def record_results(conn, results):
+    sent = []
+    deferred = []
+    retry = []
+    failed = []
+    # One notify log per message, written once its outcome is final.
+    logs = {}
+    for row, result in results:
+        error = result.get("error")
+        claim = (row["id"], row["attempts"])
+        if result.get("ok"):
+            sent.append((result.get("sid"), *claim))
+        elif result.get("retry_after") is not None:
+            # Never attempted (circuit open): give the attempt back.
+            deferred.append((error, result["retry_after"] + random.uniform(0, 5), *claim))
+            continue
+        elif result.get("retryable", True) and row["attempts"] < row["max_attempts"]:
+            retry.append((error, _retry_delay(row["attempts"]), *claim))
+            continue
+        else:
+            failed.append((error, *claim))
+        if row.get("appointment_id") is not None and row.get("doctor_id") is not None:
+            ok = bool(result.get("ok"))
+            logs[row["id"]] = (row["appointment_id"], row["doctor_id"], row["template_key"], ok, None if ok else error)
+
+    with conn.cursor() as cur:
+        sent_ids = _update_claimed(
+            cur,
+            """
+            UPDATE sms_outbox
+            SET status = 'sent', provider_sid = %s, sent_at = NOW(),
+                locked_until = NULL, last_error = NULL
+            WHERE id = %s AND attempts = %s AND status = 'sending'
+            RETURNING id
+            """,
+            sent,
+        )
+        deferred_ids = _update_claimed(
+            cur,
+            """
+            UPDATE sms_outbox
+            SET status = 'pending', attempts = attempts - 1, last_error = %s,
+                locked_until = NULL, next_attempt_at = NOW() + make_interval(secs => %s)
+            WHERE id = %s AND attempts = %s AND status = 'sending'
+            RETURNING id
+            """,
+            deferred,
+        )
+        retry_ids = _update_claimed(
+            cur,
+            """
+            UPDATE sms_outbox
+            SET status = 'pending', last_error = %s, locked_until = NULL,
+                next_attempt_at = NOW() + make_interval(secs => %s)
+            WHERE id = %s AND attempts = %s AND status = 'sending'
+            RETURNING id
+            """,
+            retry,
+        )
+        failed_ids = _update_claimed(
+            cur,
+            """
+            UPDATE sms_outbox
+            SET status = 'failed', last_error = %s, locked_until = NULL
+            WHERE id = %s AND attempts = %s AND status = 'sending'
+            RETURNING id
+            """,
+            failed,
+        )
+        owned = sent_ids | failed_ids
+        lost = len(results) - len(owned | deferred_ids | retry_ids)
+        if lost:
+            logger.warning("sms batch: %d row(s) were reclaimed by another dispatcher "
+                           "before their results were saved", lost)
+        if any(row_id in owned for row_id in logs):
+            cur.executemany(
+                """
+                INSERT INTO doctor_notify_logs
+                    (appointment_id, doctor_id, template_key, sent, error)
+                VALUES
+                    (%s, %s, %s, %s, %s)
+                """,
+                [log for row_id, log in logs.items() if row_id in owned],
+            )
+    conn.commit()
+    return len(sent_ids), len(retry_ids) + len(deferred_ids), len(failed_ids)
+
+
+def dispatch_once(executor, batch_size: int, lease_seconds: float) -> int:
+    """Claim, send and record one batch; return how many rows it held."""
+    with get_connection() as conn:
+        rows = claim_batch(conn, batch_size, lease_seconds)
+    if not rows:
+        return 0
+
+    results = list(zip(rows, executor.map(_send, rows)))
+
+    with get_connection() as conn:
+        sent, retried, failed = record_results(conn, results)
+    logger.info("sms batch: %d sent, %d to retry, %d failed", sent, retried, failed)
+    return len(rows)
+
+
+def run(once: bool = False):
+    """Dispatch until interrupted, or with ``once`` until nothing is due."""
+    workers = env_int("SMS_DISPATCH_WORKERS", 8)
+    batch_size = env_int("SMS_DISPATCH_BATCH_SIZE", 50)
+    poll_seconds = env_float("SMS_DISPATCH_POLL_SECONDS", 2.0)
+    # A lease shorter than a batch's worst case lets another dispatcher
+    # reclaim rows that are still being sent.
+    lease_seconds = env_float("SMS_DISPATCH_LEASE_SECONDS", default_lease_seconds(batch_size, workers))
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="sms") as executor:
+        while True:
+            if not get_sms_transport().is_available():
+                # Circuit open: leave rows unclaimed until the provider recovers.
+                if once:
+                    return
+                time.sleep(poll_seconds)
+                continue
+            try:
+                claimed = dispatch_once(executor, batch_size, lease_seconds)
+            except Exception:
+                logger.exception("sms dispatch failed")
+                if once:
+                    raise
+                claimed = 0
+            if claimed:
+                continue
+            if once:
+                return
+            time.sleep(poll_seconds)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Send queued SMS from sms_outbox.")
+    parser.add_argument("--once", action="store_true", help="send everything due, then exit")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(levelname)s %(message)s")
+
+    try:
+        run(once=args.once)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        close_pool()
+
+
+if __name__ == "__main__":
+    main()
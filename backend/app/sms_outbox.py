@@ -0,0 +1,57 @@
+from app.db import get_db
+
+
+def reminder_text(doctor_name: str, date: str, time: str) -> str:
+    """The appointment reminder SMS, shared by the notify endpoint and the batch job."""
+    return f"MedConnect: Reminder of your appointment with {doctor_name or 'your doctor'} on {date} at {time}."
+
+
+def enqueue_sms(to_phone: str, body: str, template_key: str, appointment_id: int = None, doctor_id: int = None):
+    """Queue an SMS in the current request's transaction and return its outbox id.
+
+    Nothing is sent here: the row only becomes visible to the dispatcher
+    (python -m app.sms_dispatcher) once the request commits, so a rolled back
+    change never announces itself.
+    """
+    with get_db().cursor() as cur:
+        cur.execute(
+            """
+            INSERT INTO sms_outbox
+                (to_phone, body, template_key, appointment_id, doctor_id)
+            VALUES
+                (%s, %s, %s, %s, %s)
+            RETURNING id
+            """,
+            (str(to_phone or "").strip(), body, template_key, appointment_id, doctor_id),
+        )
+        return cur.fetchone().get("id")
+
+
+def enqueue_sms_many(messages):
+    """Queue many SMS with one multi-row INSERT.
+
+    ``messages`` holds (to_phone, body, template_key, appointment_id,
+    doctor_id) tuples; returns {appointment_id: outbox_id}.
+    """
+    if not messages:
+        return {}
+    values = ", ".join(["(%s, %s, %s, %s, %s)"] * len(messages))
+    params = []
+    for to_phone, body, template_key, appointment_id, doctor_id in messages:
+        params.extend([str(to_phone or "").strip(), body, template_key, appointment_id, doctor_id])
+    with get_db().cursor() as cur:
+        cur.execute(
+            f"""
+            INSERT INTO sms_outbox
+                (to_phone, body, template_key, appointment_id, doctor_id)
+            VALUES {values}
+            RETURNING id, appointment_id
+            """,
+            params,
+        )
+        return {row.get("appointment_id"): row.get("id") for row in cur.fetchall()}
+
+
+def queued_response(outbox_id=None):
+    """The ``sms`` block returned by endpoints that queue a message."""
+    return {"queued": outbox_id is not None, "id": outbox_id}
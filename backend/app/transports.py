@@ -0,0 +1,370 @@
+import abc
+import json
+import mailbox
+import os
+import smtplib
+import threading
+import time
+import uuid
+
+from app import resilience
+from app.config import env_bool, env_float, env_str
+
+# Delivery backends for SMS and email, picked by SMS_TRANSPORT and
+# EMAIL_TRANSPORT:
+#
+#   SMS_TRANSPORT    twilio (default) | memory | file  (SMS_FILE_PATH)
+#   EMAIL_TRANSPORT  smtp (default)   | memory | mbox  (EMAIL_MBOX_PATH)
+#
+# The memory and file sinks never leave the machine, so booking throughput
+# can be load-tested without provider latency or real messages going out.
+# Transports are created once per process and reused; the Twilio one keeps a
+# single HTTP session (keep-alive) for every message it sends.
+
+_sms_transport = None
+_email_transport = None
+_transport_pid = None
+_transport_lock = threading.Lock()
+
+
+class SmsTransport(abc.ABC):
+    name = ""
+
+    @abc.abstractmethod
+    def send(self, to_phone: str, body: str) -> dict:
+        """Return { ok, sid?, error?, retryable?, retry_after? }; never raise.
+
+        ``retry_after`` (seconds) means the message was not attempted because
+        the provider's circuit is open.
+        """
+
+    def is_available(self) -> bool:
+        return True
+
+
+def _twilio_retryable(exc) -> bool:
+    # Twilio rejects bad numbers and bodies with 4xx; only 429 and
+    # server/network errors are worth another try.
+    status = getattr(exc, "status", None)
+    return not (isinstance(status, int) and 400 <= status < 500 and status != 429)
+
+
+class TwilioSmsTransport(SmsTransport):
+    name = "twilio"
+
+    def __init__(self):
+        self._client = None
+        self._client_lock = threading.Lock()
+
+    def _get_client(self, account_sid, auth_token):
+        if self._client is None:
+            with self._client_lock:
+                if self._client is None:
+                    from twilio.http.http_client import TwilioHttpClient
+                    from twilio.rest import Client
+
+                    http_client = TwilioHttpClient(
+                        pool_connections=True,
+                        timeout=env_float("TWILIO_READ_TIMEOUT", 10.0),
+                    )
+                    # The constructor only accepts a number, but the value is
+                    # handed straight to requests, which takes (connect, read):
+                    # an unreachable API should fail in seconds, not at the
+                    # read timeout.
+                    http_client.timeout = (
+                        env_float("TWILIO_CONNECT_TIMEOUT", 3.0),
+                        http_client.timeout,
+                    )
+                    self._client = Client(account_sid, auth_token, http_client=http_client)
+        return self._client
+
+    def send(self, to_phone, body):
+        if not env_bool("SMS_ENABLED", False):
+            return {"ok": False, "error": "SMS disabled (SMS_ENABLED=false)", "retryable": False}
+
+        account_sid = env_str("TWILIO_ACCOUNT_SID")
+        auth_token = env_str("TWILIO_AUTH_TOKEN")
+        from_phone = env_str("TWILIO_FROM")
+        if not account_sid or not auth_token or not from_phone:
+            return {"ok": False, "error": "Missing Twilio env vars", "retryable": False}
+
+        try:
+            client = self._get_client(account_sid, auth_token)
+            msg = resilience.call(
+                "twilio",
+                lambda: client.messages.create(body=body, from_=from_phone, to=to_phone),
+                is_retryable=_twilio_retryable,
+            )
+            return {"ok": True, "sid": msg.sid}
+        except resilience.CircuitOpenError as e:
+            return {"ok": False, "error": str(e), "retryable": True, "retry_after": e.retry_after}
+        except Exception as e:
+            return {"ok": False, "error": str(e), "retryable": _twilio_retryable(e)}
+
+    def is_available(self):
+        return not resilience.breaker("twilio").is_open()
+
+
+class MemorySmsTransport(SmsTransport):
+    name = "memory"
+
+    def __init__(self):
+        self.messages = []
+        self._lock = threading.Lock()
+
+    def send(self, to_phone, body):
+        sid = f"MEM{uuid.uuid4().hex}"
+        with self._lock:
+            self.messages.append({"sid": sid, "to": to_phone, "body": body})
+        return {"ok": True, "sid": sid}
+
+    def clear(self):
+        with self._lock:
+            self.messages.clear()
+
+
+class FileSmsTransport(SmsTransport):
+    """Append one JSON line per message to SMS_FILE_PATH."""
+
+    name = "file"
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def send(self, to_phone, body):
+        sid = f"FILE{uuid.uuid4().hex}"
+        line = json.dumps({"sid": sid, "to": to_phone, "body": body, "at": time.time()})
+        try:
+            with self._lock, open(self.path, "a", encoding="utf-8") as fh:
+                fh.write(line + "\n")
+        except OSError as e:
+            return {"ok": False, "error": str(e)}
+        return {"ok": True, "sid": sid}
+
+
+class EmailTransport(abc.ABC):
+    name = ""
+
+    def unavailable_reason(self):
+        """Why messages cannot be sent right now, or None."""
+        return None
+
+    @abc.abstractmethod
+    def open_session(self):
+        """Return a session with send(msg) and close(); one per sending thread."""
+
+
+def smtp_settings():
+    username = os.getenv("SMTP_USER") or os.getenv("SMTP_USERNAME") or ""
+    return {
+        "host": (os.getenv("SMTP_HOST") or "").strip(),
+        "port": int(os.getenv("SMTP_PORT", "587")),
+        "username": username,
+        "password": os.getenv("SMTP_PASSWORD") or "",
+        "from_address": os.getenv("SMTP_FROM") or username or "no-reply@medconnect.local",
+        "use_ssl": os.getenv("SMTP_USE_SSL", "false").strip().lower() in {"1", "true", "yes"},
+        "use_tls": os.getenv("SMTP_USE_TLS", "true").strip().lower() not in {"0", "false", "no"},
+    }
+
+
+class SmtpEmailTransport(EmailTransport):
+    name = "smtp"
+
+    def unavailable_reason(self):
+        if not smtp_settings()["host"]:
+            return "SMTP_HOST not set"
+        return None
+
+    def open_session(self):
+        return _SmtpSession()
+
+
+def _smtp_retryable(exc) -> bool:
+    # A refused recipient or a permanent (5xx) reply is about the message,
+    # not the relay's health.
+    if isinstance(exc, smtplib.SMTPRecipientsRefused):
+        return False
+    if isinstance(exc, smtplib.SMTPResponseException):
+        return exc.smtp_code < 500
+    return True
+
+
+class _SmtpSession:
+    """One long-lived, authenticated SMTP connection, re-opened when dropped."""
+
+    def __init__(self):
+        self.server = None
+        self.last_used = 0.0
+        self.idle_seconds = env_float("EMAIL_SMTP_IDLE_SECONDS", 60.0)
+        self.timeout = env_float("EMAIL_SMTP_TIMEOUT", 10.0)
+
+    def send(self, msg):
+        """Send through the smtp breaker; raises CircuitOpenError while it is open."""
+        resilience.call("smtp", lambda: self._send_once(msg), is_retryable=_smtp_retryable)
+
+    def _send_once(self, msg):
+        try:
+            self._connection().send_message(msg)
+        except smtplib.SMTPRecipientsRefused:
+            raise
+        except smtplib.SMTPResponseException as exc:
+            if exc.smtp_code != 421:
+                raise
+            self._reconnect_and_send(msg)
+        except OSError:
+            # Covers SMTPServerDisconnected: the session went stale between
+            # messages, so one fresh connection gets one more try.
+            self._reconnect_and_send(msg)
+        self.last_used = time.monotonic()
+
+    def _reconnect_and_send(self, msg):
+        self.close()
+        self._connection().send_message(msg)
+
+    def _connection(self):
+        if self.server is not None and time.monotonic() - self.last_used > self.idle_seconds / 2:
+            try:
+                self.server.noop()
+            except Exception:
+                self.close()
+        if self.server is None:
+            self.server = self._connect()
+            self.last_used = time.monotonic()
+        return self.server
+
+    def _connect(self):
+        settings = smtp_settings()
+        if settings["use_ssl"]:
+            server = smtplib.SMTP_SSL(settings["host"], settings["port"], timeout=self.timeout)
+        else:
+            server = smtplib.SMTP(settings["host"], settings["port"], timeout=self.timeout)
+        try:
+            server.ehlo()
+            if settings["use_tls"] and not settings["use_ssl"]:
+                server.starttls()
+                server.ehlo()
+            if settings["username"] and settings["password"]:
+                server.login(settings["username"], settings["password"])
+        except Exception:
+            server.close()
+            raise
+        return server
+
+    def close(self):
+        server = self.server
+        self.server = None
+        if server is None:
+            return
+        try:
+            server.quit()
+        except Exception:
+            server.close()
+
+
+class MemoryEmailTransport(EmailTransport):
+    name = "memory"
+
+    def __init__(self):
+        self.messages = []
+        self._lock = threading.Lock()
+
+    def open_session(self):
+        return self
+
+    def send(self, msg):
+        with self._lock:
+            self.messages.append(msg)
+
+    def close(self):
+        pass
+
+    def clear(self):
+        with self._lock:
+            self.messages.clear()
+
+
+class MboxEmailTransport(EmailTransport):
+    """Append messages to the mbox file at EMAIL_MBOX_PATH."""
+
+    name = "mbox"
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def open_session(self):
+        return self
+
+    def send(self, msg):
+        with self._lock:
+            box = mailbox.mbox(self.path)
+            box.lock()
+            try:
+                box.add(msg)
+                box.flush()
+            finally:
+                box.unlock()
+                box.close()
+
+    def close(self):
+        pass
+
+
+def _create_sms_transport():
+    kind = env_str("SMS_TRANSPORT", "twilio").lower()
+    if kind == "memory":
+        return MemorySmsTransport()
+    if kind == "file":
+        return FileSmsTransport(env_str("SMS_FILE_PATH", "sms-outbox.jsonl"))
+    if kind != "twilio":
+        raise RuntimeError(f"Unknown SMS_TRANSPORT: {kind}")
+    return TwilioSmsTransport()
+
+
+def _create_email_transport():
+    kind = env_str("EMAIL_TRANSPORT", "smtp").lower()
+    if kind == "memory":
+        return MemoryEmailTransport()
+    if kind == "mbox":
+        return MboxEmailTransport(env_str("EMAIL_MBOX_PATH", "medconnect.mbox"))
+    if kind != "smtp":
+        raise RuntimeError(f"Unknown EMAIL_TRANSPORT: {kind}")
+    return SmtpEmailTransport()
+
+
+def _check_pid():
+    global _sms_transport, _email_transport, _transport_pid
+    pid = os.getpid()
+    if _transport_pid != pid:
+        # HTTP sessions and sink locks must not be shared with a parent process.
+        _sms_transport = None
+        _email_transport = None
+        _transport_pid = pid
+
+
+def get_sms_transport() -> SmsTransport:
+    global _sms_transport
+    with _transport_lock:
+        _check_pid()
+        if _sms_transport is None:
+            _sms_transport = _create_sms_transport()
+        return _sms_transport
+
+
+def get_email_transport() -> EmailTransport:
+    global _email_transport
+    with _transport_lock:
+        _check_pid()
+        if _email_transport is None:
+            _email_transport = _create_email_transport()
+        return _email_transport
+
+
+def _reset_in_child():
+    global _transport_lock
+    _transport_lock = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_in_child)
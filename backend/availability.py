@@ -1,16 +1,16 @@
 # backend/availability.py
-import json
-from flask import Blueprint, jsonify, request
+import datetime
+import heapq
+import itertools
+from flask import Blueprint, jsonify, request, session
 
-from app.db import get_connection
-from app.routes.utils import success_response, error_response
+from app import availability_engine as engine, doctor_directory
+from app.db import get_db
+from app.http_cache import conditional
+from app.routes.utils import success_response, error_response, parse_date, parse_time
 
 availability_bp = Blueprint("availability", __name__)
 
-# In-memory storage (Phase 2 simple mode)
-# Key: doctor_id (int or str), Value: weekly schedule dict
-DOCTOR_AVAILABILITY = {}
-
 # Simple default schedule (used if a doctor has none yet)
 DEFAULT_WEEKLY_SCHEDULE = {
     "mon": ["09:00-12:00", "13:00-16:00"],
@@ -22,19 +22,15 @@ DEFAULT_WEEKLY_SCHEDULE = {
     "sun": [],
 }
 
-DAY_ORDER = ["mon", "tue", "wed", "thu", "fri", "sat", "sun"]
+DAY_ORDER = engine.DAY_ORDER
 VALID_DAYS = set(DAY_ORDER)
 
-
-def _is_valid_window(s: str) -> bool:
-    # Expected format: "HH:MM-HH:MM"
-    if not isinstance(s, str) or "-" not in s:
-        return False
-    start, end = s.split("-", 1)
-    if len(start) != 5 or len(end) != 5:
-        return False
-    # naive validation; good enough for uni project
-    return start[2] == ":" and end[2] == ":"
+SLOT_MINUTES = engine.SLOT_MINUTES
+MAX_FREE_SLOT_DAYS = 62
+MAX_EXCEPTION_DAYS = 366
+FIRST_AVAILABLE_HORIZON_DAYS = 60
+FIRST_AVAILABLE_MAX_LIMIT = 50
+BOOKED_CHUNK_DAYS = 7
 
 
 def _validate_schedule(data: dict):
@@ -51,60 +47,200 @@ def _validate_schedule(data: dict):
             windows = []
         if not isinstance(windows, list):
             return f"'{day}' must be an array."
+        bounds = []
         for w in windows:
-            if not _is_valid_window(w):
+            window_bounds = engine.parse_window(w)
+            if window_bounds is None:
                 return f"Invalid time window '{w}' in '{day}'. Use 'HH:MM-HH:MM'."
+            bounds.append(window_bounds)
+        bounds.sort()
+        for (_, prev_end), (next_start, _) in zip(bounds, bounds[1:]):
+            if next_start < prev_end:
+                return f"Overlapping time windows in '{day}'."
 
     return None
 
 
+def _load_weekly_schedule(doctor_id, active_only: bool = False):
+    """Return the doctor's compiled weekly entry, or None when the doctor does not exist."""
+    try:
+        doctor_id = int(doctor_id)
+    except (TypeError, ValueError):
+        return None
+    entry = engine.get_weekly([doctor_id]).get(doctor_id)
+    if entry is None or (active_only and not entry["active"]):
+        return None
+    return entry
+
+
+def _can_manage_doctor(doctor_id):
+    """Return an error response unless the caller is an admin or this doctor."""
+    role = (session.get("role") or "").strip().lower()
+    if not role:
+        return error_response(401, "unauthorized", "Unauthorized")
+    if role == "admin":
+        return None
+    if role == "doctor" and doctor_id is not None and session.get("doctor_id") == doctor_id:
+        return None
+    return error_response(403, "forbidden", "Forbidden")
+
+
+def _serialize_exception(row):
+    return {
+        "id": row.get("id"),
+        "doctor_id": row.get("doctor_id"),
+        "date": row["date"].isoformat() if row.get("date") else None,
+        "kind": row.get("kind"),
+        "start_time": row["start_time"].strftime("%H:%M") if row.get("start_time") else None,
+        "end_time": row["end_time"].strftime("%H:%M") if row.get("end_time") else None,
+        "note": row.get("note"),
+    }
+
+
+def _availability_etag(doctor_id):
+    entry = _load_weekly_schedule(doctor_id)
+    return entry["etag"] if entry is not None else None
+
+
 @availability_bp.get("/api/doctors/<doctor_id>/availability")
+@conditional(_availability_etag)
 def get_availability(doctor_id):
-    schedule = DOCTOR_AVAILABILITY.get(str(doctor_id))
-    if schedule is None:
-        with get_connection() as conn:
-            with conn.cursor() as cur:
-                cur.execute(
-                    """
-                    SELECT availability_days, availability_start, availability_end
-                    FROM doctors
-                    WHERE id = %s
-                    LIMIT 1
-                    """,
-                    (doctor_id,),
-                )
-                row = cur.fetchone()
+    entry = _load_weekly_schedule(doctor_id)
+    if entry is None:
+        return error_response(404, "not_found", "Doctor not found")
 
-        if not row:
-            return error_response(404, "not_found", "Doctor not found")
+    return success_response({"doctor_id": str(doctor_id), "weekly": entry["schedule"]})
 
-        raw_days = row.get("availability_days")
-        days = []
-        if isinstance(raw_days, list):
-            days = [str(d).strip().lower() for d in raw_days if str(d).strip()]
-        else:
-            try:
-                parsed = json.loads(raw_days or "[]")
-                if isinstance(parsed, list):
-                    days = [str(d).strip().lower() for d in parsed if str(d).strip()]
-            except Exception:
-                days = []
-
-        start = row.get("availability_start")
-        end = row.get("availability_end")
-        start_str = start.strftime("%H:%M") if hasattr(start, "strftime") else str(start or "")[:5]
-        end_str = end.strftime("%H:%M") if hasattr(end, "strftime") else str(end or "")[:5]
-
-        window = f"{start_str}-{end_str}" if start_str and end_str else None
-        schedule = {}
-        for day in DAY_ORDER:
-            schedule[day] = [window] if window and day in days else []
 
-    return success_response({"doctor_id": str(doctor_id), "weekly": schedule})
+@availability_bp.get("/api/doctors/<int:doctor_id>/free-slots")
+def get_free_slots(doctor_id: int):
+    today = datetime.date.today()
+    from_raw = request.args.get("from")
+    to_raw = request.args.get("to")
+
+    start = parse_date(from_raw) if from_raw else today
+    if start is None:
+        return error_response(400, "validation_error", "from must be a date (YYYY-MM-DD)")
+    end = parse_date(to_raw) if to_raw else start + datetime.timedelta(days=6)
+    if end is None:
+        return error_response(400, "validation_error", "to must be a date (YYYY-MM-DD)")
+    if end < start:
+        return error_response(400, "validation_error", "to must not be before from")
+    if (end - start).days + 1 > MAX_FREE_SLOT_DAYS:
+        return error_response(400, "validation_error", f"Range must be at most {MAX_FREE_SLOT_DAYS} days")
+
+    entry = _load_weekly_schedule(doctor_id, active_only=True)
+    if entry is None:
+        return error_response(404, "not_found", "Doctor not found")
+
+    calendar = engine.Calendar({doctor_id: entry}, start, end)
+    days = []
+    day = start
+    while day <= end:
+        days.append({"date": day.isoformat(), "slots": engine.bits_to_times(calendar.free_slots(doctor_id, day))})
+        day += datetime.timedelta(days=1)
+
+    return success_response({
+        "doctor_id": doctor_id,
+        "from": start.isoformat(),
+        "to": end.isoformat(),
+        "slot_minutes": SLOT_MINUTES,
+        "days": days,
+    })
+
+
+@availability_bp.get("/api/slots/first-available")
+def get_first_available_slots():
+    specialty = (request.args.get("specialty") or "").strip().lower()
+    if not specialty:
+        return error_response(400, "validation_error", "specialty is required")
+
+    now = datetime.datetime.now()
+    today = now.date()
+    from_raw = request.args.get("from")
+    start = parse_date(from_raw) if from_raw else today
+    if start is None:
+        return error_response(400, "validation_error", "from must be a date (YYYY-MM-DD)")
+    start = max(start, today)
+    end = start + datetime.timedelta(days=FIRST_AVAILABLE_HORIZON_DAYS - 1)
+
+    try:
+        limit = int(request.args.get("limit") or 10)
+    except ValueError:
+        return error_response(400, "validation_error", "limit must be an integer")
+    if limit < 1:
+        return error_response(400, "validation_error", "limit must be positive")
+    limit = min(limit, FIRST_AVAILABLE_MAX_LIMIT)
+
+    with get_db().cursor() as cur:
+        cur.execute(
+            """
+            SELECT id, full_name, specialty
+            FROM doctors
+            WHERE is_active = TRUE AND LOWER(specialty) = %s
+            ORDER BY id ASC
+            """,
+            (specialty,),
+        )
+        doctors = cur.fetchall() or []
+
+    by_id = {row.get("id"): row for row in doctors}
+    weekly = {
+        doctor_id: entry
+        for doctor_id, entry in engine.get_weekly(list(by_id)).items()
+        if entry["active"]
+    }
+    # Doctors with no weekly hours can only be seen on an "extra" session;
+    # leave the rest out so they do not widen every chunk query.
+    closed = [doctor_id for doctor_id, entry in weekly.items() if not any(entry["bits"])]
+    if closed:
+        opened = engine.doctors_with_openings(closed, start, end)
+        for doctor_id in closed:
+            if doctor_id not in opened:
+                del weekly[doctor_id]
+
+    # The calendar loads bookings and exceptions a week at a time. Slots are
+    # merged one chunk at a time, so a doctor with nothing free (leave, a
+    # full diary) cannot pull in the rest of the horizon once `limit` slots
+    # have been found.
+    calendar = engine.Calendar(weekly, start, end, now=now, chunk_days=BOOKED_CHUNK_DAYS)
+    items = []
+    for chunk_start, chunk_end in calendar.chunks():
+        if len(items) >= limit or not weekly:
+            break
+        streams = [calendar.iter_free(doctor_id, chunk_start, chunk_end) for doctor_id in weekly]
+        for slot_at, doctor_id in itertools.islice(heapq.merge(*streams), limit - len(items)):
+            doctor = by_id[doctor_id]
+            items.append({
+                "doctor_id": doctor_id,
+                "doctor_name": doctor.get("full_name"),
+                "specialty": doctor.get("specialty"),
+                "date": slot_at.date().isoformat(),
+                "time": slot_at.strftime("%H:%M"),
+            })
+
+    return success_response({
+        "specialty": specialty,
+        "from": start.isoformat(),
+        "to": end.isoformat(),
+        "slot_minutes": SLOT_MINUTES,
+        "count": len(items),
+        "items": items,
+    })
 
 
 @availability_bp.put("/api/doctors/<doctor_id>/availability")
 def put_availability(doctor_id):
+    try:
+        did = int(doctor_id)
+    except ValueError:
+        did = None
+    guard = _can_manage_doctor(did)
+    if guard:
+        return guard
+    if did is None:
+        return error_response(404, "not_found", "Doctor not found")
+
     data = request.get_json(silent=True) or {}
     weekly = data.get("weekly")
 
@@ -112,5 +248,141 @@ def put_availability(doctor_id):
     if err:
         return error_response(400, "validation_error", err)
 
-    DOCTOR_AVAILABILITY[str(doctor_id)] = weekly
-    return success_response({"doctor_id": str(doctor_id), "weekly": weekly})
+    schedule = {day: sorted(weekly.get(day) or []) for day in DAY_ORDER}
+
+    with get_db().cursor() as cur:
+        cur.execute("SELECT id FROM doctors WHERE id = %s", (did,))
+        if not cur.fetchone():
+            return error_response(404, "not_found", "Doctor not found")
+        # Also rewrites the availability_* columns the public profile shows.
+        engine.save_weekly(cur, did, schedule)
+
+    get_db().commit()
+    # Other workers hear about it through NOTIFY; don't wait for our own.
+    engine.invalidate_weekly(did)
+    doctor_directory.invalidate()
+    return success_response({"doctor_id": str(doctor_id), "weekly": schedule})
+
+
+@availability_bp.get("/api/availability/exceptions")
+def list_availability_exceptions():
+    doctor_id_raw = (request.args.get("doctor_id") or "").strip()
+    doctor_id = None
+    if doctor_id_raw:
+        try:
+            doctor_id = int(doctor_id_raw)
+        except ValueError:
+            return error_response(400, "validation_error", "doctor_id must be an integer")
+
+    role = (session.get("role") or "").strip().lower()
+    if role == "doctor" and doctor_id is None:
+        doctor_id = session.get("doctor_id")
+    guard = _can_manage_doctor(doctor_id)
+    if guard:
+        return guard
+
+    today = datetime.date.today()
+    start = parse_date(request.args.get("from")) if request.args.get("from") else today
+    if start is None:
+        return error_response(400, "validation_error", "from must be a date (YYYY-MM-DD)")
+    end = parse_date(request.args.get("to")) if request.args.get("to") else start + datetime.timedelta(days=90)
+    if end is None:
+        return error_response(400, "validation_error", "to must be a date (YYYY-MM-DD)")
+    if end < start or (end - start).days + 1 > MAX_EXCEPTION_DAYS:
+        return error_response(400, "validation_error", f"Range must be 1 to {MAX_EXCEPTION_DAYS} days")
+
+    # Clinic-wide rows are always included: they apply to every doctor.
+    sql = """
+        SELECT id, doctor_id, date, kind, start_time, end_time, note
+        FROM doctor_availability_exceptions
+        WHERE date >= %s AND date <= %s
+    """
+    params = [start, end]
+    if doctor_id is not None:
+        sql += " AND (doctor_id = %s OR doctor_id IS NULL)"
+        params.append(doctor_id)
+    sql += " ORDER BY date ASC, start_time ASC NULLS FIRST, id ASC"
+
+    with get_db().cursor() as cur:
+        cur.execute(sql, tuple(params))
+        rows = cur.fetchall() or []
+
+    items = [_serialize_exception(r) for r in rows]
+    return success_response({"count": len(items), "items": items})
+
+
+@availability_bp.post("/api/availability/exceptions")
+def create_availability_exception():
+    payload = request.get_json(silent=True) or {}
+
+    doctor_id = payload.get("doctor_id")
+    if doctor_id is not None:
+        try:
+            doctor_id = int(doctor_id)
+        except (TypeError, ValueError):
+            return error_response(400, "validation_error", "doctor_id must be an integer")
+    # Only admins may add clinic-wide exceptions (doctor_id omitted).
+    guard = _can_manage_doctor(doctor_id)
+    if guard:
+        return guard
+
+    kind = str(payload.get("kind") or "").strip().lower()
+    if kind not in engine.EXCEPTION_KINDS:
+        return error_response(400, "validation_error", f"kind must be one of {sorted(engine.EXCEPTION_KINDS)}")
+
+    day = parse_date(payload.get("date"))
+    if day is None:
+        return error_response(400, "validation_error", "date must be a date (YYYY-MM-DD)")
+
+    start_raw = payload.get("start_time")
+    end_raw = payload.get("end_time")
+    start_time = end_time = None
+    if start_raw or end_raw:
+        start_time = parse_time(start_raw)
+        end_time = parse_time(end_raw)
+        if start_time is None or end_time is None:
+            return error_response(400, "validation_error", "start_time and end_time must be times (HH:MM)")
+        if start_time >= end_time:
+            return error_response(400, "validation_error", "start_time must be before end_time")
+    elif kind in engine.OPENING_KINDS:
+        return error_response(400, "validation_error", "start_time and end_time are required for extra sessions")
+
+    note = str(payload.get("note") or "").strip() or None
+
+    with get_db().cursor() as cur:
+        if doctor_id is not None:
+            cur.execute("SELECT id FROM doctors WHERE id = %s", (doctor_id,))
+            if not cur.fetchone():
+                return error_response(404, "not_found", "Doctor not found")
+        cur.execute(
+            """
+            INSERT INTO doctor_availability_exceptions
+                (doctor_id, date, kind, start_time, end_time, note)
+            VALUES (%s, %s, %s, %s, %s, %s)
+            RETURNING id, doctor_id, date, kind, start_time, end_time, note
+            """,
+            (doctor_id, day, kind, start_time, end_time, note),
+        )
+        row = cur.fetchone()
+
+    return success_response({"exception": _serialize_exception(row)}, 201)
+
+
+@availability_bp.delete("/api/availability/exceptions/<int:exception_id>")
+def delete_availability_exception(exception_id: int):
+    with get_db().cursor() as cur:
+        cur.execute(
+            "SELECT doctor_id FROM doctor_availability_exceptions WHERE id = %s",
+            (exception_id,),
+        )
+        row = cur.fetchone()
+        if not row:
+            return error_response(404, "not_found", "Exception not found")
+
+        guard = _can_manage_doctor(row.get("doctor_id"))
+        if guard:
+            return guard
+
+        cur.execute("DELETE FROM doctor_availability_exceptions WHERE id = %s", (exception_id,))
+
+    return success_response({"deleted": True, "id": exception_id})
@@ -0,0 +1,32 @@
+-- At most one non-cancelled booking per doctor slot. The index cannot be built
+-- while double bookings exist, so list them and stop with a clear message
+-- instead of failing on an opaque unique violation.
+DO $$
+DECLARE
+    duplicate_slots INTEGER;
+    details TEXT;
+BEGIN
+    SELECT COUNT(*),
+           string_agg(
+               format('doctor_id=%s date=%s time=%s ids=%s', doctor_id, date, time, ids),
+               '; '
+           )
+    INTO duplicate_slots, details
+    FROM (
+        SELECT doctor_id, date, time, array_agg(id ORDER BY id) AS ids
+        FROM appointments
+        WHERE LOWER(status) <> 'cancelled'
+        GROUP BY doctor_id, date, time
+        HAVING COUNT(*) > 1
+    ) dup;
+
+    IF duplicate_slots > 0 THEN
+        RAISE EXCEPTION 'appointments has % double-booked slot(s): %', duplicate_slots, details
+            USING HINT = 'Cancel or reschedule the extra bookings, then re-run migrations.';
+    END IF;
+END
+$$;
+
+CREATE UNIQUE INDEX IF NOT EXISTS appointments_active_slot_unique
+ON appointments (doctor_id, date, time)
+WHERE LOWER(status) <> 'cancelled';
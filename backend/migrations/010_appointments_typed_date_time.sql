@@ -0,0 +1,234 @@
+-- migrate: no-transaction
+-- appointments.date / time were TEXT, so range filters compared strings and
+-- nothing but the primary key was indexed. Doctors have thousands of
+-- appointments and bookings keep arriving while this runs, so the columns
+-- are converted online rather than by one table-rewriting ALTER TYPE:
+--   1. refuse to start while any value cannot be converted, or while two
+--      active bookings would land on the same slot once normalised
+--      ('9:00' and '09:00'), listing the offending ids;
+--   2. add typed date_value / time_value columns, kept in sync with the
+--      text columns by a trigger;
+--   3. backfill existing rows in committed batches;
+--   4. build the unique slot index and the lookup indexes CONCURRENTLY;
+--   5. swap the columns in one short transaction.
+-- The file runs outside a transaction (see apply_migrations); every step
+-- before the swap can be re-run after a failure, and the swap records the
+-- migration itself so it is never repeated against the converted table.
+
+CREATE OR REPLACE FUNCTION appointments_slot_date(raw TEXT) RETURNS DATE
+LANGUAGE plpgsql IMMUTABLE AS $$
+BEGIN
+    IF raw IS NULL OR raw !~ '^\d{4}-\d{2}-\d{2}$' THEN
+        RETURN NULL;
+    END IF;
+    RETURN raw::date;
+EXCEPTION WHEN others THEN
+    -- Well-formed but impossible, e.g. 2024-02-31.
+    RETURN NULL;
+END
+$$;
+
+-- Whole minutes only, as the API accepts them: H:MM, HH:MM or HH:MM:00.
+CREATE OR REPLACE FUNCTION appointments_slot_time(raw TEXT) RETURNS TIME
+LANGUAGE plpgsql IMMUTABLE AS $$
+BEGIN
+    IF raw IS NULL OR raw !~ '^([01]?\d|2[0-3]):[0-5]\d(:00)?$' THEN
+        RETURN NULL;
+    END IF;
+    RETURN raw::time;
+END
+$$;
+
+DO $$
+DECLARE
+    bad_rows INTEGER;
+    duplicate_slots INTEGER;
+    details TEXT;
+BEGIN
+    IF (SELECT data_type FROM information_schema.columns
+        WHERE table_schema = current_schema() AND table_name = 'appointments' AND column_name = 'date') <> 'text' THEN
+        RETURN;
+    END IF;
+
+    SELECT COUNT(*),
+           string_agg(format('id=%s date=%L time=%L', id, date, time), '; ' ORDER BY id)
+    INTO bad_rows, details
+    FROM appointments
+    WHERE appointments_slot_date(date::text) IS NULL
+       OR appointments_slot_time(time::text) IS NULL;
+
+    IF bad_rows > 0 THEN
+        RAISE EXCEPTION 'appointments has % row(s) with an unparseable date/time: %', bad_rows, details
+            USING HINT = 'Fix the values to a real YYYY-MM-DD date and an HH:MM time, then re-run migrations.';
+    END IF;
+
+    SELECT COUNT(*),
+           string_agg(format('doctor_id=%s date=%s time=%s ids=%s', doctor_id, slot_date, slot_time, ids), '; ')
+    INTO duplicate_slots, details
+    FROM (
+        SELECT doctor_id,
+               appointments_slot_date(date::text) AS slot_date,
+               appointments_slot_time(time::text) AS slot_time,
+               array_agg(id ORDER BY id) AS ids
+        FROM appointments
+        WHERE LOWER(status) <> 'cancelled'
+        GROUP BY 1, 2, 3
+        HAVING COUNT(*) > 1
+    ) dup;
+
+    IF duplicate_slots > 0 THEN
+        RAISE EXCEPTION 'appointments has % slot(s) that are double-booked once times are normalised: %',
+            duplicate_slots, details
+            USING HINT = 'Cancel or reschedule the extra bookings, then re-run migrations.';
+    END IF;
+END
+$$;
+
+CREATE OR REPLACE FUNCTION appointments_sync_typed_slot() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    NEW.date_value := appointments_slot_date(NEW.date);
+    NEW.time_value := appointments_slot_time(NEW.time);
+    IF NEW.date_value IS NULL OR NEW.time_value IS NULL THEN
+        RAISE EXCEPTION 'invalid appointment date/time: % %', NEW.date, NEW.time
+            USING ERRCODE = 'invalid_datetime_format';
+    END IF;
+    RETURN NEW;
+END
+$$;
+
+DO $$
+BEGIN
+    IF (SELECT data_type FROM information_schema.columns
+        WHERE table_schema = current_schema() AND table_name = 'appointments' AND column_name = 'date') <> 'text' THEN
+        RETURN;
+    END IF;
+    PERFORM set_config('lock_timeout', '5s', true);
+
+    ALTER TABLE appointments
+        ADD COLUMN IF NOT EXISTS date_value DATE,
+        ADD COLUMN IF NOT EXISTS time_value TIME;
+
+    -- Free the final index name for the index on the typed columns; the
+    -- text-column index keeps enforcing single bookings until the swap.
+    IF to_regclass('appointments_active_slot_unique_text') IS NULL THEN
+        ALTER INDEX IF EXISTS appointments_active_slot_unique RENAME TO appointments_active_slot_unique_text;
+    END IF;
+
+    DROP TRIGGER IF EXISTS appointments_sync_typed_slot ON appointments;
+    CREATE TRIGGER appointments_sync_typed_slot
+    BEFORE INSERT OR UPDATE OF date, time ON appointments
+    FOR EACH ROW EXECUTE FUNCTION appointments_sync_typed_slot();
+END
+$$;
+
+-- Batches commit as they go so no lock is held for the whole table.
+DO $$
+DECLARE
+    batch_size CONSTANT INTEGER := 5000;
+    last_id INTEGER := 0;
+    max_id INTEGER;
+BEGIN
+    IF (SELECT data_type FROM information_schema.columns
+        WHERE table_schema = current_schema() AND table_name = 'appointments' AND column_name = 'date') <> 'text' THEN
+        RETURN;
+    END IF;
+
+    SELECT COALESCE(MAX(id), 0) INTO max_id FROM appointments;
+    WHILE last_id < max_id LOOP
+        UPDATE appointments
+        SET date_value = appointments_slot_date(date),
+            time_value = appointments_slot_time(time)
+        WHERE id > last_id AND id <= last_id + batch_size
+          AND (date_value IS NULL OR time_value IS NULL);
+        last_id := last_id + batch_size;
+        COMMIT;
+    END LOOP;
+END
+$$;
+
+-- A failed CONCURRENTLY build leaves an invalid index behind; drop it so the
+-- IF NOT EXISTS below builds it again instead of skipping it.
+DO $$
+DECLARE
+    name TEXT;
+BEGIN
+    FOR name IN
+        SELECT c.relname
+        FROM pg_index i
+        JOIN pg_class c ON c.oid = i.indexrelid
+        WHERE c.relname IN ('appointments_active_slot_unique',
+                            'appointments_doctor_date_time_idx',
+                            'appointments_email_date_idx')
+          AND NOT i.indisvalid
+    LOOP
+        EXECUTE format('DROP INDEX %I', name);
+    END LOOP;
+END
+$$;
+
+CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS appointments_active_slot_unique
+ON appointments (doctor_id, date_value, time_value)
+WHERE LOWER(status) <> 'cancelled';
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS appointments_doctor_date_time_idx
+ON appointments (doctor_id, date_value, time_value) INCLUDE (status);
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS appointments_email_date_idx
+ON appointments (LOWER(email), date_value);
+
+-- Lets SET NOT NULL in the swap skip its full-table scan; validating takes
+-- a lock that does not block reads or writes.
+DO $$
+BEGIN
+    IF (SELECT data_type FROM information_schema.columns
+        WHERE table_schema = current_schema() AND table_name = 'appointments' AND column_name = 'date') <> 'text' THEN
+        RETURN;
+    END IF;
+    PERFORM set_config('lock_timeout', '5s', true);
+    IF NOT EXISTS (SELECT 1 FROM pg_constraint WHERE conname = 'appointments_typed_slot_not_null') THEN
+        ALTER TABLE appointments
+            ADD CONSTRAINT appointments_typed_slot_not_null
+            CHECK (date_value IS NOT NULL AND time_value IS NOT NULL) NOT VALID;
+    END IF;
+END
+$$;
+
+ALTER TABLE appointments VALIDATE CONSTRAINT appointments_typed_slot_not_null;
+
+DO $$
+BEGIN
+    IF EXISTS (
+        SELECT 1
+        FROM pg_index i
+        JOIN pg_class c ON c.oid = i.indexrelid
+        WHERE c.relname IN ('appointments_active_slot_unique',
+                            'appointments_doctor_date_time_idx',
+                            'appointments_email_date_idx')
+        HAVING COUNT(*) FILTER (WHERE i.indisvalid) < 3
+    ) THEN
+        RAISE EXCEPTION 'appointments indexes on the typed columns are missing or invalid; re-run migrations';
+    END IF;
+
+    PERFORM set_config('lock_timeout', '5s', true);
+    LOCK TABLE appointments IN ACCESS EXCLUSIVE MODE;
+
+    ALTER TABLE appointments
+        ALTER COLUMN date_value SET NOT NULL,
+        ALTER COLUMN time_value SET NOT NULL;
+    ALTER TABLE appointments DROP CONSTRAINT appointments_typed_slot_not_null;
+    DROP TRIGGER appointments_sync_typed_slot ON appointments;
+
+    -- Drops appointments_active_slot_unique_text along with the columns.
+    ALTER TABLE appointments DROP COLUMN date, DROP COLUMN time;
+    ALTER TABLE appointments RENAME COLUMN date_value TO date;
+    ALTER TABLE appointments RENAME COLUMN time_value TO time;
+
+    DROP FUNCTION appointments_sync_typed_slot();
+    DROP FUNCTION appointments_slot_date(TEXT);
+    DROP FUNCTION appointments_slot_time(TEXT);
+
+    INSERT INTO schema_migrations (version) VALUES ('010_appointments_typed_date_time.sql')
+    ON CONFLICT (version) DO NOTHING;
+END
+$$;
@@ -0,0 +1,44 @@
+-- Weekly schedules set through PUT /api/doctors/<id>/availability. A row in
+-- doctor_weekly_schedules means the doctor has an explicit schedule (possibly
+-- with no windows at all); without one the schedule is derived from the
+-- availability_* columns on doctors.
+CREATE TABLE IF NOT EXISTS doctor_weekly_schedules (
+    doctor_id INTEGER PRIMARY KEY REFERENCES doctors(id) ON DELETE CASCADE,
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+CREATE TABLE IF NOT EXISTS doctor_weekly_windows (
+    doctor_id INTEGER NOT NULL REFERENCES doctor_weekly_schedules(doctor_id) ON DELETE CASCADE,
+    day TEXT NOT NULL CHECK (day IN ('mon', 'tue', 'wed', 'thu', 'fri', 'sat', 'sun')),
+    start_time TIME NOT NULL,
+    end_time TIME NOT NULL,
+    CHECK (start_time < end_time),
+    PRIMARY KEY (doctor_id, day, start_time)
+);
+
+-- Every worker caches schedules in memory and LISTENs on this channel; the
+-- payload is the doctor id whose schedule (or active flag) changed.
+CREATE OR REPLACE FUNCTION notify_doctor_availability() RETURNS trigger AS $$
+DECLARE
+    changed_id INTEGER;
+BEGIN
+    IF TG_TABLE_NAME = 'doctors' THEN
+        changed_id := COALESCE(NEW.id, OLD.id);
+    ELSE
+        changed_id := COALESCE(NEW.doctor_id, OLD.doctor_id);
+    END IF;
+    PERFORM pg_notify('doctor_availability', changed_id::text);
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS doctors_notify_availability ON doctors;
+CREATE TRIGGER doctors_notify_availability
+AFTER INSERT OR DELETE OR UPDATE OF availability_days, availability_start, availability_end, is_active
+ON doctors
+FOR EACH ROW EXECUTE FUNCTION notify_doctor_availability();
+
+DROP TRIGGER IF EXISTS doctor_weekly_schedules_notify ON doctor_weekly_schedules;
+CREATE TRIGGER doctor_weekly_schedules_notify
+AFTER INSERT OR UPDATE OR DELETE ON doctor_weekly_schedules
+FOR EACH ROW EXECUTE FUNCTION notify_doctor_availability();
@@ -0,0 +1,23 @@
+-- Date-specific changes to the weekly schedule. "leave" and "holiday" close
+-- time, "extra" opens an additional session. A row without times covers the
+-- whole day; a row without a doctor is clinic-wide (public holidays).
+CREATE TABLE IF NOT EXISTS doctor_availability_exceptions (
+    id SERIAL PRIMARY KEY,
+    doctor_id INTEGER REFERENCES doctors(id) ON DELETE CASCADE,
+    date DATE NOT NULL,
+    kind TEXT NOT NULL CHECK (kind IN ('leave', 'holiday', 'extra')),
+    start_time TIME,
+    end_time TIME,
+    note TEXT,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    CHECK ((start_time IS NULL) = (end_time IS NULL)),
+    CHECK (start_time IS NULL OR start_time < end_time),
+    CHECK (kind <> 'extra' OR start_time IS NOT NULL)
+);
+
+CREATE INDEX IF NOT EXISTS doctor_availability_exceptions_doctor_date_idx
+ON doctor_availability_exceptions (doctor_id, date);
+
+CREATE INDEX IF NOT EXISTS doctor_availability_exceptions_clinic_date_idx
+ON doctor_availability_exceptions (date)
+WHERE doctor_id IS NULL;
@@ -0,0 +1,30 @@
+-- Outgoing SMS are written here in the same transaction as the change that
+-- triggers them and sent by the dispatcher (python -m app.sms_dispatcher).
+-- A row in 'sending' whose lease (locked_until) has expired belongs to a
+-- dispatcher that died mid-batch and is claimed again.
+CREATE TABLE IF NOT EXISTS sms_outbox (
+    id BIGSERIAL PRIMARY KEY,
+    to_phone TEXT NOT NULL,
+    body TEXT NOT NULL,
+    template_key TEXT NOT NULL,
+    appointment_id INTEGER,
+    doctor_id INTEGER,
+    status TEXT NOT NULL DEFAULT 'pending'
+        CHECK (status IN ('pending', 'sending', 'sent', 'failed')),
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL DEFAULT 5,
+    next_attempt_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    locked_until TIMESTAMPTZ,
+    provider_sid TEXT,
+    last_error TEXT,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    sent_at TIMESTAMPTZ
+);
+
+CREATE INDEX IF NOT EXISTS sms_outbox_pending_idx
+ON sms_outbox (next_attempt_at, id)
+WHERE status = 'pending';
+
+CREATE INDEX IF NOT EXISTS sms_outbox_sending_idx
+ON sms_outbox (locked_until)
+WHERE status = 'sending';
@@ -0,0 +1,36 @@
+-- migrate: no-transaction
+-- The daily reminder job reads one day of active appointments and checks
+-- each against earlier reminders in sms_outbox and doctor_notify_logs.
+-- Built CONCURRENTLY (outside a transaction, see apply_migrations) so
+-- bookings keep being written while the indexes build.
+
+-- A failed CONCURRENTLY build leaves an invalid index behind; drop it so the
+-- IF NOT EXISTS below builds it again instead of skipping it.
+DO $$
+DECLARE
+    name TEXT;
+BEGIN
+    FOR name IN
+        SELECT c.relname
+        FROM pg_index i
+        JOIN pg_class c ON c.oid = i.indexrelid
+        WHERE c.relname IN ('appointments_active_date_idx',
+                            'sms_outbox_appointment_template_idx',
+                            'doctor_notify_logs_appointment_template_idx')
+          AND NOT i.indisvalid
+    LOOP
+        EXECUTE format('DROP INDEX %I', name);
+    END LOOP;
+END
+$$;
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS appointments_active_date_idx
+ON appointments (date, time)
+WHERE LOWER(status) <> 'cancelled';
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS sms_outbox_appointment_template_idx
+ON sms_outbox (appointment_id, template_key)
+WHERE appointment_id IS NOT NULL;
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS doctor_notify_logs_appointment_template_idx
+ON doctor_notify_logs (appointment_id, template_key);
@@ -0,0 +1,13 @@
+-- Workers cache the serialized public doctor directory and LISTEN on this
+-- channel; any change to a doctors row (profile, avatar, status) drops it.
+CREATE OR REPLACE FUNCTION notify_doctor_directory() RETURNS trigger AS $$
+BEGIN
+    PERFORM pg_notify('doctor_directory', COALESCE(NEW.id, OLD.id)::text);
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS doctors_notify_directory ON doctors;
+CREATE TRIGGER doctors_notify_directory
+AFTER INSERT OR UPDATE OR DELETE ON doctors
+FOR EACH ROW EXECUTE FUNCTION notify_doctor_directory();
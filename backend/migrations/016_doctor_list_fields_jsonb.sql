@@ -0,0 +1,75 @@
+-- availability_days, experience, certifications and specialisations were
+-- TEXT holding a JSON array (or, for the profile fields, free text), parsed
+-- on every read. Store them as JSONB arrays of trimmed, non-empty strings,
+-- cleaned up the way the old readers interpreted them:
+--   * valid JSON array -> its non-empty items as strings (days lower-cased)
+--   * empty / NULL     -> []
+--   * anything else    -> [the trimmed text] for profile fields, [] for days
+CREATE OR REPLACE FUNCTION pg_temp.mc_text_to_list(raw TEXT, is_days BOOLEAN) RETURNS JSONB AS $$
+DECLARE
+    parsed JSONB;
+BEGIN
+    IF raw IS NULL OR btrim(raw) = '' THEN
+        RETURN '[]'::jsonb;
+    END IF;
+    BEGIN
+        parsed := raw::jsonb;
+    EXCEPTION WHEN others THEN
+        parsed := NULL;
+    END;
+    IF parsed IS NULL OR jsonb_typeof(parsed) <> 'array' THEN
+        IF is_days THEN
+            RETURN '[]'::jsonb;
+        END IF;
+        RETURN jsonb_build_array(btrim(raw));
+    END IF;
+    RETURN COALESCE((
+        SELECT jsonb_agg(CASE WHEN is_days THEN lower(item) ELSE item END ORDER BY ord)
+        FROM (
+            SELECT btrim(CASE WHEN jsonb_typeof(e) = 'string' THEN e #>> '{}' ELSE e::text END) AS item, ord
+            FROM jsonb_array_elements(parsed) WITH ORDINALITY AS t(e, ord)
+        ) items
+        WHERE item <> ''
+    ), '[]'::jsonb);
+END
+$$ LANGUAGE plpgsql;
+
+-- The availability trigger lists availability_days, which blocks a type change.
+DROP TRIGGER IF EXISTS doctors_notify_availability ON doctors;
+
+ALTER TABLE doctors
+    ALTER COLUMN availability_days DROP DEFAULT,
+    ALTER COLUMN availability_days TYPE JSONB USING pg_temp.mc_text_to_list(availability_days, TRUE),
+    ALTER COLUMN availability_days SET DEFAULT '[]'::jsonb,
+    ALTER COLUMN experience TYPE JSONB USING pg_temp.mc_text_to_list(experience, FALSE),
+    ALTER COLUMN certifications TYPE JSONB USING pg_temp.mc_text_to_list(certifications, FALSE),
+    ALTER COLUMN specialisations TYPE JSONB USING pg_temp.mc_text_to_list(specialisations, FALSE);
+
+ALTER TABLE doctors
+    ALTER COLUMN experience SET DEFAULT '[]'::jsonb,
+    ALTER COLUMN experience SET NOT NULL,
+    ALTER COLUMN certifications SET DEFAULT '[]'::jsonb,
+    ALTER COLUMN certifications SET NOT NULL,
+    ALTER COLUMN specialisations SET DEFAULT '[]'::jsonb,
+    ALTER COLUMN specialisations SET NOT NULL;
+
+ALTER TABLE doctors DROP CONSTRAINT IF EXISTS doctors_list_fields_are_arrays;
+ALTER TABLE doctors ADD CONSTRAINT doctors_list_fields_are_arrays CHECK (
+    jsonb_typeof(availability_days) = 'array'
+    AND jsonb_typeof(experience) = 'array'
+    AND jsonb_typeof(certifications) = 'array'
+    AND jsonb_typeof(specialisations) = 'array'
+);
+
+CREATE TRIGGER doctors_notify_availability
+AFTER INSERT OR DELETE OR UPDATE OF availability_days, availability_start, availability_end, is_active
+ON doctors
+FOR EACH ROW EXECUTE FUNCTION notify_doctor_availability();
+
+-- Containment lookups such as availability_days @> '["mon"]' or
+-- specialisations @> '["Paediatrics"]'.
+CREATE INDEX IF NOT EXISTS doctors_availability_days_gin
+ON doctors USING GIN (availability_days jsonb_path_ops);
+
+CREATE INDEX IF NOT EXISTS doctors_specialisations_gin
+ON doctors USING GIN (specialisations jsonb_path_ops);
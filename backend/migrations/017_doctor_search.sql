@@ -0,0 +1,31 @@
+-- GET /api/doctors/search: a maintained full-text vector over the public
+-- profile, weighted name > specialty/specialisations > bio.
+ALTER TABLE doctors ADD COLUMN IF NOT EXISTS search_vector TSVECTOR
+GENERATED ALWAYS AS (
+    setweight(to_tsvector('english', COALESCE(full_name, '')), 'A')
+    || setweight(to_tsvector('english', COALESCE(specialty, '')), 'B')
+    || setweight(to_tsvector('english', specialisations::text), 'B')
+    || setweight(to_tsvector('english', COALESCE(bio, '')), 'C')
+) STORED;
+
+CREATE INDEX IF NOT EXISTS doctors_search_vector_idx
+ON doctors USING GIN (search_vector)
+WHERE is_active = TRUE;
+
+-- Typo tolerance on names and specialties needs pg_trgm. Not every server
+-- ships it; search falls back to full-text only when it is missing.
+DO $$
+BEGIN
+    BEGIN
+        CREATE EXTENSION IF NOT EXISTS pg_trgm;
+    EXCEPTION WHEN others THEN
+        RAISE NOTICE 'pg_trgm unavailable (%); doctor search will not be typo tolerant', SQLERRM;
+        RETURN;
+    END;
+    EXECUTE $sql$
+        CREATE INDEX IF NOT EXISTS doctors_search_trgm_idx
+        ON doctors USING GIN ((full_name || ' ' || specialty) gin_trgm_ops)
+        WHERE is_active = TRUE
+    $sql$;
+END
+$$;
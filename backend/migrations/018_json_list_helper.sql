@@ -0,0 +1,24 @@
+-- List endpoints build their JSON in SQL. quote_requests.service_categories
+-- is TEXT holding a JSON array; read it the way the Python code did: a
+-- valid array gives its items as strings, anything else an empty list.
+CREATE OR REPLACE FUNCTION json_text_list(raw TEXT) RETURNS JSONB AS $$
+DECLARE
+    parsed JSONB;
+BEGIN
+    IF raw IS NULL THEN
+        RETURN '[]'::jsonb;
+    END IF;
+    BEGIN
+        parsed := raw::jsonb;
+    EXCEPTION WHEN others THEN
+        RETURN '[]'::jsonb;
+    END;
+    IF jsonb_typeof(parsed) <> 'array' THEN
+        RETURN '[]'::jsonb;
+    END IF;
+    RETURN COALESCE((
+        SELECT jsonb_agg(CASE WHEN jsonb_typeof(e) = 'string' THEN e #>> '{}' ELSE e::text END ORDER BY ord)
+        FROM jsonb_array_elements(parsed) WITH ORDINALITY AS t(e, ord)
+    ), '[]'::jsonb);
+END
+$$ LANGUAGE plpgsql IMMUTABLE;
@@ -22,6 +22,18 @@
     }, ms);
   }
 
+  // Public catalogue responses carry ETags: let the browser keep them and
+  // revalidate (a 304 instead of the full body) rather than bypass its cache.
+  const REVALIDATE_PATHS = [
+    /^\/api\/doctors(\/\d+(\/availability)?)?(\?|$)/,
+    /^\/api\/lab-packages(\?|$)/,
+  ];
+
+  function defaultCacheMode(path, method) {
+    if (String(method || "GET").toUpperCase() !== "GET") return "no-store";
+    return REVALIDATE_PATHS.some((re) => re.test(path)) ? "no-cache" : "no-store";
+  }
+
   async function apiFetch(path, opts = {}) {
     if (!API_BASE) {
       const err = new Error("API base URL is not configured.");
@@ -48,7 +60,7 @@
         headers,
         signal: controller.signal,
         credentials: opts.credentials ?? "include",
-        cache: opts.cache ?? "no-store",
+        cache: opts.cache ?? defaultCacheMode(path, opts.method),
       });
     } finally {
       if (timer) clearTimeout(timer);
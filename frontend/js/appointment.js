@@ -411,23 +411,30 @@
     return null;
   }
 
-  async function fetchBookedSlots(doctorId, dateStr) {
-    if (!doctorId || !dateStr) return [];
+  function cleanTimes(items) {
+    return Array.isArray(items) ? items.map((t) => String(t || "").trim()).filter(Boolean) : null;
+  }
+
+  // Returns { booked, slots, free }; slots/free are null when the backend
+  // does not compile day availability (then the weekly windows are used).
+  async function fetchDaySlots(doctorId, dateStr) {
+    const empty = { booked: [], slots: null, free: null };
+    if (!doctorId || !dateStr) return empty;
     try {
       const res = await apiFetch(
         `/api/appointments/slots?doctor_id=${encodeURIComponent(doctorId)}&date=${encodeURIComponent(dateStr)}`,
         { method: "GET" }
       );
-      if (!res.ok) return [];
+      if (!res.ok) return empty;
       const data = await res.json().catch(() => null);
-      const items = Array.isArray(data?.data?.booked)
-        ? data.data.booked
-        : Array.isArray(data?.booked)
-        ? data.booked
-        : [];
-      return items.map((t) => String(t || "").trim()).filter(Boolean);
+      const payload = data?.data ?? data ?? {};
+      return {
+        booked: cleanTimes(payload.booked) || [],
+        slots: cleanTimes(payload.slots),
+        free: cleanTimes(payload.free),
+      };
     } catch (e) {}
-    return [];
+    return empty;
   }
 
   function resetTimeOptions() {
@@ -448,12 +455,18 @@
 
     if (!dateStr || !doctorId) return;
 
-    const weekly = await fetchWeeklyAvailability(doctorId);
+    const [weekly, day] = await Promise.all([
+      fetchWeeklyAvailability(doctorId),
+      fetchDaySlots(doctorId, dateStr),
+    ]);
     const dayKey = weekdayKey(dateStr);
     const availableDays = availableDaysFromWeekly(weekly);
     if (el.date) el.date.setCustomValidity("");
 
-    if (availableDays && dayKey && !availableDays.includes(dayKey)) {
+    // Day slots from the backend already account for leave, holidays and
+    // extra sessions, so they win over the weekly pattern.
+    const dayClosed = day.slots ? day.slots.length === 0 : availableDays && dayKey && !availableDays.includes(dayKey);
+    if (dayClosed) {
       if (el.date) {
         el.date.setCustomValidity(t("appt_doctor_unavailable_day", "Doctor is not available on this day."));
         el.date.reportValidity();
@@ -468,10 +481,11 @@
         ? []
         : DEFAULT_WINDOWS;
 
-    const slots = buildSlotsFromWindows(windows);
+    const slots = day.slots || buildSlotsFromWindows(windows);
     if (!slots.length) return;
 
-    const booked = new Set(await fetchBookedSlots(doctorId, dateStr));
+    const booked = new Set(day.booked);
+    const free = day.free ? new Set(day.free) : null;
     const now = new Date();
     const isToday = dateStr === todayISO();
     const nowMinutes = now.getHours() * 60 + now.getMinutes();
@@ -483,7 +497,7 @@
 
       const slotMinutes = timeToMinutes(slot);
       const isPastTime = isToday && slotMinutes <= nowMinutes;
-      const isBooked = booked.has(slot);
+      const isBooked = free ? !free.has(slot) : booked.has(slot);
       if (isPastTime || isBooked) opt.disabled = true;
 
       el.time.appendChild(opt);
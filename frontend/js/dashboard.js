@@ -226,6 +226,9 @@
       error: root.querySelector('[data-role="error"]'),
       tableWrap: root.querySelector('[data-role="table"]'),
       tbody: root.querySelector('[data-role="tbody"]'),
+      more: root.querySelector('[data-role="more"]'),
+      moreNote: root.querySelector('[data-role="more-note"]'),
+      moreBtn: root.querySelector('[data-role="more-btn"]'),
     };
   }
 
@@ -235,6 +238,7 @@
     hide(section.error);
     hide(section.empty);
     hide(section.tableWrap);
+    hide(section.more);
     if (section.tbody) section.tbody.innerHTML = "";
   }
 
@@ -268,6 +272,22 @@
     show(section.tableWrap);
   }
 
+  // Shown while the API has more pages (next_cursor); pages are only
+  // fetched when asked for.
+  function setSectionMore(section, loaded, total, hasMore) {
+    if (!section?.more) return;
+    if (!hasMore) {
+      hide(section.more);
+      return;
+    }
+    if (section.moreNote) {
+      const showing = t("dashboard_showing", "Showing");
+      section.moreNote.textContent = total != null ? `${showing} ${loaded} / ${total}` : `${showing} ${loaded}`;
+    }
+    if (section.moreBtn) section.moreBtn.disabled = false;
+    show(section.more);
+  }
+
   function buildKvRows(rows) {
     return `
       <div class="mc-kv">
@@ -309,6 +329,10 @@
             <tbody data-role="tbody"></tbody>
           </table>
         </div>
+        <div class="dash-more hidden" data-role="more">
+          <span class="dash-more__note" data-role="more-note"></span>
+          <button type="button" class="btn ghost" data-role="more-btn">${t("dashboard_load_more", "Load more")}</button>
+        </div>
       </section>
 
       <section class="dash-section" id="patient-reports">
@@ -336,6 +360,7 @@
 
     const apptSection = sectionEls(document.getElementById("patient-appointments"));
     const repSection = sectionEls(document.getElementById("patient-reports"));
+    const apptPages = { items: [], sourceUrl: null, cursor: null, total: null };
 
     async function cancelAppointment(apptId) {
       const ok = window.confirm(t("confirm_cancel_appt", "Cancel this appointment?"));
@@ -487,11 +512,16 @@
       candidates.push(`/api/appointments`);
 
       let payload = null;
+      let sourceUrl = null;
       for (const url of candidates) {
-        const res = await apiFetch(url, { method: "GET" });
+        const sep = url.includes("?") ? "&" : "?";
+        const res = await apiFetch(`${url}${sep}include_total=1`, { method: "GET" });
         if (!res.ok) continue;
         payload = await res.json().catch(() => null);
-        if (payload) break;
+        if (payload) {
+          sourceUrl = url;
+          break;
+        }
       }
 
       if (!payload) {
@@ -500,7 +530,37 @@
       }
 
       const items = payload?.data?.items || payload?.items || payload?.data || payload || [];
-      renderAppointments(items, role);
+      apptPages.items = Array.isArray(items) ? items : [];
+      apptPages.sourceUrl = sourceUrl;
+      apptPages.cursor = payload?.data?.next_cursor || null;
+      apptPages.total = payload?.data?.total ?? null;
+      renderAppointments(apptPages.items, role);
+      setSectionMore(apptSection, apptPages.items.length, apptPages.total, !!apptPages.cursor);
+    }
+
+    // Next page from the endpoint the first page came from.
+    async function loadMoreAppointments() {
+      if (!apptPages.cursor || !apptPages.sourceUrl) return;
+      if (apptSection?.moreBtn) apptSection.moreBtn.disabled = true;
+
+      const sep = apptPages.sourceUrl.includes("?") ? "&" : "?";
+      const res = await apiFetch(
+        `${apptPages.sourceUrl}${sep}cursor=${encodeURIComponent(apptPages.cursor)}`,
+        { method: "GET" }
+      );
+      const next = res.ok ? await res.json().catch(() => null) : null;
+      if (!next) {
+        if (apptSection?.moreNote) {
+          apptSection.moreNote.textContent = t("dashboard_load_appointments_error", "Unable to load appointments.");
+        }
+        if (apptSection?.moreBtn) apptSection.moreBtn.disabled = false;
+        return;
+      }
+
+      apptPages.items = apptPages.items.concat(next?.data?.items || []);
+      apptPages.cursor = next?.data?.next_cursor || null;
+      renderAppointments(apptPages.items, normRole(user.role));
+      setSectionMore(apptSection, apptPages.items.length, apptPages.total, !!apptPages.cursor);
     }
 
     async function loadReports() {
@@ -572,6 +632,10 @@
       }
     });
 
+    if (apptSection?.moreBtn) {
+      apptSection.moreBtn.addEventListener("click", () => loadMoreAppointments());
+    }
+
     loadAppointments();
     loadReports();
   }
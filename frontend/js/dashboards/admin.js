@@ -39,6 +39,9 @@
       error: root.querySelector('[data-role="error"]'),
       tableWrap: root.querySelector('[data-role="table"]'),
       tbody: root.querySelector('[data-role="tbody"]'),
+      more: root.querySelector('[data-role="more"]'),
+      moreNote: root.querySelector('[data-role="more-note"]'),
+      moreBtn: root.querySelector('[data-role="more-btn"]'),
     };
   }
 
@@ -48,6 +51,7 @@
     hide(section.error);
     hide(section.empty);
     hide(section.tableWrap);
+    hide(section.more);
     if (section.tbody) section.tbody.innerHTML = "";
   }
 
@@ -81,6 +85,21 @@
     show(section.tableWrap);
   }
 
+  // Shown while the API has more pages (next_cursor); pages are only
+  // fetched when asked for.
+  function setSectionMore(section, loaded, total, hasMore) {
+    if (!section?.more) return;
+    if (!hasMore) {
+      hide(section.more);
+      return;
+    }
+    if (section.moreNote) section.moreNote.textContent = total != null
+      ? `Showing ${loaded} of ${total}. Filters apply to loaded rows.`
+      : `Showing ${loaded}. Filters apply to loaded rows.`;
+    if (section.moreBtn) section.moreBtn.disabled = false;
+    show(section.more);
+  }
+
   function buildKvRows(rows) {
     return `
       <div class="mc-kv">
@@ -188,6 +207,10 @@
             <tbody data-role="tbody"></tbody>
           </table>
         </div>
+        <div class="dash-more hidden" data-role="more">
+          <span class="dash-more__note" data-role="more-note"></span>
+          <button type="button" class="btn ghost" data-role="more-btn">Load more</button>
+        </div>
       </section>
     `;
 
@@ -207,6 +230,8 @@
     const state = {
       doctors: [],
       appointments: [],
+      apptCursor: null,
+      apptTotal: null,
       apptMap: new Map(),
     };
 
@@ -548,20 +573,37 @@
       renderAppointments(items);
     }
 
-    async function loadAppointments() {
-      setSectionLoading(apptSection);
+    // One page at a time; "Load more" follows next_cursor.
+    async function loadAppointments(append = false) {
+      const cursor = append ? state.apptCursor : null;
+      if (append && !cursor) return;
+      if (append) {
+        if (apptSection?.moreBtn) apptSection.moreBtn.disabled = true;
+      } else {
+        setSectionLoading(apptSection);
+      }
 
-      const res = await apiFetch("/api/appointments", { method: "GET" });
+      const qs = cursor ? `?cursor=${encodeURIComponent(cursor)}` : "?include_total=1";
+      const res = await apiFetch(`/api/appointments${qs}`, { method: "GET" });
       if (!res.ok) {
-        setSectionError(apptSection, "Unable to load appointments.");
+        if (append) {
+          if (apptSection?.moreNote) apptSection.moreNote.textContent = "Unable to load more appointments.";
+          if (apptSection?.moreBtn) apptSection.moreBtn.disabled = false;
+        } else {
+          setSectionError(apptSection, "Unable to load appointments.");
+        }
         return;
       }
 
       const payload = await res.json().catch(() => null);
-      const items = payload?.data?.items || payload?.items || payload?.data || [];
+      const page = payload?.data?.items || payload?.items || payload?.data || [];
+      const items = Array.isArray(page) ? page : [];
 
-      state.appointments = Array.isArray(items) ? items : [];
+      state.appointments = append ? state.appointments.concat(items) : items;
+      state.apptCursor = payload?.data?.next_cursor || null;
+      if (!append) state.apptTotal = payload?.data?.total ?? null;
       applyFilters();
+      setSectionMore(apptSection, state.appointments.length, state.apptTotal, !!state.apptCursor);
     }
 
     function downloadAppointmentsCsv() {
@@ -871,6 +913,10 @@
       });
     }
 
+    if (apptSection?.moreBtn) {
+      apptSection.moreBtn.addEventListener("click", () => loadAppointments(true));
+    }
+
     if (apptExport) {
       apptExport.addEventListener("click", (e) => {
         e.preventDefault();
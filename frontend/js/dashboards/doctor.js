@@ -30,6 +30,9 @@
       error: root.querySelector('[data-role="error"]'),
       tableWrap: root.querySelector('[data-role="table"]'),
       tbody: root.querySelector('[data-role="tbody"]'),
+      more: root.querySelector('[data-role="more"]'),
+      moreNote: root.querySelector('[data-role="more-note"]'),
+      moreBtn: root.querySelector('[data-role="more-btn"]'),
     };
   }
 
@@ -39,6 +42,7 @@
     hide(section.error);
     hide(section.empty);
     hide(section.tableWrap);
+    hide(section.more);
     if (section.tbody) section.tbody.innerHTML = "";
   }
 
@@ -72,6 +76,19 @@
     show(section.tableWrap);
   }
 
+  // Shown while the API has more pages (next_cursor); pages are only
+  // fetched when asked for.
+  function setSectionMore(section, loaded, total, hasMore) {
+    if (!section?.more) return;
+    if (!hasMore) {
+      hide(section.more);
+      return;
+    }
+    if (section.moreNote) section.moreNote.textContent = total != null ? `Showing ${loaded} of ${total}.` : `Showing ${loaded}.`;
+    if (section.moreBtn) section.moreBtn.disabled = false;
+    show(section.more);
+  }
+
   function listToText(items) {
     if (!Array.isArray(items)) return "";
     return items.map((v) => String(v || "").trim()).filter(Boolean).join("\n");
@@ -258,6 +275,10 @@
             <tbody data-role="tbody"></tbody>
           </table>
         </div>
+        <div class="dash-more hidden" data-role="more">
+          <span class="dash-more__note" data-role="more-note"></span>
+          <button type="button" class="btn ghost" data-role="more-btn">Load more</button>
+        </div>
       </section>
     `;
 
@@ -564,6 +585,9 @@
 
     const state = {
       range: "today",
+      appointments: [],
+      apptCursor: null,
+      apptTotal: null,
       apptMap: new Map(),
     };
 
@@ -702,26 +726,42 @@
       apptSection.tbody.innerHTML = rows.join("");
     }
 
-    async function loadAppointments() {
+    // One page at a time; "Load more" follows next_cursor.
+    async function loadAppointments(append = false) {
       if (!apptSection) return;
-      setSectionLoading(apptSection);
-
-      const range = apptRange?.value || "today";
-      state.range = range;
+      const cursor = append ? state.apptCursor : null;
+      if (append && !cursor) return;
+      if (append) {
+        if (apptSection.moreBtn) apptSection.moreBtn.disabled = true;
+      } else {
+        setSectionLoading(apptSection);
+        state.range = apptRange?.value || "today";
+      }
 
-      const res = await apiFetch(`/api/doctor/appointments?range=${encodeURIComponent(range)}`, {
+      const qs = cursor ? `&cursor=${encodeURIComponent(cursor)}` : "&include_total=1";
+      const res = await apiFetch(`/api/doctor/appointments?range=${encodeURIComponent(state.range)}${qs}`, {
         method: "GET",
       });
 
       if (!res.ok) {
-        setSectionError(apptSection, "Unable to load appointments.");
+        if (append) {
+          if (apptSection.moreNote) apptSection.moreNote.textContent = "Unable to load more appointments.";
+          if (apptSection.moreBtn) apptSection.moreBtn.disabled = false;
+        } else {
+          setSectionError(apptSection, "Unable to load appointments.");
+        }
         return;
       }
 
       const payload = await res.json().catch(() => null);
-      const items = payload?.data?.items || payload?.items || [];
+      const page = payload?.data?.items || payload?.items || [];
+      const items = Array.isArray(page) ? page : [];
 
-      renderAppointments(items);
+      state.appointments = append ? state.appointments.concat(items) : items;
+      state.apptCursor = payload?.data?.next_cursor || null;
+      if (!append) state.apptTotal = payload?.data?.total ?? null;
+      renderAppointments(state.appointments);
+      setSectionMore(apptSection, state.appointments.length, state.apptTotal, !!state.apptCursor);
     }
 
     function openViewModal(appt) {
@@ -829,7 +869,7 @@
           }
 
           el.closeModal();
-          alert("Notification sent.");
+          alert("Notification queued.");
         });
       }
     }
@@ -892,6 +932,10 @@
       });
     }
 
+    if (apptSection?.moreBtn) {
+      apptSection.moreBtn.addEventListener("click", () => loadAppointments(true));
+    }
+
     loadProfileDetails();
     loadSummary();
     loadAppointments();
@@ -6,6 +6,10 @@ document.addEventListener("DOMContentLoaded", () => {
   if (!listEl || !searchInput || !specialtyFilter) return;
 
   let doctors = [];
+  let searchResults = null;
+  let searchTimer = null;
+  let searchSeq = 0;
+  const SEARCH_DEBOUNCE_MS = 250;
   const DEFAULT_AVATAR = "assets/img/default_avatar.jpg";
   const api = window.MC_API;
   const t = window.MC_I18N?.t || ((_, fallback) => fallback);
@@ -57,6 +61,10 @@ document.addEventListener("DOMContentLoaded", () => {
     const q = normalize(searchInput.value);
     const spec = normalize(specialtyFilter.value);
 
+    if (q && searchResults) {
+      return searchResults.filter(d => !spec || normalize(d.specialty) === spec);
+    }
+
     return doctors.filter(d => {
       const name = normalize(d.full_name);
       const specialty = normalize(d.specialty);
@@ -77,6 +85,8 @@ document.addEventListener("DOMContentLoaded", () => {
     listEl.innerHTML = items.map(d => {
       const id = Number(d.id);
       const name = escapeHtml(d.full_name);
+      // Search highlights come back HTML-escaped with <mark> around matches.
+      const nameHtml = d.highlights?.full_name || name;
       const specialty = escapeHtml(d.specialty);
 
       const bookUrl =
@@ -88,7 +98,7 @@ document.addEventListener("DOMContentLoaded", () => {
       return `
         <article class="doctor-card" data-specialty="${normalize(d.specialty)}">
           <img src="${avatarUrl}" alt="${name}" class="doctor-photo" onerror="this.onerror=null;this.src='${DEFAULT_AVATAR}';">
-          <h3>${name}</h3>
+          <h3>${nameHtml}</h3>
           <p>${specialty}</p>
           <div class="doctor-card__actions">
             <a href="${profileUrl}" class="btn ghost">${t("btn_view_profile", "View Profile")}</a>
@@ -103,6 +113,33 @@ document.addEventListener("DOMContentLoaded", () => {
     render(getFilteredDoctors());
   }
 
+  async function runSearch() {
+    const q = searchInput.value.trim();
+    const seq = ++searchSeq;
+    if (!q) {
+      searchResults = null;
+      refresh();
+      return;
+    }
+    try {
+      const { ok, data } = await api.getJson(`/api/doctors/search?q=${encodeURIComponent(q)}&limit=50`);
+      if (seq !== searchSeq) return;
+      searchResults = ok && Array.isArray(data?.data?.items) ? data.data.items : null;
+    } catch (err) {
+      if (seq !== searchSeq) return;
+      searchResults = null;
+    }
+    refresh();
+  }
+
+  function onSearchInput() {
+    // Filter locally right away, then replace with ranked server results.
+    searchResults = null;
+    refresh();
+    clearTimeout(searchTimer);
+    searchTimer = setTimeout(runSearch, SEARCH_DEBOUNCE_MS);
+  }
+
   async function init() {
     if (!api?.hasBase?.()) {
       listEl.innerHTML = `<p>${t("api_missing", "Service is temporarily unavailable.")}</p>`;
@@ -129,7 +166,7 @@ document.addEventListener("DOMContentLoaded", () => {
     }
   }
 
-  searchInput.addEventListener("input", refresh);
+  searchInput.addEventListener("input", onSearchInput);
   specialtyFilter.addEventListener("change", refresh);
 
   init();